@@ -1,7 +1,10 @@
 import logging
+from django.db.models import Q
 from django.http import JsonResponse
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from account.models import CustomPermission
+from account import permission_engine
+from account.authentication import ScopedJWTAuthentication
+from account.models import CustomPermission, System
+from account.wildcards import PermissionMatcher, WILDCARD
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +18,7 @@ class CustomPermissionMiddleware:
 
     def __init__(self, get_response):
         self.get_response = get_response
-        self.jwt_auth = JWTAuthentication()
+        self.jwt_auth = ScopedJWTAuthentication()
 
     def __call__(self, request):
         system_code = request.headers.get("X-System-Code")
@@ -60,20 +63,25 @@ class CustomPermissionMiddleware:
         )
         return self.get_response(request)
 
-    def check_user_system_permissions(self, user, system_code, permissions, logic="OR"):
+    @staticmethod
+    def check_user_system_permissions(user, system_code, permissions, logic="OR"):
         """
         检查用户在指定系统下是否具备所需权限
         """
+        engine = permission_engine.current()
+        if engine is not None:  # ✅ 位图引擎：一次按位与
+            return engine.system_active(system_code) and engine.check(
+                user.role_uuids(), permissions, logic, system_code=system_code)
+
+        if not System.objects.filter(system_code=system_code, is_deleted=False).exists():
+            return False
         user_perms = CustomPermission.objects.filter(
-            roles__users=user,
+            Q(permission_code__in=permissions) | Q(permission_code__contains=WILDCARD),
+            Q(roles__system__isnull=True) | Q(roles__system__system_code=system_code),
+            roles__in=user.role_uuids(),
             roles__is_enable=True,
-            roles__system__system_code=system_code,
-            permission_code__in=permissions
+            roles__is_deleted=False,
+            is_deleted=False
         ).values_list("permission_code", flat=True).distinct()
 
-        user_perm_set = set(user_perms)
-        required_perm_set = set(permissions)
-
-        if logic == "AND":
-            return required_perm_set.issubset(user_perm_set)
-        return bool(user_perm_set.intersection(required_perm_set))
+        return PermissionMatcher(user_perms).check(permissions, logic)
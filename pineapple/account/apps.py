@@ -4,3 +4,28 @@ from django.apps import AppConfig
 class AccountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'account'
+
+    def ready(self):
+        from . import signals  # noqa
+        from . import authentication  # noqa  注册签名算法检查
+        from . import sharding
+        sharding.connect_signals()
+        sharding.install_reverse_managers()
+        from utensil import archive
+        from .models import (
+            System, Role, CustomPermission, User, SystemArchive, RoleArchive, CustomPermissionArchive, UserArchive
+        )
+        archive.register(System, SystemArchive)
+        archive.register(Role, RoleArchive)
+        archive.register(CustomPermission, CustomPermissionArchive)
+        archive.register(User, UserArchive)
+
+        from utensil import response_cache
+        response_cache.register(System, Role, CustomPermission, User)
+
+        from utensil import write_behind
+        write_behind.register(User, "last_login", db_for_pk=sharding.db_for_pk)
+
+        from utensil import warmup
+        from . import permission_engine
+        warmup.register("permissions", permission_engine.warm)
@@ -1,4 +1,10 @@
+from django.core import checks
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from utensil import request_scope
+
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     """
@@ -7,4 +13,33 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
-        return token
\ No newline at end of file
+        return token
+
+
+class ScopedJWTAuthentication(JWTAuthentication):
+    """
+    同一请求内按用户标识复用同一个 User 实例（身份映射）：
+    权限中间件与 DRF 认证不再各查一次用户，实例上的记忆化结果也随之共享
+    """
+
+    def get_user(self, validated_token):
+        key = ("user", validated_token.get(api_settings.USER_ID_CLAIM))
+        return request_scope.memoize(key, lambda: super(ScopedJWTAuthentication, self).get_user(validated_token))
+
+
+def public_key():
+    """下游服务验签用的 (算法, 公钥)；对称算法（HS*）时返回 None"""
+    if api_settings.ALGORITHM.startswith("HS") or not api_settings.VERIFYING_KEY:
+        return None
+    return api_settings.ALGORITHM, api_settings.VERIFYING_KEY
+
+
+@checks.register(checks.Tags.security)
+def check_signing_algorithm(app_configs=None, **kwargs):
+    if api_settings.ALGORITHM.startswith("HS"):
+        return [checks.Warning(
+            f"JWT 使用对称算法 {api_settings.ALGORITHM}，下游服务本地验签需要持有签名密钥，可自行签发任意 Token",
+            hint="配置 configs/jwt_config.py 中的 RS256 密钥对", id="account.W002")]
+    if not api_settings.VERIFYING_KEY:
+        return [checks.Error("非对称签名算法缺少公钥（SIMPLE_JWT.VERIFYING_KEY）", id="account.E002")]
+    return []
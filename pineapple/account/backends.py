@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from . import hashing
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    与 ModelBackend 行为一致，但密码校验在 account.hashing 线程池中进行；
+    哈希参数过期时单行 UPDATE password，不触发整行 save() 与信号
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()  # noqa
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # ✅ 用户不存在时同样计算一次哈希，避免通过响应时间枚举账号
+            hashing.make_password(password)
+            return None
+        valid, new_encoded = hashing.verify(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if new_encoded:
+            UserModel.all_objects.filter(pk=user.pk).update(password=new_encoded)
+            user.password = new_encoded
+        return user
@@ -28,11 +28,12 @@ class SystemFilter(django_filters.rest_framework.FilterSet):
 class RoleFilter(django_filters.rest_framework.FilterSet):
     role_name = filters.CharFilter(lookup_expr='icontains')
     is_enable = filters.BooleanFilter()
+    system = django_filters.CharFilter(field_name="system__system_code", lookup_expr="exact")
     created_by = django_filters.CharFilter(field_name="created_by__unified_uuid", lookup_expr="exact")
 
     class Meta:
         model = Role
-        fields = ["role_name", "is_enable", "created_by"]
+        fields = ["role_name", "is_enable", "system", "created_by"]
 
 
 class CustomPermissionFilter(django_filters.rest_framework.FilterSet):
@@ -0,0 +1,80 @@
+"""
+密码哈希专用线程池
+
+- PBKDF2 / hashlib 计算期间释放 GIL，线程池即可并行利用多核，且不占用请求线程之外的 CPU 配额
+- 并发度 PASSWORD_HASHING_WORKERS，排队上限 PASSWORD_HASHING_QUEUE；
+  队列满时等待 PASSWORD_HASHING_TIMEOUT 秒仍无空位则返回 429（背压，避免登录洪峰拖垮整个服务）
+- 校验通过且哈希参数过期（迭代次数 / 算法变化）时在池内顺带重新哈希，由调用方单行 UPDATE 写回
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework.exceptions import Throttled
+
+WORKERS = getattr(settings, "PASSWORD_HASHING_WORKERS", None) or os.cpu_count() or 1
+QUEUE = getattr(settings, "PASSWORD_HASHING_QUEUE", WORKERS * 8)
+TIMEOUT = getattr(settings, "PASSWORD_HASHING_TIMEOUT", 2)
+
+
+class TunedPBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    迭代次数可配置的 PBKDF2（算法名与默认实现一致，旧哈希可直接校验）
+    - PASSWORD_HASH_ITERATIONS 只能在 Django 默认值之上调高，低于默认值时按默认值
+    - 库存哈希迭代次数低于当前值时 must_update 为真，登录时透明升级；更高的哈希保持不变（不降级）
+    """
+    iterations = max(getattr(settings, "PASSWORD_HASH_ITERATIONS", None) or 0, hashers.PBKDF2PasswordHasher.iterations)
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return decoded["iterations"] < self.iterations or hashers.must_update_salt(decoded["salt"], self.salt_entropy)
+
+
+class HashingPool:
+    def __init__(self, workers, queue, timeout):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._executor = None
+        self._pid = None
+        self._workers = workers
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._pid != os.getpid():  # fork 后线程不会被继承，按进程重建
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix="password-hash")
+                    self._pid = os.getpid()
+        return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise Throttled(detail="登录请求过多，请稍后再试")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+pool = HashingPool(WORKERS, QUEUE, TIMEOUT)
+
+
+def _verify(password, encoded):
+    rehash = []
+    valid = hashers.check_password(password, encoded, setter=rehash.append)
+    return valid, hashers.make_password(password) if valid and rehash else None
+
+
+def make_password(password):
+    """在线程池中计算哈希"""
+    return pool.run(hashers.make_password, password)
+
+
+def verify(password, encoded):
+    """在线程池中校验密码，返回 (是否通过, 需要写回的新哈希或 None)"""
+    return pool.run(_verify, password, encoded)
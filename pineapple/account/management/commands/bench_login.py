@@ -0,0 +1,43 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand, CommandError
+
+from account import hashing
+
+
+class Command(BaseCommand):
+    help = "测量密码校验吞吐（次/秒，及每核次/秒），用于调整 PASSWORD_HASH_ITERATIONS 与哈希线程池大小"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=200, help="校验次数")
+        parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1, help="并发请求数")
+        parser.add_argument("--iterations", type=int, action="append", default=[],
+                            help="对比的 PBKDF2 迭代次数（可多次指定，默认使用当前哈希器）")
+
+    def handle(self, *args, **options):
+        cores = min(options["concurrency"], hashing.WORKERS, os.cpu_count() or 1)
+        for iterations in options["iterations"] or [None]:
+            hasher = hashing.TunedPBKDF2PasswordHasher()
+            if iterations:
+                hasher.iterations = iterations
+            encoded = hasher.encode("bench-password", hasher.salt())
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options["concurrency"]) as clients:
+                results = list(clients.map(
+                    lambda _: hashing.pool.run(hashers.check_password, "bench-password", encoded),
+                    range(options["count"])
+                ))
+            elapsed = time.perf_counter() - started
+            failures = results.count(False)
+            if failures:
+                raise CommandError(f"iterations={hasher.iterations}: {failures}/{options['count']} 次密码校验失败")
+
+            rate = options["count"] / elapsed
+            self.stdout.write(
+                f"iterations={hasher.iterations}: {rate:.1f} 次/秒，{rate / cores:.1f} 次/秒/核 "
+                f"（{cores} 核，单次 {elapsed / options['count'] * cores * 1000:.1f} ms）"
+            )
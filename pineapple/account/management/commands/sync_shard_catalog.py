@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account import sharding
+
+
+class Command(BaseCommand):
+    help = "把默认库中的系统 / 角色 / 权限（含角色权限关联）全量复制到各用户分片"
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError("未配置 ACCOUNT_USER_SHARDS")
+        for label, count in sharding.sync_catalog().items():
+            self.stdout.write(f"{label}: 复制 {count} 行")
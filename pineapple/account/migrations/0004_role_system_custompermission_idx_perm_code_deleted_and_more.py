@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_alter_custompermission_is_deleted_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='role',
+            name='system',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='roles', to='account.system', verbose_name='所属系统'),
+        ),
+        migrations.AddIndex(
+            model_name='custompermission',
+            index=models.Index(fields=['permission_code', 'is_deleted'], name='idx_perm_code_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='role',
+            index=models.Index(fields=['system', 'is_enable', 'is_deleted'], name='idx_role_system_enable'),
+        ),
+    ]
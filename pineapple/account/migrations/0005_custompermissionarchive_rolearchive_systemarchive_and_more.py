@@ -0,0 +1,66 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_role_system_custompermission_idx_perm_code_deleted_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomPermissionArchive',
+            fields=[
+                ('uuid', models.CharField(max_length=25, primary_key=True, serialize=False, verbose_name='原主键')),
+                ('unified_uuid', models.CharField(db_index=True, max_length=25, verbose_name='统一UUID标识')),
+                ('payload', models.JSONField(verbose_name='归档数据')),
+                ('deleted_at', models.DateTimeField(blank=True, null=True, verbose_name='删除时间')),
+                ('archived_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='归档时间')),
+            ],
+            options={
+                'db_table': 'account_custompermission_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='RoleArchive',
+            fields=[
+                ('uuid', models.CharField(max_length=25, primary_key=True, serialize=False, verbose_name='原主键')),
+                ('unified_uuid', models.CharField(db_index=True, max_length=25, verbose_name='统一UUID标识')),
+                ('payload', models.JSONField(verbose_name='归档数据')),
+                ('deleted_at', models.DateTimeField(blank=True, null=True, verbose_name='删除时间')),
+                ('archived_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='归档时间')),
+            ],
+            options={
+                'db_table': 'account_role_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='SystemArchive',
+            fields=[
+                ('uuid', models.CharField(max_length=25, primary_key=True, serialize=False, verbose_name='原主键')),
+                ('unified_uuid', models.CharField(db_index=True, max_length=25, verbose_name='统一UUID标识')),
+                ('payload', models.JSONField(verbose_name='归档数据')),
+                ('deleted_at', models.DateTimeField(blank=True, null=True, verbose_name='删除时间')),
+                ('archived_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='归档时间')),
+            ],
+            options={
+                'db_table': 'account_system_archive',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserArchive',
+            fields=[
+                ('uuid', models.CharField(max_length=25, primary_key=True, serialize=False, verbose_name='原主键')),
+                ('unified_uuid', models.CharField(db_index=True, max_length=25, verbose_name='统一UUID标识')),
+                ('payload', models.JSONField(verbose_name='归档数据')),
+                ('deleted_at', models.DateTimeField(blank=True, null=True, verbose_name='删除时间')),
+                ('archived_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='归档时间')),
+            ],
+            options={
+                'db_table': 'account_user_archive',
+            },
+        ),
+    ]
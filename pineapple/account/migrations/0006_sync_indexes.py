@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:28
+
+from django.db import migrations, models
+
+from utensil.online_migrations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+    atomic = False  # ✅ 在线建索引（大表 account_user 等不阻塞读写）
+
+    dependencies = [
+        ('account', '0005_custompermissionarchive_rolearchive_systemarchive_and_more'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='custompermission',
+            index=models.Index(fields=['update_at', 'uuid'], name='idx_perm_sync'),
+        ),
+        AddIndexOnline(
+            model_name='role',
+            index=models.Index(fields=['update_at', 'uuid'], name='idx_role_sync'),
+        ),
+        AddIndexOnline(
+            model_name='system',
+            index=models.Index(fields=['update_at', 'uuid'], name='idx_system_sync'),
+        ),
+        AddIndexOnline(
+            model_name='user',
+            index=models.Index(fields=['update_at', 'uuid'], name='idx_user_sync'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_sync_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserLookup',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False, verbose_name='字段:值')),
+                ('unified_uuid', models.CharField(db_index=True, max_length=25, verbose_name='统一UUID标识')),
+                ('shard', models.CharField(max_length=50, verbose_name='分片数据库别名')),
+                ('create_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '用户分片查找表',
+                'verbose_name_plural': '用户分片查找表',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:07
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+from utensil.online_migrations import RemoveIndexOnline
+
+
+class Migration(migrations.Migration):
+    atomic = False  # ✅ 在线删索引
+
+    dependencies = [
+        ('account', '0007_user_lookup'),
+    ]
+
+    operations = [
+        RemoveIndexOnline(
+            model_name='custompermission',
+            name='idx_perm_code_deleted',
+        ),
+        migrations.AlterField(
+            model_name='role',
+            name='role_name',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='角色名称'),
+        ),
+        migrations.AddConstraint(
+            model_name='role',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('system', models.Value('')), models.F('role_name'), name='uniq_role_system_name'),
+        ),
+    ]
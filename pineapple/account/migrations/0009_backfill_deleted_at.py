@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import F
+
+from utensil.online_migrations import RunBackfill
+
+
+class Migration(migrations.Migration):
+    atomic = False  # ✅ 分批回填，每批独立提交
+
+    dependencies = [
+        ('account', '0008_role_unique_per_system'),
+        ('utensil', '0001_initial'),
+    ]
+
+    # ✅ 历史软删除数据补齐 deleted_at（以最后修改时间为准），归档按 deleted_at 筛选
+    operations = [
+        RunBackfill(
+            model_name=model_name,
+            values={'deleted_at': F('update_at')},
+            filter={'is_deleted': True, 'deleted_at__isnull': True},
+            name=f'account.0009_backfill_deleted_at:{model_name}',
+        )
+        for model_name in ('system', 'custompermission', 'role', 'user')
+    ]
@@ -1,14 +1,25 @@
 import shortuuid
 from django.conf import settings
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
+from utensil import request_scope
+from utensil.models import ArchiveBase
+
 
 def create_uuid():
     return shortuuid.uuid()
 
 
+# ✅ 软删除感知的默认管理器：业务查询永远不扫描已删除行
+class SoftDeleteManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 # ✅ 1. 基类 BaseModel
 class BaseModel(models.Model):
     unified_uuid = models.CharField(
@@ -32,6 +43,9 @@ class BaseModel(models.Model):
     is_deleted = models.BooleanField(default=False, verbose_name="是否删除: True 已经删除 False 未删除", db_index=True)
     deleted_at = models.DateTimeField(null=True, blank=True, verbose_name="删除时间")
 
+    objects = SoftDeleteManager()  # 默认：仅未删除
+    all_objects = models.Manager()  # 包含已删除（恢复 / 归档使用）
+
     class Meta:
         abstract = True
 
@@ -39,7 +53,13 @@ class BaseModel(models.Model):
         """软删除"""
         self.is_deleted = True
         self.deleted_at = timezone.now()
-        self.save(update_fields=["is_deleted", "deleted_at"])
+        self.save(update_fields=["is_deleted", "deleted_at", "update_at"])
+
+    def restore(self):
+        """取消软删除"""
+        self.is_deleted = False
+        self.deleted_at = None
+        self.save(update_fields=["is_deleted", "deleted_at", "update_at"])
 
 
 # ✅ 2. 业务系统表 System
@@ -60,6 +80,12 @@ class System(BaseModel):
         verbose_name="创建人"
     )
 
+    class Meta:
+        indexes = [
+            # ✅ 增量同步游标 (update_at, uuid)
+            models.Index(fields=["update_at", "uuid"], name="idx_system_sync"),
+        ]
+
     def __str__(self):
         return f"{self.system_name} ({self.system_code})"
 
@@ -81,6 +107,11 @@ class CustomPermission(BaseModel):
         verbose_name="创建人"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["update_at", "uuid"], name="idx_perm_sync"),  # ✅ 增量同步游标
+        ]
+
     def __str__(self):
         return f"{self.permission_name} ({self.permission_code})"
 
@@ -90,11 +121,20 @@ class Role(BaseModel):
     """
     角色表（可分配给用户，并关联自定义权限）
     """
-    role_name = models.CharField(max_length=100, unique=True, verbose_name="角色名称", db_index=True)
+    role_name = models.CharField(max_length=100, verbose_name="角色名称", db_index=True)  # 系统内唯一，见 Meta
     is_enable = models.BooleanField(default=True, verbose_name="是否启用", db_index=True)
 
     # 角色描述
 
+    # 🔗 角色 → 系统（为空表示全局角色，对所有系统生效；只有全局的 superadmin 角色是超级管理员）
+    system = models.ForeignKey(
+        System,
+        null=True, blank=True,
+        on_delete=models.CASCADE,
+        related_name="roles",
+        verbose_name="所属系统"
+    )
+
     # 🔗 角色 ↔ 权限
     permissions = models.ManyToManyField(
         CustomPermission,
@@ -111,12 +151,45 @@ class Role(BaseModel):
         verbose_name="创建人"
     )
 
+    class Meta:
+        indexes = [
+            # ✅ 按系统取启用角色：InnoDB 二级索引自带主键 uuid，可仅扫描索引
+            models.Index(fields=["system", "is_enable", "is_deleted"], name="idx_role_system_enable"),
+            models.Index(fields=["update_at", "uuid"], name="idx_role_sync"),  # ✅ 增量同步游标
+        ]
+        constraints = [
+            # ✅ 角色名在系统内唯一；NULL 不参与唯一比较，全局角色按空串归为一组，同名全局角色仍只有一个
+            models.UniqueConstraint(Coalesce("system", Value("")), "role_name", name="uniq_role_system_name"),
+        ]
+
     def __str__(self):
         return self.role_name
 
 
 # ✅ 5. 用户管理器
-class UserManager(BaseUserManager):
+class UserQuerySet(models.QuerySet):
+    """启用用户分片时（account.sharding），按唯一字段的单值条件自动定位用户所在分片"""
+
+    def _filter_or_exclude(self, negate, args, kwargs):
+        clone = super()._filter_or_exclude(negate, args, kwargs)
+        if not negate and clone._db is None:
+            from . import sharding
+            if sharding.enabled():
+                clone._db = sharding.route(kwargs)
+        return clone
+
+    def create(self, **kwargs):
+        from . import sharding
+        if self._db is None and sharding.enabled():
+            kwargs.setdefault("unified_uuid", create_uuid())
+            return self.using(sharding.shard_for(kwargs["unified_uuid"])).create(**kwargs)
+        return super().create(**kwargs)
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
     def create_user(self, email=None, password=None, **extra_fields):
         if email:
             email = self.normalize_email(email)
@@ -195,6 +268,7 @@ class User(BaseModel, AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = []
 
     objects = UserManager()
+    all_objects = UserQuerySet.as_manager()  # 需在 UserManager 之后声明，保证 objects 仍是默认管理器
 
     class Meta:
         indexes = [
@@ -205,31 +279,65 @@ class User(BaseModel, AbstractBaseUser, PermissionsMixin):
             models.Index(fields=["is_deleted", "phone"], name="idx_user_deleted_phone"),
             models.Index(fields=["is_deleted", "email", "nickname", "wx_nickname", "username"],
                          name="idx_user_list"),
+            models.Index(fields=["update_at", "uuid"], name="idx_user_sync"),  # ✅ 增量同步游标
         ]
 
     def __str__(self):
         return self.email or f"wx_{self.wx_openid or self.unified_uuid}"
 
+    def _access(self):
+        """
+        本次请求内的角色与自定义权限：首次访问时两次查询加载，之后直接从内存读取
+        先从用户所在库取角色，再按角色主键查权限，启用用户分片时不需要跨库 JOIN
+        """
+        return request_scope.memoize(("user-access", self.pk), self._load_access)
+
+    def _load_access(self):
+        from .wildcards import PermissionMatcher
+
+        roles = list(self.roles.values_list("uuid", "role_name", "is_enable", "system_id"))
+        enabled = [uuid for uuid, _, is_enable, _ in roles if is_enable]
+        codes = set(CustomPermission.objects.filter(roles__in=enabled).values_list(
+            "permission_code", flat=True)) if enabled else set()
+        return {
+            "roles": [name for _, name, _, _ in roles],
+            "superadmin": any(name == "superadmin" and is_enable and system_id is None
+                              for _, name, is_enable, system_id in roles),
+            "codes": codes,
+            "matcher": PermissionMatcher(codes),
+        }
+
     @property
     def all_roles(self):
-        """返回角色编码列表"""
-        return list(self.roles.values_list("role_name", flat=True))
+        """返回角色编码列表（已 prefetch roles 时不再查询）"""
+        if "roles" in getattr(self, "_prefetched_objects_cache", {}):
+            return [role.role_name for role in self.roles.all()]
+        return list(self._access()["roles"])
 
     @property
     def all_permissions(self):
         """
         获取所有权限（自定义权限 + Django 内置权限）
+        自定义权限一次 JOIN 查询取回，查询次数与角色数量无关
         """
         perms = set(self.get_all_permissions())  # Django 自带权限
-        for role in self.roles.prefetch_related("permissions").all():
-            perms.update(role.permissions.values_list("permission_code", flat=True))
+        perms.update(self._access()["codes"])
         return list(perms)
 
+    def role_uuids(self):
+        """用户角色主键（只查关联表，进程内缓存 + 请求内记忆化）"""
+        from .permission_engine import role_uuids_for
+        return request_scope.memoize(("user-role-uuids", self.pk), lambda: role_uuids_for(self.pk))
+
     def is_super_admin(self):
-        """超级管理员：Django is_superuser OR 角色 superadmin"""
+        """超级管理员：Django is_superuser OR 全局角色 superadmin（系统内的同名角色不算）"""
         if self.is_superuser:  # ✅ 兼容 Django createsuperuser
             return True
-        return self.roles.filter(role_name="superadmin", is_enable=True).exists()
+        from . import permission_engine
+        engine = permission_engine.current()
+        if engine is not None:  # ✅ 位图引擎
+            return engine.is_superadmin(self.role_uuids())
+        return self._access()["superadmin"]
 
     def has_custom_permission(self, perm_code):
         """
@@ -237,7 +345,44 @@ class User(BaseModel, AbstractBaseUser, PermissionsMixin):
         """
         if self.is_super_admin():
             return True
-        return self.roles.filter(
-            is_enable=True,
-            permissions__permission_code=perm_code
-        ).exists()
+        from . import permission_engine
+        engine = permission_engine.current()
+        if engine is not None:  # ✅ 位图引擎
+            return engine.has(self.role_uuids(), perm_code)
+        return self._access()["matcher"].match(perm_code)
+
+
+# ✅ 用户分片全局查找表（account.sharding，只在默认库）：字段:值 → 用户所在分片
+class UserLookup(models.Model):
+    key = models.CharField("字段:值", primary_key=True, max_length=200)
+    unified_uuid = models.CharField("统一UUID标识", max_length=25, db_index=True)
+    shard = models.CharField("分片数据库别名", max_length=50)
+    create_at = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "用户分片查找表"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.key
+
+
+# ✅ 7. 归档表：软删除超过保留期的行（utensil.archive）
+class SystemArchive(ArchiveBase):
+    class Meta:
+        db_table = "account_system_archive"
+
+
+class RoleArchive(ArchiveBase):
+    class Meta:
+        db_table = "account_role_archive"
+
+
+class CustomPermissionArchive(ArchiveBase):
+    class Meta:
+        db_table = "account_custompermission_archive"
+
+
+class UserArchive(ArchiveBase):
+    class Meta:
+        db_table = "account_user_archive"
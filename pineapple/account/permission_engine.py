@@ -0,0 +1,276 @@
+"""
+位图权限引擎
+
+- permission_code 直接使用快照中的有序下标作为稠密整数编号
+- 每个启用角色编译为一个 int 位图，用户有效权限 = 其启用角色位图按位或
+- AND / OR 判定各只需一次位运算，并提供多用户 / 多权限码批量接口
+- 通配符授权（product.* / *.view）编译期展开到目录内的具体权限码位上；
+  目录外的权限码再走角色的通配符前缀树
+"""
+import itertools
+import logging
+
+from utensil.cache_bus import LocalCache, bus
+from . import permission_snapshot, sharding
+from .wildcards import WildcardTrie, is_wildcard
+
+logger = logging.getLogger(__name__)
+
+
+class PermissionEngine:
+    """由共享内存快照编译，进程内只读"""
+
+    def __init__(self, snapshot):
+        self.generation = snapshot.generation
+        self.snapshot = snapshot
+        self.role_masks = {}  # role uuid → 位图（仅启用且未删除的角色）
+        self.role_tries = {}  # role uuid → 通配符前缀树（仅含通配符授权的角色）
+        self.role_systems = {}  # role uuid → 所属系统 system_code（全局角色不记录）
+        self.superadmin_roles = set()
+        leaves = [(j, snapshot.perm_code(j)) for j in range(snapshot.n_perms) if snapshot.perm_active(j)]
+        leaves = [(j, code) for j, code in leaves if not is_wildcard(code)]
+        width = (snapshot.n_perms + 7) // 8
+        for i in range(snapshot.n_roles):
+            if not snapshot.role_active(i):
+                continue
+            uuid = snapshot.role_uuid(i)
+            system_i = snapshot.role_system(i)
+            if system_i is not None:
+                self.role_systems[uuid] = snapshot.system_code(system_i)
+            bitmap = bytearray(width)
+            patterns = []
+            for j in snapshot.role_perm_ids(i):
+                if snapshot.perm_active(j):
+                    bitmap[j >> 3] |= 1 << (j & 7)
+                    code = snapshot.perm_code(j)
+                    if is_wildcard(code):
+                        patterns.append(code)
+            if patterns:
+                trie = self.role_tries[uuid] = WildcardTrie(patterns)
+                for j, code in leaves:
+                    if trie.match(code):
+                        bitmap[j >> 3] |= 1 << (j & 7)
+            self.role_masks[uuid] = int.from_bytes(bitmap, "little")
+            if snapshot.role_is_superadmin(i):
+                self.superadmin_roles.add(uuid)
+
+    # ✅ 编码
+    def code_bit(self, code):
+        """权限码 → 位；已删除的权限返回 0，目录外的权限码返回 None"""
+        i = self.snapshot.perm_index(code)
+        if i is None:
+            return None
+        return 1 << i if self.snapshot.perm_active(i) else 0
+
+    def compile_codes(self, codes):
+        """权限码列表 → (位图, 目录外权限码, 是否包含已删除权限)"""
+        mask, outside, dead = 0, [], False
+        for code in codes:
+            bit = self.code_bit(code)
+            if bit is None:
+                outside.append(code)
+            elif bit == 0:
+                dead = True
+            else:
+                mask |= bit
+        return mask, outside, dead
+
+    def system_active(self, system_code):
+        i = self.snapshot.system_index(system_code)
+        return i is not None and self.snapshot.system_active(i)
+
+    def scoped(self, role_uuids, system_code=None):
+        """在指定系统下生效的角色：全局角色 + 该系统的角色；system_code 为空时不过滤"""
+        if system_code is None or not self.role_systems:
+            return role_uuids
+        return [uuid for uuid in role_uuids if self.role_systems.get(uuid, system_code) == system_code]
+
+    def user_mask(self, role_uuids):
+        mask = 0
+        for uuid in role_uuids:
+            mask |= self.role_masks.get(uuid, 0)
+        return mask
+
+    def wildcard_match(self, role_uuids, code):
+        """目录外权限码：逐个角色走前缀树"""
+        for uuid in role_uuids:
+            trie = self.role_tries.get(uuid)
+            if trie is not None and trie.match(code):
+                return True
+        return False
+
+    def is_superadmin(self, role_uuids):
+        return not self.superadmin_roles.isdisjoint(role_uuids)
+
+    # ✅ 判定
+    def check(self, role_uuids, codes, logic="OR", system_code=None):
+        """单用户多权限码（不含超级管理员判断）"""
+        role_uuids = self.scoped(role_uuids, system_code)
+        required, outside, dead = self.compile_codes(codes)
+        mask = self.user_mask(role_uuids)
+        if logic == "AND":
+            return (not dead and mask & required == required
+                    and all(self.wildcard_match(role_uuids, code) for code in outside))
+        return mask & required != 0 or any(self.wildcard_match(role_uuids, code) for code in outside)
+
+    def has(self, role_uuids, code):
+        bit = self.code_bit(code)
+        if bit is None:
+            return self.wildcard_match(role_uuids, code)
+        return self.user_mask(role_uuids) & bit != 0
+
+    def check_many(self, users_roles, codes, system_code=None):
+        """
+        批量：{用户主键: 角色列表} × 权限码列表 → {用户主键: {权限码: bool}}
+        每个权限码只编码一次，每个用户只合并一次位图
+        """
+        bits = {code: self.code_bit(code) for code in codes}
+        result = {}
+        for user_pk, role_uuids in users_roles.items():
+            if self.is_superadmin(role_uuids):
+                result[user_pk] = dict.fromkeys(bits, True)
+                continue
+            role_uuids = self.scoped(role_uuids, system_code)
+            mask = self.user_mask(role_uuids)
+            result[user_pk] = {
+                code: self.wildcard_match(role_uuids, code) if bit is None else mask & bit != 0
+                for code, bit in bits.items()
+            }
+        return result
+
+
+_engine_cache = LocalCache(permission_snapshot.SNAPSHOT_NAMESPACES, maxsize=1, whole=True)
+_user_roles_cache = LocalCache("user")
+
+
+def current():
+    """当前进程的引擎；快照不可用时返回 None，调用方回退到数据库查询"""
+    engine = _engine_cache.get("engine")
+    if engine is not None:
+        return engine
+    version = bus.generation
+    snapshot = permission_snapshot.current()
+    if snapshot is None:
+        return None
+    engine = PermissionEngine(snapshot)
+    _engine_cache.set("engine", engine, version=version)
+    return engine
+
+
+def warm():
+    """启动预热（utensil.warmup）：映射共享快照并编译位图引擎，快照过期时由本进程重建"""
+    current()
+
+
+def role_uuids_for(user_pk):
+    """用户角色主键（只查关联表，按用户缓存，user 命名空间失效）"""
+    from .models import User
+
+    return _user_roles_cache.get_or_set(str(user_pk), lambda: tuple(
+        User.roles.through.objects.using(sharding.db_for_pk(user_pk)).filter(
+            user_id=user_pk).values_list("role_id", flat=True)
+    ))
+
+
+def role_uuids_for_many(user_pks):
+    """批量版本：未命中的用户合并为一次 IN 查询"""
+    from .models import User
+
+    result, missing = {}, []
+    for pk in user_pks:
+        cached = _user_roles_cache.get(str(pk))
+        if cached is None:
+            missing.append(pk)
+        else:
+            result[pk] = cached
+    if missing:
+        version = bus.generation
+        fetched = {pk: [] for pk in missing}
+        for rows in sharding.each_shard(User.roles.through.objects.filter(user_id__in=missing)):
+            for user_id, role_id in rows.values_list("user_id", "role_id"):
+                fetched[user_id].append(role_id)
+        for pk, roles in fetched.items():
+            result[pk] = tuple(roles)
+            _user_roles_cache.set(str(pk), result[pk], version=version)
+    return result
+
+
+_user_state_cache = LocalCache("user")
+_unified_to_pk = {}  # unified_uuid 不可修改，映射可常驻（超过上限时整体清空）
+_UNIFIED_TO_PK_MAX = 100000
+
+
+def resolve_users(unified_uuids):
+    """
+    unified_uuid → (主键, is_superuser)；不存在 / 已停用 / 已删除的用户不返回
+    未命中的用户合并为一次 IN 查询
+    """
+    from .models import User
+
+    result, missing = {}, []
+    for uid in unified_uuids:
+        pk = _unified_to_pk.get(uid)
+        state = _user_state_cache.get(pk) if pk is not None else None
+        if state is None:
+            missing.append(uid)
+        elif state[1]:
+            result[uid] = (pk, state[0])
+    if missing:
+        version = bus.generation
+        rows = itertools.chain.from_iterable(
+            qs.values_list("unified_uuid", "uuid", "is_superuser", "is_active", "is_deleted")
+            for qs in sharding.each_shard(User.all_objects.filter(unified_uuid__in=missing))
+        )
+        if len(_unified_to_pk) + len(missing) > _UNIFIED_TO_PK_MAX:
+            _unified_to_pk.clear()
+        for uid, pk, is_superuser, is_active, is_deleted in rows:
+            _unified_to_pk[uid] = pk
+            valid = is_active and not is_deleted
+            _user_state_cache.set(pk, (is_superuser, valid), version=version)
+            if valid:
+                result[uid] = (pk, is_superuser)
+    return result
+
+
+def authorize(user_codes, system_code):
+    """
+    批量授权：{unified_uuid: [权限码]} → {unified_uuid: {权限码: bool}}
+    用户、角色、权限均来自进程内缓存 / 共享快照，缓存命中时不访问数据库
+    """
+    from .models import System, User
+
+    user_codes = {uid: list(dict.fromkeys(codes)) for uid, codes in user_codes.items()}
+    engine = current()
+    if engine is None:  # ✅ 快照不可用时回退到逐用户数据库查询
+        from .CustomPermissionMiddleware import CustomPermissionMiddleware
+        if not System.objects.filter(system_code=system_code, is_deleted=False).exists():
+            return {uid: dict.fromkeys(codes, False) for uid, codes in user_codes.items()}  # 与引擎一致：先判断系统
+        users = {u.unified_uuid: u for qs in sharding.each_shard(User.objects.filter(
+            unified_uuid__in=list(user_codes), is_active=True, is_deleted=False)) for u in qs}
+        result = {}
+        for uid, codes in user_codes.items():
+            user = users.get(uid)
+            if user is None:
+                result[uid] = dict.fromkeys(codes, False)
+            elif user.is_super_admin():
+                result[uid] = dict.fromkeys(codes, True)
+            else:
+                result[uid] = {code: CustomPermissionMiddleware.check_user_system_permissions(
+                    user, system_code, [code]) for code in codes}
+        return result
+
+    if not engine.system_active(system_code):
+        return {uid: dict.fromkeys(codes, False) for uid, codes in user_codes.items()}
+    users = resolve_users(user_codes)
+    roles = role_uuids_for_many([pk for pk, _ in users.values()])
+    result = {}
+    for uid, codes in user_codes.items():
+        if uid not in users:
+            result[uid] = dict.fromkeys(codes, False)
+            continue
+        pk, is_superuser = users[uid]
+        if is_superuser:
+            result[uid] = dict.fromkeys(codes, True)
+        else:
+            result[uid] = engine.check_many({pk: roles.get(pk, ())}, codes, system_code)[pk]
+    return result
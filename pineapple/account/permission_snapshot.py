@@ -0,0 +1,332 @@
+"""
+角色 → 权限 → 系统 授权快照（同一主机的所有 worker 进程共享）
+
+- 快照编译为一个紧凑的二进制文件，写入 /dev/shm（tmpfs）后通过 mmap 只读映射，
+  各进程共享同一份物理页，内存占用与 worker 数量无关
+- 全局代数（generation）保存在 Redis，角色 / 权限 / 系统变更提交后 +1；
+  进程收到失效事件后重新读取代数，文件过期时由同主机的一个进程加锁重建并原子替换
+- 查询为纯内存读取：有序字符串表二分查找 + CSR 邻接表
+"""
+import bisect
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+
+from utensil.cache_bus import LocalCache, bus, get_redis
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PNSP"
+FORMAT_VERSION = 3
+GENERATION_KEY = "pineapple:permission-snapshot:generation"
+
+# 头部：magic, 格式版本, 字节序(0 小端 / 1 大端), 代数, 权限数, 角色数, 系统数, 角色权限关联数
+_HEADER = struct.Struct("=4sHHQIIII")
+# 各区段偏移
+_SECTIONS = ("perm_ptr", "perm_blob", "perm_flags",
+             "role_ptr", "role_blob", "role_flags", "role_system", "role_perm_ptr", "role_perm_ids",
+             "system_ptr", "system_blob", "system_flags")
+_OFFSETS = struct.Struct("=" + "I" * len(_SECTIONS))
+
+NO_SYSTEM = 0xFFFFFFFF  # 全局角色
+
+# 标志位
+FLAG_DELETED = 1
+FLAG_ENABLED = 2
+FLAG_SUPERADMIN = 4
+
+SNAPSHOT_NAMESPACES = ("role", "permission", "system")
+
+
+def default_path():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "pineapple-permission-snapshot.bin")
+
+
+SNAPSHOT_PATH = getattr(settings, "PERMISSION_SNAPSHOT_PATH", None) or default_path()
+
+
+# ------------------------------------------------------------------------------------------------------------ 编译
+def _string_table(values):
+    """有序字符串表：u32 偏移数组（n+1）+ utf-8 字节块"""
+    ptr, blob, pos = [], bytearray(), 0
+    for value in values:
+        ptr.append(pos)
+        data = value.encode("utf-8")
+        blob += data
+        pos += len(data)
+    ptr.append(pos)
+    return struct.pack(f"={len(ptr)}I", *ptr), bytes(blob)
+
+
+def compile_snapshot(generation):
+    """从数据库编译快照字节串"""
+    from .models import CustomPermission, Role, System
+
+    perms = sorted(CustomPermission.all_objects.values_list("permission_code", "uuid", "is_deleted"))
+    roles = sorted(Role.all_objects.values_list("uuid", "role_name", "is_enable", "is_deleted", "system_id"))
+    systems = sorted(System.all_objects.values_list("system_code", "uuid", "is_deleted"))
+
+    perm_index = {uuid: i for i, (_, uuid, _) in enumerate(perms)}
+    role_index = {uuid: i for i, (uuid, *_) in enumerate(roles)}
+    system_index = {uuid: i for i, (_, uuid, _) in enumerate(systems)}
+    adjacency = [[] for _ in roles]
+    for role_id, perm_id in Role.permissions.through.objects.values_list("role_id", "custompermission_id"):
+        if role_id in role_index and perm_id in perm_index:
+            adjacency[role_index[role_id]].append(perm_index[perm_id])
+
+    role_perm_ptr, role_perm_ids = [0], []
+    for ids in adjacency:
+        role_perm_ids.extend(sorted(ids))
+        role_perm_ptr.append(len(role_perm_ids))
+
+    role_flags = bytes(
+        (FLAG_DELETED if is_deleted else 0)
+        | (FLAG_ENABLED if is_enable else 0)
+        | (FLAG_SUPERADMIN if role_name == "superadmin" and not system_id else 0)
+        for _, role_name, is_enable, is_deleted, system_id in roles
+    )
+    role_system = [system_index.get(system_id, NO_SYSTEM) if system_id else NO_SYSTEM
+                   for *_, system_id in roles]
+    sections = {}
+    sections["perm_ptr"], sections["perm_blob"] = _string_table(code for code, _, _ in perms)
+    sections["perm_flags"] = bytes(FLAG_DELETED if d else 0 for _, _, d in perms)
+    sections["role_ptr"], sections["role_blob"] = _string_table(uuid for uuid, *_ in roles)
+    sections["role_flags"] = role_flags
+    sections["role_system"] = struct.pack(f"={len(role_system)}I", *role_system)
+    sections["role_perm_ptr"] = struct.pack(f"={len(role_perm_ptr)}I", *role_perm_ptr)
+    sections["role_perm_ids"] = struct.pack(f"={len(role_perm_ids)}I", *role_perm_ids)
+    sections["system_ptr"], sections["system_blob"] = _string_table(code for code, _, _ in systems)
+    sections["system_flags"] = bytes(FLAG_DELETED if d else 0 for _, _, d in systems)
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, 0 if sys.byteorder == "little" else 1, generation,
+                          len(perms), len(roles), len(systems), len(role_perm_ids))
+    body, offsets, pos = bytearray(), [], _HEADER.size + _OFFSETS.size
+    for name in _SECTIONS:
+        pad = -pos % 4  # u32 数组按 4 字节对齐，便于 memoryview.cast
+        body += b"\0" * pad
+        pos += pad
+        offsets.append(pos)
+        body += sections[name]
+        pos += len(sections[name])
+    return header + _OFFSETS.pack(*offsets) + bytes(body)
+
+
+def write_snapshot(generation, path=None):
+    """写入临时文件后原子替换，已映射旧文件的进程不受影响"""
+    path = path or SNAPSHOT_PATH
+    data = compile_snapshot(generation)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    logger.info(f"[SNAPSHOT] 已重建权限快照 generation={generation} size={len(data)}B")
+
+
+# ------------------------------------------------------------------------------------------------------------ 读取
+class PermissionSnapshot:
+    """mmap 只读快照，所有查询均不复制整表"""
+
+    def __init__(self, path=None):
+        with open(path or SNAPSHOT_PATH, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _HEADER.size + _OFFSETS.size:
+            raise ValueError("权限快照文件不完整")
+        magic, fmt, order, self.generation, self.n_perms, self.n_roles, self.n_systems, _ = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION or order != (0 if sys.byteorder == "little" else 1):
+            raise ValueError("权限快照格式不匹配")
+        offsets = dict(zip(_SECTIONS, _OFFSETS.unpack_from(self._mm, _HEADER.size)))
+        view = memoryview(self._mm)
+
+        def section(name, size):
+            """区段越界（文件截断或损坏）时抛出 ValueError，由调用方回退到数据库查询"""
+            start = offsets[name]
+            if start + size > len(self._mm):
+                raise ValueError(f"权限快照区段越界: {name}")
+            return view[start:start + size]
+
+        def u32(name, count):
+            return section(name, 4 * count).cast("I")
+
+        def raw(name, count):
+            return section(name, count)
+
+        def blob(name, ptr):
+            section(name, ptr[-1])  # 偏移数组末项即字节块长度
+            return offsets[name]
+
+        self._perm_ptr = u32("perm_ptr", self.n_perms + 1)
+        self._perm_blob = blob("perm_blob", self._perm_ptr)
+        self._perm_flags = raw("perm_flags", self.n_perms)
+        self._role_ptr = u32("role_ptr", self.n_roles + 1)
+        self._role_blob = blob("role_blob", self._role_ptr)
+        self._role_flags = raw("role_flags", self.n_roles)
+        self._role_system = u32("role_system", self.n_roles)
+        self._role_perm_ptr = u32("role_perm_ptr", self.n_roles + 1)
+        self._role_perm_ids = u32("role_perm_ids", self._role_perm_ptr[self.n_roles] if self.n_roles else 0)
+        self._system_ptr = u32("system_ptr", self.n_systems + 1)
+        self._system_blob = blob("system_blob", self._system_ptr)
+        self._system_flags = raw("system_flags", self.n_systems)
+
+    def _string(self, ptr, blob, i):
+        return self._mm[blob + ptr[i]:blob + ptr[i + 1]]
+
+    def _search(self, ptr, blob, count, value):
+        """有序字符串表二分查找，返回下标或 None"""
+        target = value.encode("utf-8")
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(ptr, blob, mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < count and self._string(ptr, blob, lo) == target:
+            return lo
+        return None
+
+    # ✅ 权限
+    def perm_index(self, code):
+        return self._search(self._perm_ptr, self._perm_blob, self.n_perms, code)
+
+    def perm_code(self, i):
+        return self._string(self._perm_ptr, self._perm_blob, i).decode("utf-8")
+
+    def perm_active(self, i):
+        return not self._perm_flags[i] & FLAG_DELETED
+
+    # ✅ 角色
+    def role_index(self, uuid):
+        return self._search(self._role_ptr, self._role_blob, self.n_roles, uuid)
+
+    def role_uuid(self, i):
+        return self._string(self._role_ptr, self._role_blob, i).decode("utf-8")
+
+    def role_active(self, i):
+        """启用且未删除"""
+        return self._role_flags[i] & (FLAG_ENABLED | FLAG_DELETED) == FLAG_ENABLED
+
+    def role_is_superadmin(self, i):
+        return self.role_active(i) and bool(self._role_flags[i] & FLAG_SUPERADMIN)
+
+    def role_system(self, i):
+        """角色所属系统的下标；全局角色返回 None"""
+        j = self._role_system[i]
+        return None if j == NO_SYSTEM else j
+
+    def role_perm_ids(self, i):
+        """角色的权限下标（有序，零拷贝视图）"""
+        return self._role_perm_ids[self._role_perm_ptr[i]:self._role_perm_ptr[i + 1]]
+
+    def role_has(self, i, perm_i):
+        ids = self.role_perm_ids(i)
+        j = bisect.bisect_left(ids, perm_i)
+        return j < len(ids) and ids[j] == perm_i
+
+    # ✅ 系统
+    def system_index(self, code):
+        return self._search(self._system_ptr, self._system_blob, self.n_systems, code)
+
+    def system_code(self, i):
+        return self._string(self._system_ptr, self._system_blob, i).decode("utf-8")
+
+    def system_active(self, i):
+        return not self._system_flags[i] & FLAG_DELETED
+
+    # ✅ 组合查询
+    def roles_grant(self, role_uuids, perm_code):
+        """任一启用角色拥有该（未删除的）权限"""
+        perm_i = self.perm_index(perm_code)
+        if perm_i is None or not self.perm_active(perm_i):
+            return False
+        for uuid in role_uuids:
+            i = self.role_index(uuid)
+            if i is not None and self.role_active(i) and self.role_has(i, perm_i):
+                return True
+        return False
+
+    def roles_superadmin(self, role_uuids):
+        for uuid in role_uuids:
+            i = self.role_index(uuid)
+            if i is not None and self.role_is_superadmin(i):
+                return True
+        return False
+
+
+def _load(generation, path=None):
+    """映射快照文件；代数不一致时同主机仅一个进程加锁重建"""
+    path = path or SNAPSHOT_PATH
+    try:
+        snapshot = PermissionSnapshot(path)
+        if snapshot.generation == generation:
+            return snapshot
+    except (OSError, ValueError):
+        pass
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                snapshot = PermissionSnapshot(path)
+                if snapshot.generation == generation:
+                    return snapshot  # 等锁期间已被其他进程重建
+            except (OSError, ValueError):
+                pass
+            write_snapshot(generation, path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return PermissionSnapshot(path)
+
+
+_cache = LocalCache(SNAPSHOT_NAMESPACES, maxsize=1, whole=True)
+
+
+def current():
+    """
+    当前进程可用的快照；Redis / 失效总线不可用时返回 None，调用方回退到数据库查询
+    """
+    snapshot = _cache.get("snapshot")
+    if snapshot is not None:
+        return snapshot
+    conn = get_redis()
+    if conn is None or not bus.ensure_started():
+        return None
+    version = bus.generation
+    try:
+        snapshot = _load(_generation(conn))
+    except Exception as e:  # noqa
+        logger.error(f"[SNAPSHOT] 加载权限快照失败: {e}")
+        return None
+    _cache.set("snapshot", snapshot, version=version)
+    return snapshot
+
+
+def _generation(conn):
+    """
+    Redis 中的快照代数；键不存在（首次启动 / Redis 清空或重启）时以毫秒时间戳初始化，
+    从 0 重新计数会与 /dev/shm 中旧快照文件的代数重合，导致映射到过期快照
+    """
+    generation = conn.get(GENERATION_KEY)
+    if generation is None:
+        conn.set(GENERATION_KEY, time.time_ns() // 1000000, nx=True)
+        generation = conn.get(GENERATION_KEY)
+    return int(generation)
+
+
+def bump_generation():
+    """角色 / 权限 / 系统变更提交后调用（须先于失效事件发布）"""
+    conn = get_redis()
+    if conn is None:
+        return
+    try:
+        _generation(conn)
+        conn.incr(GENERATION_KEY)
+    except Exception as e:  # noqa
+        logger.error(f"[SNAPSHOT] 更新快照代数失败: {e}")
@@ -1,6 +1,21 @@
+from django.conf import settings
 from rest_framework import permissions
 from rest_framework.permissions import BasePermission
 
+SERVICE_PERMISSION = getattr(settings, "ACCOUNT_SERVICE_PERMISSION", "account.service")
+
+
+def is_service_caller(user):
+    """下游服务账号（拥有 ACCOUNT_SERVICE_PERMISSION 权限码）或超级管理员"""
+    return bool(user and user.is_authenticated) and user.has_custom_permission(SERVICE_PERMISSION)
+
+
+class IsServiceCaller(BasePermission):
+    """仅允许下游服务账号或超级管理员访问"""
+
+    def has_permission(self, request, view):
+        return is_service_caller(request.user)
+
 
 class HasCustomPermission(BasePermission):
     """
@@ -25,7 +40,7 @@ class IsAdminRole(permissions.BasePermission):
         # ✅ 兼容 Django createsuperuser
         if user.is_superuser:
             return True
-        # ✅ 兼容自定义超级管理员（roles.filter(role_name="superadmin")）
+        # ✅ 兼容自定义超级管理员（全局角色 superadmin，见 User.is_super_admin）
         if hasattr(user, "is_super_admin") and user.is_super_admin():
             return True
         # ✅ 兼容普通管理员角色
@@ -0,0 +1,280 @@
+"""
+WebSocket 推送：用户的角色、权限或基础资料变化时主动通知已连接的客户端（替代轮询 myinfo/）
+
+- 连接：ws(s)://<host>/ws/account/，握手后第一条消息认证 {"type": "auth", "token": "<access token>"}
+  （token 不放在 URL 中，避免被代理 / 访问日志记录）；AUTH_TIMEOUT 秒内未认证或认证失败时关闭连接
+- Access Token 过期（exp）时发送 {"type": "expired"} 并关闭连接；过期前可再次发送 auth 消息续期（须为同一用户）
+- 连接成功后先发送完整状态 {"type": "state", ...}，之后只发送差异：
+    {"type": "diff", "profile": {变化的字段}, "roles": {"add": [...], "del": [...]}, "permissions": {...}}
+- 跨 worker 扇出复用失效总线（utensil.cache_bus）的 Redis 频道：每个进程一个异步订阅，
+  按事件命名空间找出本进程内受影响的连接，批量重新计算状态后推送差异
+- 用户被删除 / 停用时发送 {"type": "revoked"} 并关闭连接
+- 订阅中断期间可能漏掉事件，重连后对全部连接重新计算
+"""
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from utensil.cache_bus import CHANNEL
+
+logger = logging.getLogger(__name__)
+
+PATH = "/ws/account/"
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_REVOKED = 4403
+AUTH_TIMEOUT = 10  # 秒：连接后等待认证消息
+
+
+def database_sync_to_async(fn):
+    """
+    在线程中执行 ORM 调用，前后 close_old_connections()：
+    长连接与总线订阅协程不经过请求周期，MySQL wait_timeout 断开的连接不会被自动丢弃
+    """
+
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(wrapper)
+
+
+def get_async_redis():
+    import redis.asyncio as aioredis
+    return aioredis.Redis.from_url(settings.CACHES["default"]["LOCATION"])
+
+
+def load_states(pks):
+    """
+    批量计算用户状态（4 次查询，与用户数无关）；已删除 / 停用的用户状态为 None
+    assigned 为分配给用户的全部角色（含停用 / 已删除），用于判断角色事件是否影响该用户
+    """
+    from .models import CustomPermission, Role, User
+    from .serializers import UserRetrieveSerializer
+
+    states = {pk: None for pk in pks}
+    for user in User.objects.filter(pk__in=pks, is_active=True):
+        states[user.pk] = {"profile": UserRetrieveSerializer(user).data, "roles": {}, "permissions": {},
+                           "assigned": set()}
+    live = [pk for pk, state in states.items() if state is not None]
+    for user_id, role_id in User.roles.through.objects.filter(user_id__in=live).values_list("user_id", "role_id"):
+        states[user_id]["assigned"].add(role_id)
+    for user_id, uuid, name in Role.objects.filter(users__in=live, is_enable=True).values_list(
+            "users", "uuid", "role_name"):
+        states[user_id]["roles"][uuid] = name
+    for user_id, uuid, code in CustomPermission.objects.filter(
+            roles__users__in=live, roles__is_enable=True, roles__is_deleted=False
+    ).values_list("roles__users", "uuid", "permission_code").distinct():
+        states[user_id]["permissions"][uuid] = code
+    return states
+
+
+def diff_states(old, new):
+    """只包含变化部分；没有变化时返回 None"""
+    result = {}
+    profile = {k: v for k, v in new["profile"].items() if old["profile"].get(k) != v}
+    if profile:
+        result["profile"] = profile
+    for section in ("roles", "permissions"):
+        before, after = set(old[section].values()), set(new[section].values())
+        if before != after:
+            result[section] = {"add": sorted(after - before), "del": sorted(before - after)}
+    return result or None
+
+
+def render_state(state):
+    return {
+        "type": "state",
+        "profile": state["profile"],
+        "roles": sorted(state["roles"].values()),
+        "permissions": sorted(state["permissions"].values()),
+    }
+
+
+class Connection:
+    def __init__(self, user_pk, send):
+        self.user_pk = user_pk
+        self.send = send
+        self.state = None
+
+    async def send_json(self, data):
+        await self.send({"type": "websocket.send", "text": json.dumps(data, ensure_ascii=False, separators=(",", ":"))})
+
+
+class Hub:
+    """进程内的连接表 + 失效总线订阅"""
+
+    def __init__(self):
+        self.connections = {}  # 用户主键 → {Connection}
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def add(self, conn):
+        self.connections.setdefault(conn.user_pk, set()).add(conn)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def discard(self, conn):
+        conns = self.connections.get(conn.user_pk)
+        if conns:
+            conns.discard(conn)
+            if not conns:
+                del self.connections[conn.user_pk]
+
+    def affected(self, namespace, keys):
+        """
+        事件影响的本进程用户主键：
+        - user：事件中的用户；role：分配了这些角色（含停用）的用户
+        - permission / system 变更较少且无法从连接状态判断（如恢复已删除的权限），重新计算全部连接
+        """
+        if namespace not in ("user", "role", "permission", "system"):
+            return set()
+        if keys is None or namespace in ("permission", "system"):
+            return set(self.connections)
+        keys = set(keys)
+        if namespace == "user":
+            return {pk for pk in self.connections if pk in keys}
+        return {
+            pk for pk, conns in self.connections.items()
+            if any(conn.state is None or not keys.isdisjoint(conn.state["assigned"]) for conn in conns)
+        }
+
+    async def refresh(self, pks):
+        pks = [pk for pk in pks if pk in self.connections]
+        if not pks:
+            return
+        async with self._lock:  # 串行重新计算，避免同一连接的差异乱序
+            states = await database_sync_to_async(load_states)(pks)
+            for pk, state in states.items():
+                for conn in list(self.connections.get(pk, ())):
+                    await self.push(conn, state)
+
+    async def push(self, conn, state):
+        try:
+            if state is None:
+                await conn.send_json({"type": "revoked"})
+                await conn.send({"type": "websocket.close", "code": CLOSE_REVOKED})
+                self.discard(conn)
+                return
+            payload = diff_states(conn.state, state) if conn.state is not None else None
+            conn.state = state
+            if payload:
+                await conn.send_json({"type": "diff", **payload})
+        except Exception as e:  # noqa
+            logger.warning(f"[REALTIME] 推送失败，移除连接: {e}")
+            self.discard(conn)
+
+    async def _run(self):
+        backoff = 1
+        while self.connections:
+            try:
+                client = get_async_redis()
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(CHANNEL)
+                if backoff > 1:  # 重连：中断期间的事件可能丢失
+                    await self.refresh(list(self.connections))
+                backoff = 1
+                while self.connections:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        try:
+                            event = json.loads(message["data"])
+                        except (TypeError, ValueError):
+                            continue
+                        await self.refresh(self.affected(event.get("n"), event.get("k")))
+                await pubsub.aclose()
+                await client.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # noqa
+                logger.error(f"[REALTIME] 订阅中断，{backoff}s 后重连: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+hub = Hub()
+
+
+def _authenticate(token):
+    """返回 (用户主键, 过期时间戳)；token 无效或用户不存在时返回 None"""
+    from .models import User
+
+    if not isinstance(token, str) or not token:
+        return None
+    try:
+        access = AccessToken(token)
+        uid, exp = access[api_settings.USER_ID_CLAIM], access["exp"]
+    except (TokenError, KeyError):
+        return None
+    user_pk = User.objects.filter(unified_uuid=uid, is_active=True).values_list("pk", flat=True).first()
+    return None if user_pk is None else (user_pk, exp)
+
+
+def _auth_token(message):
+    """auth 消息中的 token；其他消息返回 None"""
+    try:
+        data = json.loads(message.get("text") or "")
+    except (TypeError, ValueError):
+        return None
+    if isinstance(data, dict) and data.get("type") == "auth":
+        return data.get("token") or ""
+    return None
+
+
+async def websocket_application(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    await send({"type": "websocket.accept"})
+    try:
+        message = await asyncio.wait_for(receive(), AUTH_TIMEOUT)
+    except asyncio.TimeoutError:
+        message = {}
+    if message.get("type") == "websocket.disconnect":
+        return
+    auth = await database_sync_to_async(_authenticate)(_auth_token(message))
+    if auth is None:
+        await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+        return
+    user_pk, exp = auth
+
+    conn = Connection(user_pk, send)
+    hub.add(conn)
+    try:
+        state = (await database_sync_to_async(load_states)([user_pk]))[user_pk]
+        if state is None:
+            await hub.push(conn, None)
+            return
+        conn.state = state
+        await conn.send_json(render_state(state))
+        while True:
+            try:
+                message = await asyncio.wait_for(receive(), max(exp - time.time(), 0))
+            except asyncio.TimeoutError:
+                await conn.send_json({"type": "expired"})
+                await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+                break
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") == "ping":
+                await conn.send_json({"type": "pong"})
+                continue
+            token = _auth_token(message)
+            if token is not None:  # 续期
+                auth = await database_sync_to_async(_authenticate)(token)
+                if auth is None or auth[0] != user_pk:
+                    await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+                    break
+                exp = auth[1]
+    finally:
+        hub.discard(conn)
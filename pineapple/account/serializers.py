@@ -1,19 +1,56 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import (
     User, System, Role, CustomPermission
 )
 
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenBlacklistSerializer, TokenObtainPairSerializer, TokenRefreshSerializer
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from utensil import write_behind
+from utensil.serializers import AllRowsUniqueMixin, ChangedFieldsUpdateMixin, InsertOrGetCreateMixin
+from . import hashing
+from .token_blacklist import BlacklistRefreshToken
+from .wildcards import validate_code
 
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ["unified_uuid", "uuid", "email", "phone", "username", "nickname", "all_roles", "all_permissions",
-                  "password"]
+        fields = ["unified_uuid", "uuid", "email", "phone", "username", "nickname", "all_roles", "all_permissions"]
+
+
+class LoginProfileSerializer(serializers.ModelSerializer):
+    """
+    登录响应中的精简资料：角色名一次查询取回，不展开权限
+    完整资料（权限、系统）通过 myinfo/ 按需获取
+    """
+    roles = serializers.SerializerMethodField()
+    is_super_admin = serializers.SerializerMethodField()
 
+    class Meta:
+        model = User
+        fields = ["unified_uuid", "uuid", "email", "phone", "username", "nickname", "roles", "is_super_admin"]
+
+    def _enabled_roles(self, obj):  # noqa
+        if not hasattr(obj, "_enabled_roles"):
+            obj._enabled_roles = list(
+                obj.roles.filter(is_enable=True).values_list("role_name", "system_id")
+            )
+        return obj._enabled_roles
+
+    def get_roles(self, obj):
+        return [name for name, _ in self._enabled_roles(obj)]
 
-class RegisterSerializer(serializers.ModelSerializer):
+    def get_is_super_admin(self, obj):
+        return obj.is_superuser or ("superadmin", None) in self._enabled_roles(obj)  # 只认全局 superadmin
+
+
+class RegisterSerializer(AllRowsUniqueMixin):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -22,26 +59,39 @@ class RegisterSerializer(serializers.ModelSerializer):
                   "password"]
 
     def create(self, validated_data):
-        password = validated_data.pop("password")
-        user = User.objects.create(**validated_data)
-        user.set_password(password)
-        user.save()
-        return user
+        # ✅ 哈希在专用线程池中计算，随 INSERT 一次写入
+        validated_data["password"] = hashing.make_password(validated_data["password"])
+        return User.objects.create(**validated_data)
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = BlacklistRefreshToken
+
     def validate(self, attrs):
         data = super().validate(attrs)
-        data["user"] = UserSerializer(self.user).data  # ✅ 返回用户信息
+        write_behind.touch(User, self.user.pk, "last_login")  # ✅ 写回缓冲，不在登录请求中 UPDATE 用户行
+        # ✅ 返回用户信息：lean 只含基础资料与角色名，full 含全部权限
+        if getattr(settings, "ACCOUNT_LOGIN_PROFILE", "lean") == "full":
+            data["user"] = UserSerializer(self.user).data
+        else:
+            data["user"] = LoginProfileSerializer(self.user).data
         return data
 
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = BlacklistRefreshToken  # ✅ 轮换后旧 Refresh Token 写入 Redis 黑名单
+
+
+class LogoutSerializer(TokenBlacklistSerializer):
+    token_class = BlacklistRefreshToken
+
+
 class UserListSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["uuid", "email", "phone", "username", "nickname", "wx_nickname", "wx_avatar_url"]
 
-class UserUpdateSerializer(serializers.ModelSerializer):
+class UserUpdateSerializer(ChangedFieldsUpdateMixin):
     class Meta:
         model = User
         fields = ["phone", "avatar", "username", "nickname"]
@@ -55,6 +105,14 @@ class UserRetrieveSerializer(serializers.ModelSerializer):
         fields = ["uuid", "email", "phone", "username", "nickname"]
 
 
+class UserBatchSerializer(serializers.Serializer):  # noqa
+    """uuid 与 unified_uuid 可混合传入"""
+    ids = serializers.ListField(
+        child=serializers.CharField(max_length=25), allow_empty=False,
+        max_length=getattr(settings, "USER_BATCH_MAX", 2000)
+    )
+
+
 class SystemSerializer(serializers.ModelSerializer):
     created_by = serializers.StringRelatedField(read_only=True)  # 显示用户名
 
@@ -72,7 +130,7 @@ class RoleSerializer(serializers.ModelSerializer):
         fields = ["uuid", "role_name", "is_enable", "permissions", "created_by", "create_at", "update_at"]
 
 
-class RoleUserSerializer(serializers.ModelSerializer):
+class RoleUserSerializer(ChangedFieldsUpdateMixin):
     created_by = serializers.StringRelatedField(read_only=True)
     _existing_instance = None
 
@@ -97,28 +155,26 @@ class RoleUserSerializer(serializers.ModelSerializer):
         obj = Role.objects.create(**validated_data)
         return obj
 
-    def update(self, instance, validated_data):
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        return instance
-
 
 class UserDetailSerializer(serializers.ModelSerializer):
     roles = RoleUserSerializer(many=True, read_only=True)
     is_super_admin = serializers.SerializerMethodField()
+    last_login = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = [
             "uuid", "unified_uuid", "email", "phone", "username", "nickname",
             "wx_openid", "wx_unionid", "wx_nickname", "wx_avatar_url",  # noqa
-            "roles", "is_super_admin"
+            "roles", "is_super_admin", "last_login"
         ]
 
     def get_is_super_admin(self, obj):  # noqa
         return obj.is_super_admin()
 
+    def get_last_login(self, obj):  # noqa
+        return write_behind.current(obj, "last_login")
+
 
 class CustomPermissionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -134,7 +190,9 @@ class UserCreatedBYSerializer(serializers.ModelSerializer):
 
 
 # ✅ 系统 创建
-class SystemCreateSerializer(serializers.ModelSerializer):
+class SystemCreateSerializer(InsertOrGetCreateMixin):
+    unique_fields = ("system_code",)
+
     class Meta:
         model = System
         fields = [
@@ -142,23 +200,12 @@ class SystemCreateSerializer(serializers.ModelSerializer):
         ]
 
     def create(self, validated_data):
-        created_by = self.context["request"].user
-        validated_data['created_by'] = created_by
-        system_code = validated_data['system_code']
-        system_name = validated_data['system_name']
-
-        system_obj = self.Meta.model.objects.filter(
-            system_code=system_code,
-            system_name=system_name,
-            is_deleted=False
-        ).first()
-        if not system_obj:
-            return self.Meta.model.objects.create(**validated_data)
-        return system_obj
+        validated_data['created_by'] = self.context["request"].user
+        return super().create(validated_data)
 
 
 # ✅ 系统 详情 | 列表 | 修改
-class SystemListRetrieveSerializer(serializers.ModelSerializer):
+class SystemListRetrieveSerializer(ChangedFieldsUpdateMixin):
     created_info = UserCreatedBYSerializer(source="created_by", read_only=True)
 
     class Meta:
@@ -167,78 +214,70 @@ class SystemListRetrieveSerializer(serializers.ModelSerializer):
             "uuid", "system_code", "system_name", "created_info"
         ]
 
-    def update(self, instance, validated_data):
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        return instance
-
 
 # ✅ 角色  创建
-class RoleCreateSerializer(serializers.ModelSerializer):  # noqa
+class RoleCreateSerializer(InsertOrGetCreateMixin):  # noqa
+    unique_fields = ("system", "role_name")
+    system = serializers.SlugRelatedField(
+        slug_field="system_code", queryset=System.objects.filter(is_deleted=False),
+        required=False, allow_null=True
+    )
+
     class Meta:
         model = Role
         fields = [
-            "role_name"
+            "role_name", "system"
         ]
 
     def create(self, validated_data):
-        created_by = self.context["request"].user
-        role_name = validated_data['role_name']
-        validated_data['created_by'] = created_by
-        role_obj = self.Meta.model.objects.filter(
-            role_name=role_name,
-            created_by=created_by,
-            is_deleted=False
-        ).first()
-        if not role_obj:
-            return self.Meta.model.objects.create(**validated_data)
-        return role_obj
+        validated_data['created_by'] = self.context["request"].user
+        return super().create(validated_data)
 
 
 # ✅ 角色 详情 | 列表 | 修改
-class RoleListRetrieveSerializer(serializers.ModelSerializer):
+class RoleListRetrieveSerializer(ChangedFieldsUpdateMixin):
     created_info = UserCreatedBYSerializer(source="created_by", read_only=True)
+    system = serializers.SlugRelatedField(
+        slug_field="system_code", queryset=System.objects.filter(is_deleted=False),
+        required=False, allow_null=True
+    )
 
     class Meta:
         model = Role
         fields = [
-            "uuid", "role_name", "created_info"
+            "uuid", "role_name", "system", "created_info"
         ]
 
-    def update(self, instance, validated_data):
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        return instance
+    def validate(self, attrs):
+        """角色名在系统内唯一（约束为表达式索引，ModelSerializer 不会自动生成校验器）"""
+        system = attrs.get("system", getattr(self.instance, "system", None))
+        role_name = attrs.get("role_name", getattr(self.instance, "role_name", None))
+        if Role.all_objects.filter(system=system, role_name=role_name).exclude(
+                pk=getattr(self.instance, "pk", None)).exists():
+            raise serializers.ValidationError({"role_name": f"{role_name} 已存在"})
+        return attrs
 
 
 # ✅ 权限  创建
-class PermissionCreateSerializer(serializers.ModelSerializer):  # noqa
+class PermissionCreateSerializer(InsertOrGetCreateMixin):  # noqa
+    unique_fields = ("permission_code",)
+
     class Meta:
         model = CustomPermission
         fields = [
             "permission_name", "permission_code"
         ]
 
-    def create(self, validated_data):
-        created_by = self.context["request"].user
-        validated_data['created_by'] = created_by
-        permission_name = validated_data['permission_name']
-        permission_code = validated_data['permission_code']
+    def validate_permission_code(self, value):  # noqa
+        return validate_code(value)
 
-        permission_obj = self.Meta.model.objects.filter(
-            permission_name=permission_name,
-            permission_code=permission_code,
-            is_deleted=False
-        ).first()
-        if not permission_obj:
-            return self.Meta.model.objects.create(**validated_data)
-        return permission_obj
+    def create(self, validated_data):
+        validated_data['created_by'] = self.context["request"].user
+        return super().create(validated_data)
 
 
 # ✅ 权限 详情 | 列表 | 修改
-class PermissionListRetrieveSerializer(serializers.ModelSerializer):
+class PermissionListRetrieveSerializer(ChangedFieldsUpdateMixin):
     created_info = UserCreatedBYSerializer(source="created_by", many=False, read_only=True)
 
     class Meta:
@@ -247,8 +286,73 @@ class PermissionListRetrieveSerializer(serializers.ModelSerializer):
             "uuid", "permission_name", "permission_code", "created_info"
         ]
 
-    def update(self, instance, validated_data):
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        return instance
+    def validate_permission_code(self, value):  # noqa
+        return validate_code(value)
+
+
+# ✅ 批量授权
+class AuthorizeSerializer(serializers.Serializer):  # noqa
+    """
+    两种请求方式（二选一）：
+    - token / unified_uuid + permissions：单用户多权限码
+    - checks：[[unified_uuid, permission_code], ...]
+    """
+    token = serializers.CharField(required=False, write_only=True)
+    unified_uuid = serializers.CharField(required=False, max_length=25)
+    system_code = serializers.CharField(max_length=50)
+    permissions = serializers.ListField(
+        child=serializers.CharField(max_length=100), required=False, max_length=500
+    )
+    checks = serializers.ListField(
+        child=serializers.ListField(child=serializers.CharField(max_length=100), min_length=2, max_length=2),
+        required=False, max_length=2000
+    )
+    logic = serializers.ChoiceField(choices=["AND", "OR"], default="OR")
+
+    def validate(self, attrs):
+        if attrs.get("checks"):
+            return attrs
+        if not attrs.get("permissions"):
+            raise serializers.ValidationError("permissions 或 checks 必须提供其一")
+        token = attrs.pop("token", None)
+        if token:
+            try:
+                attrs["unified_uuid"] = AccessToken(token)[api_settings.USER_ID_CLAIM]
+            except (TokenError, KeyError):
+                raise serializers.ValidationError({"token": "无效的 Token"})
+        if not attrs.get("unified_uuid"):
+            raise serializers.ValidationError("token 或 unified_uuid 必须提供其一")
+        return attrs
+
+
+# ✅ 增量同步（含已软删除的行，消费方据 is_deleted 删除本地副本）
+class SyncSystemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = System
+        fields = ["uuid", "unified_uuid", "system_code", "system_name", "is_deleted", "deleted_at", "update_at"]
+
+
+class SyncPermissionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomPermission
+        fields = ["uuid", "unified_uuid", "permission_code", "permission_name", "is_deleted", "deleted_at",
+                  "update_at"]
+
+
+class SyncRoleSerializer(serializers.ModelSerializer):
+    system = serializers.CharField(source="system_id", allow_null=True)
+    permissions = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = Role
+        fields = ["uuid", "unified_uuid", "role_name", "is_enable", "system", "permissions", "is_deleted",
+                  "deleted_at", "update_at"]
+
+
+class SyncUserSerializer(serializers.ModelSerializer):
+    roles = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = User
+        fields = ["uuid", "unified_uuid", "email", "phone", "username", "nickname", "is_active", "roles",
+                  "is_deleted", "deleted_at", "update_at"]
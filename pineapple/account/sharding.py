@@ -0,0 +1,420 @@
+"""
+用户水平分片（可选，ACCOUNT_USER_SHARDS 为空时全部逻辑不生效）
+
+- 分片对象：User 及其 角色 / 系统 关联表，按 crc32(unified_uuid) 取模落到 ACCOUNT_USER_SHARDS 中的数据库别名
+- 目录表（System / Role / CustomPermission 及角色 ↔ 权限）在默认库写入，提交后广播到每个分片，
+  分片内的 JOIN（user.roles、权限判定）无需跨库；首次启用或修复时执行 python manage.py sync_shard_catalog
+- 全局查找表 UserLookup（默认库）：字段:值 → (unified_uuid, 分片)，保证 email / phone / 微信标识跨分片唯一，
+  并用于按 uuid / email / phone / openid 定位分片；写入用户前先占位，冲突时校验占位是否已失效
+- 路由：
+    模型实例（save / delete / user.roles 等关联管理器）→ 按实例所在分片
+    以角色 / 系统为起点写入用户关联（role.users.add(user) 等）→ 逐个用户改由用户侧执行，落到各用户所在分片
+    User 查询带单值 uuid / unified_uuid / email / phone / wx_openid / wx_unionid 条件 → 自动定位分片（UserQuerySet）
+    列表 → ScatterGather：各分片按相同排序取前 N 行后归并，count 求和
+    批量 IN 查询 → each_shard() 逐分片执行
+- 跨库外键（created_by、关联表 → 角色）无法由数据库保证，分片库与默认库连接需关闭外键检查
+  （MySQL：OPTIONS.init_command = "SET foreign_key_checks = 0"，未设置时 manage.py check 给出警告）
+- last_login 写回按 db_for_pk 分组后逐分片 UPDATE
+- 未覆盖：增量同步、WebSocket 推送、归档等后台全表任务仍只访问默认库
+"""
+import functools
+import heapq
+import itertools
+import zlib
+
+from django.conf import settings
+from django.core import checks
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+SHARDS = list(getattr(settings, "ACCOUNT_USER_SHARDS", []))
+
+SHARDED = {"account.user", "account.user_roles", "account.user_systems"}
+CATALOG = {"account.system", "account.role", "account.custompermission", "account.role_permissions"}
+LOOKUP = "account.userlookup"
+LOOKUP_FIELDS = ("uuid", "email", "phone", "wx_openid", "wx_unionid")
+ROUTING_FIELDS = {"pk": "uuid", "uuid": "uuid", "email": "email", "phone": "phone",
+                  "wx_openid": "wx_openid", "wx_unionid": "wx_unionid"}
+
+_pk_shards = {}  # 主键 → 分片（主键不可修改，映射可常驻）
+
+
+def enabled():
+    return bool(SHARDS)
+
+
+def shard_for(unified_uuid):
+    return SHARDS[zlib.crc32(str(unified_uuid).encode()) % len(SHARDS)]
+
+
+def shard_of(user):
+    """用户所在分片：已从某个分片读出时以实际位置为准"""
+    if user._state.db in SHARDS:
+        return user._state.db
+    return shard_for(user.unified_uuid)
+
+
+def _key(field, value):
+    return f"{field}:{value}"
+
+
+def locate(field, value):
+    """按唯一字段定位分片；不存在时返回 None"""
+    from .models import UserLookup
+
+    if field == "unified_uuid":
+        return shard_for(value)
+    if field == "uuid" and value in _pk_shards:
+        return _pk_shards[value]
+    shard = UserLookup.objects.filter(key=_key(field, value)).values_list("shard", flat=True).first()
+    if shard is not None and field == "uuid":
+        if len(_pk_shards) >= 100000:
+            _pk_shards.clear()
+        _pk_shards[value] = shard
+    return shard
+
+
+def db_for_pk(pk):
+    """用户主键 → 分片；未启用分片时返回 None（交给默认路由）"""
+    return locate("uuid", pk) if enabled() else None
+
+
+def route(lookups):
+    """User 查询条件中的单值唯一字段 → 分片"""
+    for lookup, value in lookups.items():
+        field = lookup[:-len("__exact")] if lookup.endswith("__exact") else lookup
+        if field == "unified_uuid" and isinstance(value, str):
+            return shard_for(value)
+        if field in ROUTING_FIELDS and isinstance(value, str) and value:
+            shard = locate(ROUTING_FIELDS[field], value)
+            if shard is not None:
+                return shard
+    return None
+
+
+def each_shard(queryset):
+    """逐分片执行的查询集；未启用分片时只有原查询集"""
+    if not enabled():
+        return [queryset]
+    return [queryset.using(alias) for alias in SHARDS]
+
+
+# ------------------------------------------------------------------------------------------------------------ 路由
+class UserShardRouter:
+    def _db(self, model, hints):
+        if not enabled():
+            return None
+        label = model._meta.label_lower
+        if label == LOOKUP:
+            return "default"
+        instance = hints.get("instance")
+        if instance is not None and instance._meta.label_lower == "account.user":
+            return shard_of(instance)  # 包括 user.roles 等以用户为起点的关联查询（目录表已广播）
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        if enabled() and model._meta.label_lower in CATALOG:
+            return "default"  # 目录表只在默认库写入，分片上的副本由 replicate() 维护
+        return self._db(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if enabled() and {obj1._meta.label_lower, obj2._meta.label_lower} & SHARDED:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if enabled() and app_label == "account" and model_name == "userlookup":
+            return db == "default"
+        return None
+
+
+def sharded_reverse_manager(base):
+    """
+    role.users / system.users 关联管理器：写入时的路由提示只有角色 / 系统实例，无法定位关联行所在分片，
+    启用分片时 add / remove / clear / set 改为逐个用户调用 user.roles / user.systems（按用户所在分片路由）
+    """
+
+    class ShardedReverseManager(base):
+        def _users(self, objs):
+            from .models import User
+
+            users = []
+            for obj in objs:
+                if not isinstance(obj, User):
+                    obj = User.all_objects.filter(pk=obj).first()  # 按主键定位分片
+                if obj is not None:
+                    users.append(obj)
+            return users
+
+        def _assigned(self):
+            from .models import User
+
+            return [user for qs in each_shard(User.all_objects.filter(**{self.query_field_name: self.instance}))
+                    for user in qs]
+
+        def _forward(self, user):
+            return getattr(user, self.query_field_name)
+
+        def add(self, *objs, through_defaults=None):
+            if not enabled():
+                return super().add(*objs, through_defaults=through_defaults)
+            for user in self._users(objs):
+                self._forward(user).add(self.instance, through_defaults=through_defaults)
+
+        def remove(self, *objs):
+            if not enabled():
+                return super().remove(*objs)
+            for user in self._users(objs):
+                self._forward(user).remove(self.instance)
+
+        def clear(self):
+            if not enabled():
+                return super().clear()
+            self.remove(*self._assigned())
+
+        def set(self, objs, *, clear=False, through_defaults=None):
+            if not enabled():
+                return super().set(objs, clear=clear, through_defaults=through_defaults)
+            users = {user.pk: user for user in self._users(objs)}
+            self.remove(*[user for user in self._assigned() if clear or user.pk not in users])
+            self.add(*users.values(), through_defaults=through_defaults)
+
+    return ShardedReverseManager
+
+
+def install_reverse_managers():
+    from .models import User
+
+    for field in (User._meta.get_field("roles"), User._meta.get_field("systems")):
+        descriptor = getattr(field.related_model, field.remote_field.get_accessor_name())
+        descriptor.__dict__["related_manager_cls"] = sharded_reverse_manager(descriptor.related_manager_cls)
+
+
+# ------------------------------------------------------------------------------------------------------------ 唯一性
+def _lookup_keys(values):
+    return {_key(field, values[field]): field for field in LOOKUP_FIELDS if values.get(field)}
+
+
+def reserve(user):
+    """写入用户前占位新的唯一值；被其他用户占用时抛出 ValidationError"""
+    from .models import User, UserLookup
+
+    shard = shard_of(user)
+    old = {}
+    if not user._state.adding:
+        old = User.all_objects.using(shard).filter(pk=user.pk).values(*LOOKUP_FIELDS).first() or {}
+    new_keys = _lookup_keys({field: getattr(user, field) for field in LOOKUP_FIELDS})
+    old_keys = _lookup_keys(old)
+    user._lookup_released = [key for key in old_keys if key not in new_keys]
+    for key, field in new_keys.items():
+        if key in old_keys:
+            continue
+        try:
+            with transaction.atomic(using="default"):
+                UserLookup.objects.create(key=key, unified_uuid=user.unified_uuid, shard=shard)
+        except IntegrityError:
+            owner = UserLookup.objects.get(key=key)
+            if owner.unified_uuid == user.unified_uuid:
+                continue
+            value = key.split(":", 1)[1]
+            if User.all_objects.using(owner.shard).filter(unified_uuid=owner.unified_uuid, **{field: value}).exists():
+                raise ValidationError({field: f"{field} 已存在"})
+            # 占位已失效（写入分片失败或值已修改但未释放）：接管
+            UserLookup.objects.filter(key=key, unified_uuid=owner.unified_uuid).update(
+                unified_uuid=user.unified_uuid, shard=shard)
+
+
+def release(keys):
+    from .models import UserLookup
+
+    if keys:
+        UserLookup.objects.filter(key__in=keys).delete()
+
+
+def user_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not enabled() or raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(LOOKUP_FIELDS):
+        return  # 只更新了非唯一字段（如软删除、last_login）
+    reserve(instance)
+
+
+def user_post_save(sender, instance, raw=False, **kwargs):
+    if enabled() and not raw:
+        release(instance.__dict__.pop("_lookup_released", []))
+
+
+def user_post_delete(sender, instance, **kwargs):
+    if enabled():
+        release(list(_lookup_keys({field: getattr(instance, field) for field in LOOKUP_FIELDS})))
+        _pk_shards.pop(instance.pk, None)
+
+
+# ------------------------------------------------------------------------------------------------------------ 目录广播
+def replicate(model, pks):
+    """把默认库中的目录行复制到各分片（不存在的行在分片上删除），角色同时同步其权限关联"""
+    from .models import Role
+
+    pks = list(pks)
+    rows = {obj.pk: obj for obj in model.all_objects.using("default").filter(pk__in=pks)}
+    links = []
+    if model is Role:
+        through = Role.permissions.through
+        links = list(through.objects.using("default").filter(role_id__in=pks))
+    for alias in SHARDS:
+        if alias == "default":
+            continue
+        with transaction.atomic(using=alias):
+            model.all_objects.using(alias).filter(pk__in=[pk for pk in pks if pk not in rows]).delete()
+            for obj in rows.values():
+                obj.save_base(using=alias, raw=True)
+            if model is Role:
+                through.objects.using(alias).filter(role_id__in=pks).delete()
+                through.objects.using(alias).bulk_create(
+                    [through(role_id=link.role_id, custompermission_id=link.custompermission_id) for link in links])
+
+
+def catalog_changed(sender, instance, using=None, raw=False, **kwargs):
+    if enabled() and using == "default" and not raw:  # 忽略复制到分片时产生的信号
+        transaction.on_commit(lambda: replicate(type(instance), [instance.pk]), using="default")
+
+
+def role_permissions_changed(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if not enabled() or using != "default" or action not in ("post_add", "post_remove", "post_clear"):
+        return
+    from .models import Role
+
+    if not reverse:
+        pks = [instance.pk]
+    else:
+        pks = pk_set or Role.all_objects.using("default").values_list("pk", flat=True)
+    transaction.on_commit(lambda: replicate(Role, pks), using="default")
+
+
+def sync_catalog():
+    """全量复制目录表到各分片，返回 {模型: 行数}"""
+    from .models import CustomPermission, Role, System
+
+    result = {}
+    for model in (System, CustomPermission, Role):  # 按外键依赖顺序
+        pks = list(model.all_objects.using("default").values_list("pk", flat=True))
+        for start in range(0, len(pks), 500):
+            replicate(model, pks[start:start + 500])
+        result[model._meta.label] = len(pks)
+    return result
+
+
+def connect_signals():
+    from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+    from .models import CustomPermission, Role, System, User
+
+    pre_save.connect(user_pre_save, sender=User, dispatch_uid="sharding_user_pre_save")
+    post_save.connect(user_post_save, sender=User, dispatch_uid="sharding_user_post_save")
+    post_delete.connect(user_post_delete, sender=User, dispatch_uid="sharding_user_post_delete")
+    for model in (System, Role, CustomPermission):
+        post_save.connect(catalog_changed, sender=model, dispatch_uid=f"sharding_{model.__name__}_save")
+        post_delete.connect(catalog_changed, sender=model, dispatch_uid=f"sharding_{model.__name__}_delete")
+    m2m_changed.connect(role_permissions_changed, sender=Role.permissions.through,
+                        dispatch_uid="sharding_role_permissions")
+
+
+@checks.register(checks.Tags.database)
+def check_shards(app_configs=None, **kwargs):
+    errors = []
+    for alias in SHARDS:
+        config = settings.DATABASES.get(alias)
+        if config is None:
+            errors.append(checks.Error(f"ACCOUNT_USER_SHARDS 中的 {alias} 未在 DATABASES 中配置", id="account.E001"))
+        elif "mysql" in config["ENGINE"] and "foreign_key_checks" not in config.get("OPTIONS", {}).get(
+                "init_command", ""):
+            errors.append(checks.Warning(
+                f"分片库 {alias} 未关闭外键检查，跨分片的 created_by / 角色关联写入会失败",
+                hint='OPTIONS = {"init_command": "SET foreign_key_checks = 0"}', id="account.W001"))
+    return errors
+
+
+# ------------------------------------------------------------------------------------------------------------ 列表
+def _compare(ordering):
+    fields = [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+
+    def compare(a, b):
+        for name, descending in fields:
+            x, y = getattr(a, name), getattr(b, name)
+            if x == y:
+                continue
+            if x is None or y is None:
+                less = x is None  # None 视为最小
+            else:
+                less = x < y
+            return (1 if less else -1) if descending else (-1 if less else 1)
+        return 0
+
+    return functools.cmp_to_key(compare)
+
+
+class ScatterGather:
+    """
+    跨分片的只读查询集（供分页与条件请求使用）：
+    切片 [a:b] 时每个分片按相同排序取前 b 行，再归并取 [a:b]；count / 聚合各分片分别计算后合并
+    """
+    ordered = True
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.model = queryset.model
+        self.ordering = [str(name) for name in (queryset.query.order_by or self.model._meta.ordering)]
+
+    def _merge(self, stop=None):
+        parts = [list(qs if stop is None else qs[:stop]) for qs in each_shard(self.queryset)]
+        if not self.ordering:
+            return itertools.chain(*parts)
+        return heapq.merge(*parts, key=_compare(self.ordering))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop = item.start or 0, item.stop
+            return list(itertools.islice(self._merge(stop), start, stop))
+        return list(itertools.islice(self._merge(item + 1), item, item + 1))[0]
+
+    def __iter__(self):
+        return iter(self._merge())
+
+    def __len__(self):
+        return self.count()
+
+    def count(self):
+        return sum(qs.count() for qs in each_shard(self.queryset))
+
+    def order_by(self, *fields):
+        return ScatterGather(self.queryset.order_by(*fields))
+
+    def filter(self, *args, **kwargs):
+        return ScatterGather(self.queryset.filter(*args, **kwargs))
+
+    def aggregate(self, *args, **kwargs):
+        """支持 Max / Min / Count / Sum"""
+        exprs = {**{arg.default_alias: arg for arg in args}, **kwargs}
+        parts = [qs.aggregate(**exprs) for qs in each_shard(self.queryset)]
+        result = {}
+        for name, expr in exprs.items():
+            values = [part[name] for part in parts if part[name] is not None]
+            if expr.name in ("Count", "Sum"):
+                result[name] = sum(values)
+            else:
+                result[name] = (max if expr.name == "Max" else min)(values) if values else None
+        return result
+
+
+def scatter(queryset):
+    """未启用分片时原样返回"""
+    return ScatterGather(queryset) if enabled() else queryset
+
+
+class ScatterGatherListMixin:
+    """User 列表视图：过滤后的查询集改为跨分片执行"""
+
+    def filter_queryset(self, queryset):
+        return scatter(super().filter_queryset(queryset))
@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from utensil.archive import row_restored
+from utensil import request_scope
+from utensil.cache_bus import bus
+from . import permission_snapshot
+from .models import CustomPermission, Role, System, User
+
+# ✅ 模型 → 失效命名空间
+NAMESPACES = {
+    System: "system",
+    Role: "role",
+    CustomPermission: "permission",
+    User: "user",
+}
+
+
+def publish_on_commit(namespace, keys=None):
+    """事务提交后再发布，避免其他 worker 读到未提交的数据"""
+    if namespace in permission_snapshot.SNAPSHOT_NAMESPACES:
+        # 提交回调按登记顺序执行：先更新代数，其他进程收到事件后才会重建快照
+        transaction.on_commit(permission_snapshot.bump_generation)
+    bus.publish_on_commit(namespace, keys)
+
+
+@receiver(post_save, sender=System)
+@receiver(post_save, sender=Role)
+@receiver(post_save, sender=CustomPermission)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=System)
+@receiver(post_delete, sender=Role)
+@receiver(post_delete, sender=CustomPermission)
+@receiver(post_delete, sender=User)
+def model_changed(sender, instance, **kwargs):
+    if sender is User:
+        publish_on_commit("user", [instance.pk, instance.unified_uuid])
+    else:
+        publish_on_commit(NAMESPACES[sender], [instance.pk])
+
+
+def user_keys(pks):
+    """user 事件同时携带 uuid 与 unified_uuid（外部客户端按 unified_uuid 缓存）"""
+    if pks is None:
+        return None
+    pks = list(pks)
+    return pks + list(User.all_objects.filter(pk__in=pks).values_list("unified_uuid", flat=True))
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def role_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """角色 ↔ 权限：失效受影响的角色"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        publish_on_commit("role", [instance.pk])
+    else:
+        publish_on_commit("role", pk_set)  # post_clear 时 pk_set 为 None → 整个命名空间失效
+
+
+@receiver(m2m_changed, sender=User.roles.through)
+@receiver(m2m_changed, sender=User.systems.through)
+def user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """用户 ↔ 角色 / 系统：失效受影响的用户"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        publish_on_commit("user", [instance.pk, instance.unified_uuid])
+    else:
+        publish_on_commit("user", user_keys(pk_set))
+
+
+# ✅ 关联表变化不会修改主表，刷新拥有方的 update_at，增量同步（utensil.sync）才能感知
+SYNCED_RELATIONS = {
+    Role.permissions.through: Role.permissions.field,
+    User.roles.through: User.roles.field,
+}
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+@receiver(m2m_changed, sender=User.roles.through)
+def touch_relation_owners(sender, instance, action, reverse, pk_set, **kwargs):
+    field = SYNCED_RELATIONS[sender]
+    if reverse and action == "pre_clear":  # post_clear 时 pk_set 为空，先记下受影响的拥有方
+        instance._cleared_owner_pks = list(sender.objects.filter(
+            **{f"{field.m2m_reverse_field_name()}_id": instance.pk}
+        ).values_list(f"{field.m2m_field_name()}_id", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        pks = [instance.pk]
+    elif action == "post_clear":
+        pks = instance.__dict__.pop("_cleared_owner_pks", [])
+    else:
+        pks = pk_set
+    if pks:
+        field.model.all_objects.filter(pk__in=pks).update(update_at=timezone.now())
+
+
+# ✅ 本请求内的写入立即清空请求级记忆化（不等事务提交），后续读取能看到自己的修改
+@receiver(post_save, sender=Role)
+@receiver(post_save, sender=CustomPermission)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Role)
+@receiver(post_delete, sender=CustomPermission)
+@receiver(post_delete, sender=User)
+@receiver(m2m_changed, sender=Role.permissions.through)
+@receiver(m2m_changed, sender=User.roles.through)
+def clear_request_scope(sender, **kwargs):
+    request_scope.clear()
+
+
+@receiver(row_restored)
+def archive_restored(sender, instance, **kwargs):
+    """从归档表恢复时关联表被批量还原：失效该模型与全部用户缓存"""
+    if sender in NAMESPACES:
+        publish_on_commit(NAMESPACES[sender], [instance.pk])
+        publish_on_commit("user")
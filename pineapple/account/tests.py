@@ -1,3 +1,1246 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from asgiref.sync import async_to_sync
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.http import http_date
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.settings import DEFAULTS, APISettings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from utensil import archive, request_scope, response_cache, sync, write_behind
+from utensil.serializers import insert_or_get
+from utensil.models import BackfillCheckpoint
+from utensil.online_migrations import Backfill
+from utensil.cache_bus import bus
+from utensil.testing import RedisTestMixin
+from . import authentication, hashing, permission_engine, permission_snapshot, realtime, sharding, token_blacklist
+from .CustomPermissionMiddleware import CustomPermissionMiddleware
+from .hashing import TunedPBKDF2PasswordHasher
+from .models import CustomPermission, Role, RoleArchive, System, User, UserLookup
+from .permissions import SERVICE_PERMISSION
+from .serializers import LoginProfileSerializer, RoleListRetrieveSerializer, SystemListRetrieveSerializer, UserSerializer
+from .throttling import ServiceCallerThrottle
+from .user_cache import _profile_cache, profiles
+from .views import AuthorizeView, SystemListView
+from .wildcards import PermissionMatcher, WildcardTrie, validate_code
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class AccountTestCase(RedisTestMixin, TestCase):
+    """权限快照写入临时目录，不与本机运行中的服务共用 /dev/shm 下的文件；密码使用快速哈希"""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.snapshot_path = os.path.join(tmp.name, "snapshot.bin")
+        patcher = mock.patch.object(permission_snapshot, "SNAPSHOT_PATH", self.snapshot_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+# ------------------------------------------------------------------------------------------------------------ 失效事件
+class InvalidationSignalTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(bus, "publish")
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def published(self):
+        return [c.args for c in self.publish.call_args_list]
+
+    def test_publish_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            system = System.objects.create(system_name="A", system_code="a")
+        self.publish.assert_not_called()
+        for callback in callbacks:
+            callback()
+        self.assertIn(("system", [system.pk]), self.published())
+
+    def test_user_event_carries_both_identifiers(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(email="u@example.com", password="x")
+        self.assertIn(("user", [user.pk, user.unified_uuid]), self.published())
+
+    def test_relation_changes_invalidate_owner(self):
+        role = Role.objects.create(role_name="editor")
+        permission = CustomPermission.objects.create(permission_name="查看", permission_code="doc.view")
+        user = User.objects.create_user(email="u@example.com", password="x")
+        self.publish.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            role.permissions.add(permission)
+            user.roles.add(role)
+        self.assertIn(("role", [role.pk]), self.published())
+        self.assertIn(("user", [user.pk, user.unified_uuid]), self.published())
+
+
+# ------------------------------------------------------------------------------------------------------------ 共享快照
+class PermissionSnapshotTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = self.snapshot_path
+        self.system = System.objects.create(system_name="A", system_code="a")
+        self.view = CustomPermission.objects.create(permission_name="查看", permission_code="doc.view")
+        self.edit = CustomPermission.objects.create(permission_name="编辑", permission_code="doc.edit")
+        self.role = Role.objects.create(role_name="editor", system=self.system)
+        self.role.permissions.add(self.view, self.edit)
+        self.disabled = Role.objects.create(role_name="disabled", is_enable=False)
+        self.disabled.permissions.add(self.view)
+
+    def test_round_trip(self):
+        permission_snapshot.write_snapshot(7, self.path)
+        snapshot = permission_snapshot.PermissionSnapshot(self.path)
+        self.assertEqual(snapshot.generation, 7)
+        i = snapshot.role_index(self.role.pk)
+        self.assertEqual(snapshot.role_uuid(i), self.role.pk)
+        self.assertEqual(snapshot.system_code(snapshot.role_system(i)), "a")
+        self.assertEqual(sorted(snapshot.perm_code(p) for p in snapshot.role_perm_ids(i)), ["doc.edit", "doc.view"])
+        self.assertIsNone(snapshot.role_system(snapshot.role_index(self.disabled.pk)))
+        self.assertIsNone(snapshot.perm_index("doc.missing"))
+
+    def test_grants_respect_enabled_and_deleted_flags(self):
+        permission_snapshot.write_snapshot(1, self.path)
+        snapshot = permission_snapshot.PermissionSnapshot(self.path)
+        self.assertTrue(snapshot.roles_grant([self.role.pk], "doc.view"))
+        self.assertFalse(snapshot.roles_grant([self.disabled.pk], "doc.view"))
+
+        self.edit.soft_delete()
+        permission_snapshot.write_snapshot(2, self.path)
+        snapshot = permission_snapshot.PermissionSnapshot(self.path)
+        self.assertFalse(snapshot.roles_grant([self.role.pk], "doc.edit"))
+
+    def test_load_rebuilds_when_generation_changes(self):
+        first = permission_snapshot._load(1, self.path)
+        self.assertEqual(first.generation, 1)
+        self.assertEqual(permission_snapshot._load(1, self.path).generation, 1)
+
+        self.role.permissions.remove(self.view)
+        self.assertTrue(first.roles_grant([self.role.pk], "doc.view"))  # 已映射的旧快照不受影响
+        second = permission_snapshot._load(2, self.path)
+        self.assertEqual(second.generation, 2)
+        self.assertFalse(second.roles_grant([self.role.pk], "doc.view"))
+
+    def test_corrupt_file_is_rebuilt(self):
+        with open(self.path, "wb") as f:
+            f.write(b"garbage")
+        self.assertEqual(permission_snapshot._load(3, self.path).generation, 3)
+
+    def test_current_follows_redis_generation(self):
+        with mock.patch.object(bus, "ensure_started", return_value=True):
+            first = permission_snapshot.current()
+            self.assertIs(permission_snapshot.current(), first)
+            permission_snapshot.bump_generation()
+            bus._evict("role", None)  # 失效事件到达
+            self.assertEqual(permission_snapshot.current().generation, first.generation + 1)
+
+    def test_generation_does_not_restart_after_redis_flush(self):
+        """Redis 清空后代数不能从 0 / 1 重新计数，否则会命中旧的快照文件"""
+        permission_snapshot.write_snapshot(1, self.path)  # 上一次 Redis 生命周期留下的快照
+        self.redis.flushall()
+        permission_snapshot.bump_generation()
+        self.assertGreater(permission_snapshot._generation(self.redis), 1)
+        with mock.patch.object(bus, "ensure_started", return_value=True):
+            self.assertEqual(permission_snapshot.current().generation, permission_snapshot._generation(self.redis))
+
+
+# ------------------------------------------------------------------------------------------------------------ 位图引擎
+class PermissionEngineTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "snapshot.bin")
+        self.system = System.objects.create(system_name="A", system_code="a")
+        self.other = System.objects.create(system_name="B", system_code="b")
+        self.perms = {code: CustomPermission.objects.create(permission_name=code, permission_code=code)
+                      for code in ("doc.view", "doc.edit", "doc.delete", "report.*")}
+        self.reader = Role.objects.create(role_name="reader")
+        self.reader.permissions.add(self.perms["doc.view"])
+        self.editor = Role.objects.create(role_name="editor", system=self.system)
+        self.editor.permissions.add(self.perms["doc.edit"], self.perms["report.*"])
+        self.foreign = Role.objects.create(role_name="foreign", system=self.other)
+        self.foreign.permissions.add(self.perms["doc.delete"])
+
+    def engine(self):
+        permission_snapshot.write_snapshot(1, self.path)
+        return permission_engine.PermissionEngine(permission_snapshot.PermissionSnapshot(self.path))
+
+    def test_truncated_snapshot_raises_value_error(self):
+        permission_snapshot.write_snapshot(1, self.path)
+        size = os.path.getsize(self.path)
+        for keep in (size - 1, size // 2):
+            with open(self.path, "r+b") as f:
+                f.truncate(keep)
+            with self.assertRaises(ValueError):
+                permission_snapshot.PermissionSnapshot(self.path)
+
+    def test_or_and_logic(self):
+        engine = self.engine()
+        roles = [self.reader.pk, self.editor.pk]
+        self.assertTrue(engine.check(roles, ["doc.view", "doc.delete"], "OR"))
+        self.assertFalse(engine.check(roles, ["doc.view", "doc.delete"], "AND"))
+        self.assertTrue(engine.check(roles, ["doc.view", "doc.edit"], "AND"))
+
+    def test_wildcard_expands_to_catalog_and_matches_outside_codes(self):
+        report = CustomPermission.objects.create(permission_name="r", permission_code="report.export")
+        engine = self.engine()
+        self.assertTrue(engine.has([self.editor.pk], report.permission_code))  # 目录内：编译期展开到位图
+        self.assertTrue(engine.has([self.editor.pk], "report.sales.view"))  # 目录外：前缀树
+        self.assertFalse(engine.has([self.reader.pk], "report.sales.view"))
+
+    def test_deleted_permission_fails_and_logic(self):
+        self.perms["doc.edit"].soft_delete()
+        engine = self.engine()
+        self.assertFalse(engine.check([self.editor.pk], ["doc.edit"], "AND"))
+        self.assertFalse(engine.has([self.editor.pk], "doc.edit"))
+
+    def test_system_scope(self):
+        engine = self.engine()
+        roles = [self.reader.pk, self.editor.pk, self.foreign.pk]
+        self.assertTrue(engine.check(roles, ["doc.delete"], system_code="b"))
+        self.assertFalse(engine.check(roles, ["doc.delete"], system_code="a"))
+        self.assertTrue(engine.check(roles, ["doc.view"], system_code="b"))  # 全局角色对所有系统生效
+
+    def test_disabled_role_grants_nothing(self):
+        self.reader.is_enable = False
+        self.reader.save()
+        self.assertFalse(self.engine().has([self.reader.pk], "doc.view"))
+
+    def test_only_global_superadmin_role_is_superadmin(self):
+        scoped = Role.objects.create(role_name="superadmin", system=self.system)
+        engine = self.engine()
+        self.assertFalse(engine.is_superadmin([scoped.pk]))
+        self.assertFalse(engine.has([scoped.pk], "doc.view"))
+        everywhere = Role.objects.create(role_name="superadmin")
+        self.assertTrue(self.engine().is_superadmin([everywhere.pk]))
+
+    def test_check_many(self):
+        result = self.engine().check_many({"u1": [self.reader.pk], "u2": [self.editor.pk]},
+                                          ["doc.view", "doc.edit"], system_code="a")
+        self.assertEqual(result, {"u1": {"doc.view": True, "doc.edit": False},
+                                  "u2": {"doc.view": False, "doc.edit": True}})
+
+
+# ------------------------------------------------------------------------------------------------------------ 软删除唯一性
+class SoftDeletedUniqueTests(AccountTestCase):
+    def test_register_with_email_of_deleted_user_is_rejected(self):
+        User.objects.create_user(email="alice@example.com", password="x").soft_delete()
+        response = self.client.post("/api/account/register/", {"email": "alice@example.com", "password": "x"},
+                                    format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("email", response.json())
+
+    def test_rename_to_code_of_deleted_system_is_rejected(self):
+        System.objects.create(system_name="A", system_code="a").soft_delete()
+        system = System.objects.create(system_name="B", system_code="b")
+        serializer = SystemListRetrieveSerializer(system, data={"system_code": "a"}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("system_code", serializer.errors)
+
+
+# ------------------------------------------------------------------------------------------------------------ 系统角色
+class SystemRoleTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.system = System.objects.create(system_name="A", system_code="a")
+        self.other = System.objects.create(system_name="B", system_code="b")
+
+    def test_role_name_is_unique_per_system(self):
+        Role.objects.create(role_name="editor", system=self.system)
+        Role.objects.create(role_name="editor", system=self.other)
+        Role.objects.create(role_name="editor")
+        for system in (self.system, None):
+            with self.subTest(system=system), self.assertRaises(IntegrityError), transaction.atomic():
+                Role.objects.create(role_name="editor", system=system)
+
+    def test_rename_to_a_taken_name_is_rejected(self):
+        Role.objects.create(role_name="editor", system=self.system)
+        role = Role.objects.create(role_name="viewer", system=self.system)
+        serializer = RoleListRetrieveSerializer(role, data={"role_name": "editor"}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        serializer = RoleListRetrieveSerializer(role, data={"role_name": "editor", "system": "b"}, partial=True)
+        self.assertTrue(serializer.is_valid())
+
+    def test_system_scoped_superadmin_is_not_global(self):
+        user = User.objects.create_user(email="alice@example.com", password="x")
+        user.roles.add(Role.objects.create(role_name="superadmin", system=self.system))
+        with mock.patch.object(permission_engine, "current", return_value=None):
+            self.assertFalse(User.objects.get(pk=user.pk).is_super_admin())
+            self.assertFalse(LoginProfileSerializer(user).data["is_super_admin"])
+            user.roles.add(Role.objects.create(role_name="superadmin"))
+            self.assertTrue(User.objects.get(pk=user.pk).is_super_admin())
+            self.assertTrue(LoginProfileSerializer(User.objects.get(pk=user.pk)).data["is_super_admin"])
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN 输出格式")
+    def test_per_system_query_uses_index_lookups_only(self):
+        user = User.objects.create_user(email="alice@example.com", password="x")
+        role = Role.objects.create(role_name="editor", system=self.system)
+        role.permissions.add(CustomPermission.objects.create(permission_name="查看", permission_code="doc.view"))
+        user.roles.add(role)
+        with mock.patch.object(permission_engine, "current", return_value=None), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertTrue(CustomPermissionMiddleware.check_user_system_permissions(user, "a", ["doc.view"]))
+        sql = next(q["sql"] for q in queries.captured_queries if "account_role_permissions" in q["sql"])
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertFalse([step for step in plan if step.startswith("SCAN")], plan)  # 没有全表扫描
+        # 关联表由 (role_id, custompermission_id) 唯一索引覆盖，其余各表按主键查找
+        self.assertTrue(any(step.startswith("SEARCH account_role_permissions USING COVERING INDEX") for step in plan))
+
+
+# ------------------------------------------------------------------------------------------------------------ 通配符
+class WildcardTests(SimpleTestCase):
+    def test_matching(self):
+        trie = WildcardTrie(["product.*", "*.view", "order.*.export"])
+        self.assertTrue(trie.match("product.sku.edit"))  # 末段 * 覆盖多段
+        self.assertFalse(trie.match("product"))
+        self.assertTrue(trie.match("user.view"))
+        self.assertFalse(trie.match("user.edit"))
+        self.assertTrue(trie.match("order.2024.export"))
+        self.assertFalse(trie.match("order.2024.import"))
+
+    def test_matcher_combines_exact_and_wildcard(self):
+        matcher = PermissionMatcher(["doc.view", "report.*"])
+        self.assertTrue(matcher.check(["doc.view", "report.sales"], "AND"))
+        self.assertFalse(matcher.check(["doc.edit", "report"], "OR"))
+
+    def test_validate_code(self):
+        self.assertEqual(validate_code("product.*"), "product.*")
+        for code in ("product.", "pro*duct.view", "a..b"):
+            with self.assertRaises(ValidationError):
+                validate_code(code)
+
+    def test_transition_memo_is_bounded_by_the_grants(self):
+        trie = WildcardTrie(["product.*.view", "*.edit"])
+        for i in range(1000):
+            trie.match(f"client{i}.item{i}.view")
+        size = len(trie._transitions)
+        for i in range(1000, 2000):
+            trie.match(f"client{i}.item{i}.edit")
+        self.assertEqual(len(trie._transitions), size)
+        self.assertTrue(trie.match("product.any.view"))
+        self.assertTrue(trie.match("anything.edit"))
+
+
+# ------------------------------------------------------------------------------------------------------------ 批量授权
+class AuthorizeViewTests(AccountTestCase):
+    url = "/api/account/authorize/"
+
+    def setUp(self):
+        super().setUp()
+        self.system = System.objects.create(system_name="A", system_code="a")
+        view = CustomPermission.objects.create(permission_name="查看", permission_code="doc.view")
+        service = CustomPermission.objects.create(permission_name="服务账号", permission_code=SERVICE_PERMISSION)
+        self.reader = Role.objects.create(role_name="reader")
+        self.reader.permissions.add(view)
+        service_role = Role.objects.create(role_name="service")
+        service_role.permissions.add(service)
+        self.alice = User.objects.create_user(email="alice@example.com", password="x")
+        self.alice.roles.add(self.reader)
+        self.bob = User.objects.create_user(email="bob@example.com", password="x")
+        self.service = User.objects.create_user(email="svc@example.com", password="x")
+        self.service.roles.add(service_role)
+        self.root = User.objects.create_superuser(email="root@example.com", password="x")
+        self.client = APIClient()
+
+    def post(self, caller, payload):
+        self.client.force_authenticate(caller)
+        return self.client.post(self.url, payload, format="json")
+
+    def test_user_can_check_own_permissions(self):
+        response = self.post(self.alice, {"unified_uuid": self.alice.unified_uuid, "system_code": "a",
+                                          "permissions": ["doc.view"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["data"]["allowed"])
+
+    def test_user_cannot_check_other_users(self):
+        response = self.post(self.bob, {"unified_uuid": self.alice.unified_uuid, "system_code": "a",
+                                        "permissions": ["doc.view"]})
+        self.assertEqual(response.status_code, 403)
+        response = self.post(self.bob, {"system_code": "a", "checks": [
+            [self.bob.unified_uuid, "doc.view"], [self.alice.unified_uuid, "doc.view"]]})
+        self.assertEqual(response.status_code, 403)
+
+    def test_service_and_superuser_can_check_anyone(self):
+        for caller in (self.service, self.root):
+            response = self.post(caller, {"system_code": "a", "checks": [
+                [self.alice.unified_uuid, "doc.view"], [self.bob.unified_uuid, "doc.view"]]})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([d["allowed"] for d in response.data["data"]["decisions"]], [True, False])
+
+    def test_service_callers_have_their_own_throttle_scope(self):
+        throttle = ServiceCallerThrottle()
+        for caller, scope in ((self.service, "service"), (self.alice, "user")):
+            request = APIRequestFactory().post(self.url)
+            request.user = caller
+            self.assertEqual(throttle.get_scope(request, AuthorizeView()), scope)
+
+    def test_unified_uuid_map_is_bounded(self):
+        with mock.patch.object(permission_engine, "_UNIFIED_TO_PK_MAX", 2):
+            permission_engine.resolve_users([self.alice.unified_uuid, self.bob.unified_uuid])
+            permission_engine.resolve_users([self.root.unified_uuid])
+            self.assertEqual(set(permission_engine._unified_to_pk), {self.root.unified_uuid})
+
+    def test_deleted_system_denies_superadmin_on_both_paths(self):
+        self.system.soft_delete()
+        checks = {self.root.unified_uuid: ["doc.view"], self.alice.unified_uuid: ["doc.view"]}
+        expected = {uid: {"doc.view": False} for uid in checks}
+        with mock.patch.object(permission_engine, "current", return_value=None):
+            self.assertEqual(permission_engine.authorize(checks, "a"), expected)
+        with mock.patch.object(bus, "ensure_started", return_value=True):
+            self.assertIsNotNone(permission_engine.current())
+            self.assertEqual(permission_engine.authorize(checks, "a"), expected)
+
+
+# ------------------------------------------------------------------------------------------------------------ 创建接口
+class CreateConflictTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = User.objects.create_superuser(email="root@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.root)
+        System.objects.create(system_name="A", system_code="a")
+        System.objects.create(system_name="B", system_code="b")
+
+    def test_new_row_is_created(self):
+        response = self.client.post("/api/account/role/create/", {"role_name": "editor", "system": "a"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Role.objects.get(role_name="editor").system.system_code, "a")
+
+    def test_same_role_name_in_another_system_is_a_new_role(self):
+        Role.objects.create(role_name="editor", system=System.objects.get(system_code="a"))
+        response = self.client.post("/api/account/role/create/", {"role_name": "editor", "system": "b"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Role.objects.filter(role_name="editor").count(), 2)
+
+    def test_identical_repeat_returns_existing_row(self):
+        payload = {"permission_name": "查看", "permission_code": "doc.view"}
+        first = self.client.post("/api/account/permission/create/", payload, format="json")
+        second = self.client.post("/api/account/permission/create/", payload, format="json")
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(CustomPermission.all_objects.filter(permission_code="doc.view").count(), 1)
+
+    def test_conflicting_fields_are_rejected_and_not_overwritten(self):
+        permission = CustomPermission.objects.create(permission_name="查看", permission_code="doc.view")
+        response = self.client.post("/api/account/permission/create/",
+                                    {"permission_name": "编辑", "permission_code": "doc.view"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        permission.refresh_from_db()
+        self.assertEqual(permission.permission_name, "查看")
+
+    def test_soft_deleted_row_is_not_restored(self):
+        role = Role.objects.create(role_name="editor", system=System.objects.get(system_code="a"))
+        alice = User.objects.create_user(email="alice@example.com", password="x")
+        alice.roles.add(role)
+        role.soft_delete()
+        response = self.client.post("/api/account/role/create/", {"role_name": "editor", "system": "a"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        role.refresh_from_db()
+        self.assertTrue(role.is_deleted)
+        self.assertEqual(User.objects.get(pk=alice.pk).all_roles, [])  # 旧的授权没有随之恢复
+
+    def test_insert_is_a_single_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            insert_or_get(CustomPermission, {"permission_name": "查看", "permission_code": "doc.view"},
+                          ("permission_code",))
+        writes = [q["sql"] for q in queries if not q["sql"].startswith(("SELECT", "SAVEPOINT", "RELEASE"))]
+        self.assertEqual(len(writes), 1)
+        self.assertIn("ON CONFLICT DO NOTHING", writes[0])
+
+    def test_conflict_on_another_unique_column_is_a_validation_error(self):
+        existing = CustomPermission.objects.create(permission_name="查看", permission_code="doc.view")
+        with self.assertRaises(ValidationError):
+            insert_or_get(CustomPermission, {"uuid": existing.pk, "permission_name": "编辑",
+                                             "permission_code": "doc.edit"}, ("permission_code",))
+
+    def test_non_unique_errors_are_not_swallowed(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            insert_or_get(CustomPermission, {"permission_name": None, "permission_code": "doc.view"},
+                          ("permission_code",))
+
+
+# ------------------------------------------------------------------------------------------------------------ 响应缓存
+class ResponseCacheTests(AccountTestCase):
+    url = "/api/account/systems/list/"
+
+    def setUp(self):
+        super().setUp()
+        self.root = User.objects.create_superuser(email="root@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.root)
+
+    def codes(self):
+        return [item["system_code"] for item in self.client.get(self.url).json()["data"]["results"]]
+
+    def test_tags_registered_without_importing_views(self):
+        script = ("import sys, django; django.setup(); from utensil import response_cache; "
+                  "print('account.views' in sys.modules, sorted(response_cache._tagged))")
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                cwd=settings.BASE_DIR).stdout  # 新进程：只执行 AppConfig.ready()，不加载路由与视图
+        self.assertTrue(output.startswith("False"), output)
+        self.assertIn("account.system", output)
+
+    def test_write_invalidates_cached_list(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            System.objects.create(system_name="A", system_code="a")
+        self.assertEqual(self.codes(), ["a"])
+        with mock.patch.object(SystemListView, "list", side_effect=AssertionError("未命中缓存")):
+            self.assertEqual(self.codes(), ["a"])
+        with self.captureOnCommitCallbacks(execute=True):
+            System.objects.create(system_name="B", system_code="b")
+        self.assertEqual(self.codes(), ["b", "a"])
+        self.assertEqual(int(self.redis.get("rc:tag:account.system")), 2)
+
+    def test_cache_hit_answers_conditional_requests_without_queries(self):
+        System.objects.create(system_name="A", system_code="a")
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response["ETag"]), (200, etag))
+
+    def test_unregistered_tag_is_rejected(self):
+        with mock.patch.object(SystemListView, "cache_tags", ("account.userlookup",)):
+            with self.assertRaises(ImproperlyConfigured):
+                self.client.get(self.url)
+
+
+# ------------------------------------------------------------------------------------------------------------ 条件请求
+class ConditionalGetTests(AccountTestCase):
+    url = "/api/account/systems/list/"
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(email="root@example.com", password="x"))
+        self.a = System.objects.create(system_name="A", system_code="a")
+        self.b = System.objects.create(system_name="B", system_code="b")
+
+    def test_list_sends_etag_only(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.soft_delete()  # 不是最新的行：max(update_at) 不变
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_same_second_update_is_not_reported_unmodified(self):
+        url = f"/api/account/systems/{self.b.pk}/"
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            System.objects.filter(pk=self.b.pk).update(system_name="B2", update_at=self.b.update_at + timedelta(microseconds=1))
+            response_cache.invalidate(["account.system"])  # update() 不发送信号
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)).status_code, 200)
+
+
+# ------------------------------------------------------------------------------------------------------------ 写回缓冲
+class WriteBehindTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email="alice@example.com", password="x")
+        patcher = mock.patch.object(write_behind, "_ensure_flusher")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flush_writes_buffered_values(self):
+        when = timezone.now()
+        write_behind.touch(User, self.user.pk, "last_login", when)
+        self.assertEqual(write_behind.pending(User, self.user.pk, "last_login"), when)
+        self.assertEqual(write_behind.flush(), 1)
+        self.assertEqual(User.objects.get(pk=self.user.pk).last_login, when)
+        self.assertIsNone(write_behind.pending(User, self.user.pk, "last_login"))
+        self.assertFalse(self.redis.exists(write_behind.LOCK_KEY))
+
+    def test_expired_lock_taken_over_is_not_released(self):
+        write_behind.touch(User, self.user.pk, "last_login")
+        real_key = write_behind._key
+
+        def lock_taken_over(model, field):  # 模拟刷新超过锁有效期，其他进程已取得锁
+            self.redis.set(write_behind.LOCK_KEY, "other")
+            return real_key(model, field)
+
+        with mock.patch.object(write_behind, "_key", lock_taken_over):
+            write_behind.flush()
+        self.assertEqual(self.redis.get(write_behind.LOCK_KEY), b"other")
+
+    def test_flush_skipped_while_locked(self):
+        self.redis.set(write_behind.LOCK_KEY, "other")
+        write_behind.touch(User, self.user.pk, "last_login")
+        self.assertEqual(write_behind.flush(), 0)
+
+
+# ------------------------------------------------------------------------------------------------------------ 密码哈希
+class PasswordHasherTests(SimpleTestCase):
+    def encoded(self, iterations):
+        return f"pbkdf2_sha256${iterations}${get_random_string(22)}$hash"
+
+    def test_iterations_never_below_django_default(self):
+        self.assertGreaterEqual(TunedPBKDF2PasswordHasher.iterations, PBKDF2PasswordHasher.iterations)
+
+    def test_only_weaker_hashes_are_upgraded(self):
+        hasher = TunedPBKDF2PasswordHasher()
+        self.assertTrue(hasher.must_update(self.encoded(hasher.iterations - 1)))
+        self.assertFalse(hasher.must_update(self.encoded(hasher.iterations)))
+        self.assertFalse(hasher.must_update(self.encoded(hasher.iterations * 2)))  # 不降级
+        self.assertTrue(hasher.must_update(f"pbkdf2_sha256${hasher.iterations}$short$hash"))  # 盐熵不足
+
+
+class HashingPoolTests(SimpleTestCase):
+    def test_saturated_pool_is_throttled(self):
+        pool = hashing.HashingPool(workers=1, queue=0, timeout=0.01)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=pool.run, args=(block,))
+        worker.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(Throttled):
+                pool.run(lambda: None)
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(pool.run(lambda: 42), 42)  # 完成后释放名额
+
+    @override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher",
+                                         "django.contrib.auth.hashers.PBKDF2PasswordHasher"])
+    def test_verify_rehashes_outdated_hashes(self):
+        outdated = PBKDF2PasswordHasher().encode("secret", get_random_string(22), iterations=1000)
+        self.assertEqual(hashing.verify("wrong", outdated), (False, None))
+        valid, rehashed = hashing.verify("secret", outdated)
+        self.assertTrue(valid)
+        self.assertTrue(rehashed.startswith("md5$"))
+        self.assertEqual(hashing.verify("secret", rehashed), (True, None))
+
+    def test_bench_login_reports_failed_checks(self):
+        with mock.patch("django.contrib.auth.hashers.check_password", return_value=False), \
+                self.assertRaisesMessage(CommandError, "4/4 次密码校验失败"):
+            call_command("bench_login", count=4, concurrency=2, iterations=[1000], stdout=StringIO())
+
+
+# ------------------------------------------------------------------------------------------------------------ 验签公钥
+class JWTPublicKeyTests(AccountTestCase):
+    url = "/api/account/jwt/public-key/"
+
+    def jwt_settings(self, **overrides):
+        return mock.patch.object(authentication, "api_settings", APISettings({**settings.SIMPLE_JWT, **overrides}, DEFAULTS))
+
+    def test_symmetric_signing_does_not_publish_a_key(self):
+        with self.jwt_settings(ALGORITHM="HS256", VERIFYING_KEY=""):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+            self.assertEqual([e.id for e in authentication.check_signing_algorithm()], ["account.W002"])
+
+    def test_publishes_public_key_only(self):
+        with self.jwt_settings(ALGORITHM="RS256", SIGNING_KEY="PRIVATE", VERIFYING_KEY="PUBLIC"):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["data"], {"algorithm": "RS256", "public_key": "PUBLIC"})
+            self.assertNotIn("PRIVATE", response.content.decode())
+            self.assertEqual(authentication.check_signing_algorithm(), [])
+
+
+# ------------------------------------------------------------------------------------------------------------ Token 黑名单
+class TokenBlacklistTests(RedisTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(bus, "ensure_started", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.exp = time.time() + 3600
+
+    def test_revoked_token_is_found_and_others_skip_redis(self):
+        token_blacklist.revoke("revoked", self.exp)
+        self.assertTrue(token_blacklist.is_revoked("revoked", self.exp))
+        with mock.patch.object(self.redis.__class__, "exists") as exists:
+            self.assertFalse(token_blacklist.is_revoked("fresh", self.exp))
+        exists.assert_not_called()
+
+    def test_sync_failure_falls_back_to_exists(self):
+        self.redis.set("jwt:blacklist:other-worker", 1)  # 其他 worker 吊销，本地位图未收到
+        with mock.patch.object(token_blacklist.front, "sync", side_effect=ConnectionError("down")):
+            self.assertTrue(token_blacklist.is_revoked("other-worker", self.exp))
+            self.assertFalse(token_blacklist.is_revoked("fresh", self.exp))
+
+    def test_version_gap_distrusts_local_filter(self):
+        self.assertFalse(token_blacklist.is_revoked("lost", self.exp))  # 拉取一次，本地位图可信
+        self.redis.set("jwt:blacklist:lost", 1)  # 吊销消息丢失
+        with mock.patch.object(bus, "in_sync", return_value=False):
+            self.assertTrue(token_blacklist.is_revoked("lost", self.exp))
+
+    def test_lost_message_notice_forces_resync(self):
+        self.assertFalse(token_blacklist.is_revoked("lost", self.exp))
+        token_blacklist.revoke("lost", self.exp)
+        token_blacklist.front._days.clear()  # 模拟本进程未收到吊销
+        token_blacklist.front.evict(None)
+        self.assertTrue(token_blacklist.is_revoked("lost", self.exp))
+
+    def test_unreachable_redis_rejects_instead_of_erroring(self):
+        conn = mock.Mock(exists=mock.Mock(side_effect=ConnectionError("down")))
+        with mock.patch.object(token_blacklist, "get_redis", return_value=conn), \
+                mock.patch.object(token_blacklist.front, "sync", side_effect=ConnectionError("down")):
+            self.assertTrue(token_blacklist.is_revoked("any", self.exp))
+
+
+# ------------------------------------------------------------------------------------------------------------ WebSocket 推送
+class RealtimeTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email="alice@example.com", password="x")
+        self.token = str(AccessToken.for_user(self.user))
+        for patcher in (mock.patch.object(realtime.hub, "_run", mock.AsyncMock()),
+                        mock.patch.object(realtime, "AUTH_TIMEOUT", 0.05)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def session(self, *texts, query_string=b"", disconnect=True):
+        """依次投递 connect、各条文本消息与 disconnect，返回服务端发送的消息"""
+        sent = []
+
+        async def run():
+            inbox = asyncio.Queue()
+            for message in [{"type": "websocket.connect"}, *({"type": "websocket.receive", "text": t} for t in texts)]:
+                inbox.put_nowait(message)
+            if disconnect:
+                inbox.put_nowait({"type": "websocket.disconnect"})
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "websocket", "path": realtime.PATH, "query_string": query_string}
+            await realtime.websocket_application(scope, inbox.get, send)
+
+        async_to_sync(run)()
+        return [json.loads(m["text"]) if m["type"] == "websocket.send" else m for m in sent]
+
+    def auth(self, token=None):
+        return json.dumps({"type": "auth", "token": token or self.token})
+
+    def test_first_message_authenticates(self):
+        sent = self.session(self.auth(), "ping")
+        self.assertEqual(sent[0], {"type": "websocket.accept"})
+        self.assertEqual(sent[1]["type"], "state")
+        self.assertEqual(sent[1]["profile"]["email"], "alice@example.com")
+        self.assertEqual(sent[2], {"type": "pong"})
+        self.assertEqual(realtime.hub.connections, {})
+
+    def test_orm_calls_drop_stale_connections(self):
+        with mock.patch.object(realtime, "close_old_connections") as close:
+            self.session(self.auth())
+        self.assertEqual(close.call_count, 4)  # 认证与加载状态各前后一次
+
+    def test_query_string_token_is_ignored(self):
+        sent = self.session(query_string=f"token={self.token}".encode(), disconnect=False)
+        self.assertEqual(sent, [{"type": "websocket.accept"},
+                                {"type": "websocket.close", "code": realtime.CLOSE_UNAUTHORIZED}])
+
+    def test_invalid_token_is_rejected(self):
+        sent = self.session(self.auth("not-a-jwt"))
+        self.assertEqual(sent[-1], {"type": "websocket.close", "code": realtime.CLOSE_UNAUTHORIZED})
+
+    def test_connection_closes_when_token_expires(self):
+        with mock.patch.object(realtime, "time", mock.Mock(time=lambda: time.time() + 86400 * 2)):
+            sent = self.session(self.auth(), disconnect=False)
+        self.assertEqual([m["type"] for m in sent], ["websocket.accept", "state", "expired", "websocket.close"])
+        self.assertEqual(sent[-1]["code"], realtime.CLOSE_UNAUTHORIZED)
+
+    def test_renewal_must_be_for_the_same_user(self):
+        bob = User.objects.create_user(email="bob@example.com", password="x")
+        sent = self.session(self.auth(), self.auth(str(AccessToken.for_user(bob))), "ping")
+        self.assertEqual(sent[-1], {"type": "websocket.close", "code": realtime.CLOSE_UNAUTHORIZED})
+
+
+# ------------------------------------------------------------------------------------------------------------ 在线回填
+class BackfillTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            User.objects.create_user(email=f"u{i}@example.com", password="x").soft_delete()
+        User.all_objects.update(deleted_at=None)
+        self.pks = sorted(User.all_objects.values_list("pk", flat=True))
+
+    def backfill(self, **kwargs):
+        queryset = User.all_objects.filter(is_deleted=True, deleted_at__isnull=True)
+        return Backfill(queryset, {"deleted_at": timezone.now()}, "test:deleted_at", chunk_size=2, pause=0, **kwargs)
+
+    def test_backfills_in_chunks_and_records_checkpoint(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.backfill().run(), 5)
+        self.assertFalse(User.all_objects.filter(deleted_at__isnull=True).exists())
+        self.assertEqual(sum(q["sql"].startswith("UPDATE \"account_user\"") for q in queries), 3)
+        checkpoint = BackfillCheckpoint.objects.get(name="test:deleted_at")
+        self.assertEqual((checkpoint.last_pk, checkpoint.rows_done), (self.pks[-1], 5))
+        self.assertIsNotNone(checkpoint.finished_at)
+
+    def test_resumes_from_checkpoint_and_skips_when_finished(self):
+        BackfillCheckpoint.objects.create(name="test:deleted_at", last_pk=self.pks[1], rows_done=2)
+        self.assertEqual(self.backfill().run(), 5)
+        self.assertEqual(User.all_objects.filter(deleted_at__isnull=True).count(), 2)  # 检查点之前的行不再处理
+        User.all_objects.update(deleted_at=None)
+        self.assertEqual(self.backfill().run(), 5)
+        self.assertEqual(User.all_objects.filter(deleted_at__isnull=True).count(), 5)
+
+
+# ------------------------------------------------------------------------------------------------------------ 用户分片
+class ShardRouterTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(sharding, "SHARDS", ["s1", "s2"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = sharding.UserShardRouter()
+        self.user = User(email="alice@example.com")
+        self.user._state.db = "s2"
+
+    def test_user_side_relations_follow_the_user(self):
+        for model in (User, User.roles.through, User.systems.through, Role):
+            self.assertEqual(self.router.db_for_read(model, instance=self.user), "s2")
+        self.assertEqual(self.router.db_for_write(User.roles.through, instance=self.user), "s2")
+
+    def test_catalog_and_lookup_are_written_to_default(self):
+        for model in (Role, System, CustomPermission, Role.permissions.through):
+            self.assertEqual(self.router.db_for_write(model, instance=self.user), "default")
+        self.assertEqual(self.router.db_for_read(UserLookup), "default")
+        self.assertTrue(self.router.allow_migrate("default", "account", "userlookup"))
+        self.assertFalse(self.router.allow_migrate("s1", "account", "userlookup"))
+
+    def test_unsharded_user_is_placed_by_hash(self):
+        user = User(email="bob@example.com")
+        self.assertEqual(sharding.shard_of(user), sharding.shard_for(user.unified_uuid))
+        self.assertIn(sharding.shard_of(user), ["s1", "s2"])
+
+    def test_disabled_sharding_defers_to_default_routing(self):
+        with mock.patch.object(sharding, "SHARDS", []):
+            self.assertIsNone(self.router.db_for_write(User.roles.through, instance=self.user))
+            self.assertIsNone(self.router.db_for_read(UserLookup))
+
+
+class ShardedReverseRelationTests(AccountTestCase):
+    """单分片（默认库）下验证以角色 / 系统为起点的关联写入改由用户侧执行"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(sharding, "SHARDS", ["default"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.role = Role.objects.create(role_name="editor")
+        self.alice = User.objects.create_user(email="alice@example.com", password="x")
+        self.bob = User.objects.create_user(email="bob@example.com", password="x")
+
+    def through_hints(self, action, through=User.roles.through):
+        """关联表写入时路由收到的实例类型"""
+        hints = set()
+        db_for_write = sharding.UserShardRouter.db_for_write
+
+        def record(router, model, **kwargs):
+            if model is through:
+                hints.add(type(kwargs.get("instance")))
+            return db_for_write(router, model, **kwargs)
+
+        with mock.patch.object(sharding.UserShardRouter, "db_for_write", record):
+            action()
+        return hints
+
+    def test_reverse_add_writes_from_the_user_side(self):
+        hints = self.through_hints(lambda: self.role.users.add(self.alice, self.bob.pk))
+        self.assertEqual(hints, {User})
+        self.assertEqual(set(self.role.users.values_list("email", flat=True)), {"alice@example.com", "bob@example.com"})
+
+    def test_reverse_set_and_clear(self):
+        self.role.users.add(self.alice)
+        self.role.users.set([self.bob])
+        self.assertEqual(list(self.role.users.values_list("email", flat=True)), ["bob@example.com"])
+        hints = self.through_hints(self.role.users.clear)
+        self.assertEqual(hints, {User})
+        self.assertFalse(self.role.users.exists())
+
+    def test_system_reverse_remove(self):
+        system = System.objects.create(system_name="crm", system_code="crm")
+        self.alice.systems.add(system)
+        self.assertEqual(self.through_hints(lambda: system.users.remove(self.alice), User.systems.through), {User})
+        self.assertFalse(self.alice.systems.exists())
+
+
+SHARD_ALIASES = {"default", "s1", "s2"}
+
+
+@skipUnless(SHARD_ALIASES <= set(settings.DATABASES), "需要配置 s1 / s2 分片库")
+class MultiShardTests(AccountTestCase):
+    databases = SHARD_ALIASES & set(settings.DATABASES)  # 未配置分片库时整个用例跳过
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(sharding, "SHARDS", ["s1", "s2"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.role = Role.objects.create(role_name="editor")
+        sharding.sync_catalog()
+        self.users = [User.objects.create_user(email=f"u{i}@example.com", password="x") for i in range(8)]
+
+    def test_users_are_written_to_their_shard_and_located(self):
+        for user in self.users:
+            self.assertEqual(user._state.db, sharding.shard_for(user.unified_uuid))
+            self.assertEqual(sharding.locate("email", user.email), user._state.db)
+            self.assertEqual(User.objects.get(email=user.email).pk, user.pk)
+        self.assertFalse(User.all_objects.using("default").exists())
+
+    def test_reverse_relation_rows_land_on_user_shards(self):
+        self.role.users.add(*self.users)
+        for alias in ("default", "s1", "s2"):
+            expected = {user.pk for user in self.users if user._state.db == alias}
+            self.assertEqual(set(User.roles.through.objects.using(alias).values_list("user_id", flat=True)), expected)
+        self.role.users.clear()
+        for alias in ("default", "s1", "s2"):
+            self.assertFalse(User.roles.through.objects.using(alias).exists())
+
+    def test_duplicate_email_across_shards_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            User.objects.create_user(email=self.users[0].email, password="x")
+
+    def test_write_behind_flush_updates_each_shard(self):
+        when = timezone.now()
+        with mock.patch.object(write_behind, "_ensure_flusher"):
+            for user in self.users:
+                write_behind.touch(User, user.pk, "last_login", when)
+        self.assertEqual(write_behind.flush(), 8)
+        for user in self.users:
+            self.assertEqual(User.all_objects.using(user._state.db).get(pk=user.pk).last_login, when)
+
+    def test_scatter_gather_merges_ordered_pages(self):
+        emails = sorted(user.email for user in self.users)
+        queryset = sharding.scatter(User.objects.order_by("email"))
+        self.assertEqual(queryset.count(), 8)
+        self.assertEqual([user.email for user in queryset[2:5]], emails[2:5])
+
+
+# ------------------------------------------------------------------------------------------------------------ 登录资料
+class LoginProfileTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email="alice@example.com", password="secret")
+        self.permission = CustomPermission.objects.create(permission_name="查看", permission_code="doc.view")
+
+    def grant(self, count):
+        start = self.user.roles.count()
+        for i in range(start, start + count):
+            role = Role.objects.create(role_name=f"role{i}")
+            role.permissions.add(self.permission)
+            self.user.roles.add(role)
+
+    def login(self):
+        return self.client.post("/api/account/login/", {"email": "alice@example.com", "password": "secret"})
+
+    def test_login_returns_lean_profile_without_password(self):
+        self.grant(2)
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        profile = response.json()["user"]
+        self.assertEqual(sorted(profile["roles"]), ["role0", "role1"])
+        self.assertFalse(profile["is_super_admin"])
+        self.assertNotIn("password", profile)
+        self.assertNotIn("all_permissions", profile)
+
+    def test_profile_queries_do_not_grow_with_roles(self):
+        self.grant(1)
+        with CaptureQueriesContext(connection) as one:
+            LoginProfileSerializer(User.objects.get(pk=self.user.pk)).data  # noqa
+        self.grant(5)
+        with self.assertNumQueries(len(one)):
+            LoginProfileSerializer(User.objects.get(pk=self.user.pk)).data  # noqa
+
+    def test_full_profile_has_permissions_but_no_password(self):
+        self.grant(3)
+        with override_settings(ACCOUNT_LOGIN_PROFILE="full"):
+            profile = self.login().json()["user"]
+        self.assertIn("doc.view", profile["all_permissions"])
+        self.assertNotIn("password", profile)
+        self.assertNotIn("password", UserSerializer(self.user).data)
+
+    def test_permission_queries_do_not_grow_with_roles(self):
+        counts = []
+        for added in (1, 4):
+            self.grant(added)
+            user = User.objects.get(pk=self.user.pk)
+            user.get_all_permissions()  # Django 内置权限单独缓存
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(user.all_permissions, ["doc.view"])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+# ------------------------------------------------------------------------------------------------------------ 批量查询用户
+class UserBatchTests(AccountTestCase):
+    url = "/api/account/user/batch/"
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(bus, "ensure_started", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice = User.objects.create_user(email="alice@example.com", password="x")
+        self.bob = User.objects.create_user(email="bob@example.com", password="x")
+        service = Role.objects.create(role_name="service")
+        service.permissions.add(CustomPermission.objects.create(permission_name="服务账号", permission_code=SERVICE_PERMISSION))
+        self.service = User.objects.create_user(email="svc@example.com", password="x")
+        self.service.roles.add(service)
+        self.client = APIClient()
+        self.client.force_authenticate(self.service)
+
+    def post(self, ids):
+        return self.client.post(self.url, {"ids": ids}, format="json")
+
+    def test_only_service_callers_are_allowed(self):
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.post([self.bob.pk]).status_code, 403)
+
+    def test_mixed_identifiers_and_missing(self):
+        self.bob.soft_delete()
+        data = self.post([self.alice.pk, self.alice.unified_uuid, self.bob.pk, "nobody"]).json()["data"]
+        self.assertEqual(set(data["users"]), {self.alice.pk, self.alice.unified_uuid})
+        self.assertEqual(data["users"][self.alice.pk]["email"], "alice@example.com")
+        self.assertEqual(data["missing"], [self.bob.pk, "nobody"])
+
+    def test_cached_profiles_skip_the_database_until_invalidated(self):
+        self.post([self.alice.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(profiles([self.alice.unified_uuid])[self.alice.unified_uuid]["email"], "alice@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.nickname = "Al"
+            self.alice.save()
+        self.assertIsNone(_profile_cache.get(self.alice.unified_uuid))
+        self.assertEqual(self.post([self.alice.pk]).json()["data"]["users"][self.alice.pk]["nickname"], "Al")
+
+    def test_request_size_is_bounded(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post(["x"] * (settings.USER_BATCH_MAX + 1)).status_code, 400)
+
+
+# ------------------------------------------------------------------------------------------------------------ 增量同步
+class SyncTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(sync, "SAFETY_LAG", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.root = User.objects.create_superuser(email="root@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.root)
+        self.roles = [Role.objects.create(role_name=f"role{i}") for i in range(5)]
+
+    def fetch(self, resource, cursor=None, limit=2):
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = self.client.get(f"/api/account/sync/{resource}/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["data"]
+
+    def drain(self, resource, cursor=None):
+        seen = []
+        while True:
+            data = self.fetch(resource, cursor)
+            seen += [row["uuid"] for row in data["results"]]
+            cursor = data["cursor"]
+            if not data["has_more"]:
+                return seen, cursor
+
+    def test_pages_cover_every_row_once_and_cursor_is_stable(self):
+        self.roles[0].soft_delete()
+        seen, cursor = self.drain("roles")
+        self.assertEqual(sorted(seen), sorted(role.pk for role in self.roles))
+        self.assertEqual(self.fetch("roles", cursor), {"results": [], "cursor": cursor, "has_more": False})
+
+    def test_relation_change_is_picked_up_by_owner(self):
+        _, cursor = self.drain("roles")
+        permission = CustomPermission.objects.create(permission_name="查看", permission_code="doc.view")
+        self.roles[2].permissions.add(permission)
+        data = self.fetch("roles", cursor)
+        self.assertEqual([(row["uuid"], row["permissions"]) for row in data["results"]],
+                         [(self.roles[2].pk, [permission.pk])])
+
+    def test_recent_rows_wait_for_safety_lag(self):
+        with mock.patch.object(sync, "SAFETY_LAG", 60):
+            self.assertEqual(self.fetch("systems", limit=10)["results"], [])
+            self.assertEqual(self.fetch("roles", limit=10)["results"], [])
+
+    def test_invalid_cursor_and_non_admin(self):
+        response = self.client.get("/api/account/sync/roles/", {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(email="bob@example.com", password="x"))
+        self.assertEqual(self.client.get("/api/account/sync/roles/").status_code, 403)
+
+
+# ------------------------------------------------------------------------------------------------------------ 字段裁剪
+class SparseFieldsTests(AccountTestCase):
+    url = "/api/account/systems/list/"
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(email="root@example.com", password="x"))
+        System.objects.create(system_name="A", system_code="a")
+
+    def rows(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()["data"]
+        return data["results"] if isinstance(data, dict) and "results" in data else data
+
+    def system_selects(self, queries):
+        return [q["sql"] for q in queries if q["sql"].startswith("SELECT") and 'FROM "account_system"' in q["sql"]
+                and "COUNT(" not in q["sql"] and "MAX(" not in q["sql"]]
+
+    def test_fields_prunes_output_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.rows(self.client.get(self.url, {"fields": "uuid,system_name"}))
+        self.assertEqual(rows, [{"uuid": rows[0]["uuid"], "system_name": "A"}])
+        selects = self.system_selects(queries)
+        self.assertTrue(selects)
+        self.assertTrue(all('"system_code"' not in sql for sql in selects))
+
+    def test_exclude_keeps_the_rest(self):
+        rows = self.rows(self.client.get(self.url, {"exclude": "created_info"}))
+        self.assertEqual(set(rows[0]), {"uuid", "system_code", "system_name"})
+
+    def test_undeclared_fields_are_rejected(self):
+        response = self.client.get(self.url, {"fields": "uuid,is_deleted"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_variants_are_cached_separately(self):
+        self.rows(self.client.get(self.url, {"fields": "uuid"}))
+        rows = self.rows(self.client.get(self.url))
+        self.assertIn("system_code", rows[0])
+
+
+# ------------------------------------------------------------------------------------------------------------ 请求级记忆化
+class RequestScopeAccessTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(permission_engine, "current", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(email="alice@example.com", password="x")
+        self.role = Role.objects.create(role_name="editor")
+        self.role.permissions.add(CustomPermission.objects.create(permission_name="查看", permission_code="doc.view"))
+
+    def in_request(self, fn):
+        return request_scope.RequestScopeMiddleware(lambda request: fn())(None)
+
+    def test_access_is_loaded_once_per_request(self):
+        def view():
+            self.user.all_roles  # noqa
+            with self.assertNumQueries(0):
+                self.assertFalse(self.user.has_custom_permission("doc.view"))
+                self.assertEqual(self.user.all_roles, [])
+                self.assertFalse(self.user.is_super_admin())
+
+        self.in_request(view)
+
+    def test_writes_in_the_same_request_are_visible(self):
+        def view():
+            self.assertFalse(self.user.has_custom_permission("doc.view"))
+            self.user.roles.add(self.role)
+            self.assertTrue(self.user.has_custom_permission("doc.view"))
+            self.assertEqual(self.user.all_roles, ["editor"])
+
+        self.in_request(view)
+
+    def test_authentication_reuses_the_user_instance(self):
+        token = AccessToken.for_user(self.user)
+        auth = authentication.ScopedJWTAuthentication()
+
+        def view():
+            first = auth.get_user(token)
+            with self.assertNumQueries(0):
+                self.assertIs(auth.get_user(token), first)
+
+        self.in_request(view)
+        self.assertIsNot(auth.get_user(token), auth.get_user(token))  # 请求之外不复用
+
+
+# ------------------------------------------------------------------------------------------------------------ 软删除归档
+class ArchiveTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email="alice@example.com", password="x")
+        self.role = Role.objects.create(role_name="editor")
+        self.role.permissions.add(CustomPermission.objects.create(permission_name="查看", permission_code="doc.view"))
+        self.user.roles.add(self.role)
+        self.role.soft_delete()
+
+    def age(self, days):
+        Role.all_objects.filter(pk=self.role.pk).update(deleted_at=timezone.now() - timedelta(days=days))
+
+    def test_recent_deletions_stay_in_place(self):
+        self.age(10)
+        self.assertEqual(archive.archive_model(Role, days=30), 0)
+        self.assertTrue(Role.all_objects.filter(pk=self.role.pk).exists())
+
+    def test_archive_and_restore_keep_relations(self):
+        self.age(40)
+        self.assertEqual(archive.archive_model(Role, days=30), 1)
+        self.assertFalse(Role.all_objects.filter(pk=self.role.pk).exists())
+        self.assertFalse(User.roles.through.objects.filter(role_id=self.role.pk).exists())
+        self.assertTrue(RoleArchive.objects.filter(pk=self.role.pk).exists())
+
+        restored = archive.restore(Role, self.role.pk)
+        self.assertTrue(restored.is_deleted)  # 恢复到主表，仍为已删除状态
+        self.assertEqual(list(restored.permissions.values_list("permission_code", flat=True)), ["doc.view"])
+        self.assertEqual(list(User.roles.through.objects.filter(role_id=self.role.pk).values_list("user_id", flat=True)),
+                         [self.user.pk])
+        self.assertFalse(RoleArchive.objects.filter(pk=self.role.pk).exists())
+
+    def test_default_manager_hides_soft_deleted_rows(self):
+        self.assertFalse(Role.objects.filter(pk=self.role.pk).exists())
+        self.assertTrue(Role.all_objects.filter(pk=self.role.pk).exists())
+
+
+# ------------------------------------------------------------------------------------------------------------ 只写变化字段
+class ChangedFieldsUpdateTests(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser(email="root@example.com", password="x"))
+        self.system = System.objects.create(system_name="A", system_code="a")
+        self.url = f"/api/account/systems/{self.system.pk}/"
+
+    def updates(self, payload):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, payload, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [q["sql"] for q in queries if q["sql"].startswith('UPDATE "account_system"')]
+
+    def test_unchanged_payload_does_not_write(self):
+        update_at = self.system.update_at
+        self.assertEqual(self.updates({"system_name": "A"}), [])
+        self.system.refresh_from_db()
+        self.assertEqual(self.system.update_at, update_at)
+
+    def test_only_changed_columns_are_written(self):
+        [sql] = self.updates({"system_name": "B", "system_code": "a"})
+        self.assertIn('"system_name"', sql)
+        self.assertIn('"update_at"', sql)
+        self.assertNotIn('"system_code"', sql)
 
-# Create your tests here.
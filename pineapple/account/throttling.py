@@ -0,0 +1,12 @@
+from utensil.throttling import TokenBucketThrottle
+
+from .permissions import is_service_caller
+
+
+class ServiceCallerThrottle(TokenBucketThrottle):
+    """下游服务账号按 service 速率单独限流，不与普通用户共用 user 的速率"""
+
+    def get_scope(self, request, view):
+        if is_service_caller(request.user):
+            return "service"
+        return super().get_scope(request, view)
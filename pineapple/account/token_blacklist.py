@@ -0,0 +1,158 @@
+"""
+Refresh Token 黑名单（Redis，替代需要 MySQL 表的 token_blacklist 应用）
+
+- 吊销：SET jwt:blacklist:<jti> EX <剩余有效期>，同时在按过期日划分的 Redis 位图 jwt:bloom:<日> 上置位（布隆过滤器）
+- 每个 worker 持有各过期日位图的本地副本：
+    * 本进程吊销与其他进程经失效总线（utensil.cache_bus）推送的吊销直接在本地置位
+    * 每 TOKEN_BLACKLIST_SYNC_INTERVAL 秒、或总线检测到消息丢失时整体从 Redis 重新拉取
+- 校验：本地位图判定"不在黑名单"即放行（常见情况，无网络请求）；判定"可能在"时 EXISTS 确认
+- 本地位图不可信时改为每次 EXISTS（权威结果）：总线不可用、拉取失败、总线出现版本空洞（有消息丢失，
+  在巡检发现之前即停止信任本地位图）或收到丢失通知后尚未重新拉取成功
+- EXISTS 同样失败时按已吊销处理（401，而不是 500）；未配置 Redis 时使用 Django 缓存
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from utensil.cache_bus import bus, get_redis
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "token-blacklist"
+BITS = getattr(settings, "TOKEN_BLACKLIST_BLOOM_BITS", 1 << 20)
+HASHES = getattr(settings, "TOKEN_BLACKLIST_BLOOM_HASHES", 7)
+SYNC_INTERVAL = getattr(settings, "TOKEN_BLACKLIST_SYNC_INTERVAL", 60)
+DAY = 86400
+
+
+def _jti_key(jti):
+    return f"jwt:blacklist:{jti}"
+
+
+def _bloom_key(day):
+    return f"jwt:bloom:{day}"
+
+
+def _positions(jti):
+    digest = hashlib.blake2b(jti.encode(), digest_size=16).digest()
+    h1, h2 = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+    return [(h1 + i * h2) % BITS for i in range(HASHES)]
+
+
+class BloomFront:
+    """按过期日划分的本地布隆位图（位序与 Redis SETBIT 一致：每字节高位在前）"""
+
+    def __init__(self):
+        self.namespaces = (NAMESPACE,)
+        self._days = {}
+        self._recent = []  # 上次拉取后经总线收到的吊销，拉取完成时重新置位，避免与拉取交错而丢失
+        self._synced_at = 0.0
+        self._stale = True  # 尚未成功拉取，或收到丢失通知后尚未重新拉取
+        self._lock = threading.Lock()
+        bus.register(self)
+
+    def _set_bits(self, day, jti):
+        bitmap = self._days.setdefault(day, bytearray(BITS // 8))
+        for pos in _positions(jti):
+            bitmap[pos >> 3] |= 0x80 >> (pos & 7)
+
+    def trusted(self):
+        """本地位图的"不在"结论是否可信（需要时先重新拉取；拉取失败返回 False）"""
+        if self._stale or time.monotonic() - self._synced_at >= SYNC_INTERVAL:
+            try:
+                self.sync()
+            except Exception as e:  # noqa
+                logger.warning(f"[TOKEN_BLACKLIST] 拉取布隆位图失败，改为逐个 EXISTS: {e}")
+                with self._lock:
+                    self._stale = True
+                return False
+        return not self._stale and bus.in_sync()  # 版本空洞：有消息尚未到达或已丢失
+
+    def might_contain(self, day, jti):
+        bitmap = self._days.get(day)
+        if bitmap is None:
+            return False
+        return all(bitmap[pos >> 3] & (0x80 >> (pos & 7)) for pos in _positions(jti))
+
+    def sync(self, conn=None):
+        conn = conn or get_redis()
+        today = int(time.time()) // DAY
+        days = range(today, today + int(settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"].total_seconds()) // DAY + 2)
+        pipe = conn.pipeline(transaction=False)
+        for day in days:
+            pipe.get(_bloom_key(day))
+        synced = {}
+        for day, raw in zip(days, pipe.execute()):
+            if raw:
+                bitmap = synced[day] = bytearray(BITS // 8)
+                bitmap[:len(raw)] = raw[:BITS // 8]
+        with self._lock:
+            self._days = synced
+            for day, jti in self._recent:
+                self._set_bits(day, jti)
+            self._recent = []
+            self._synced_at = time.monotonic()
+            self._stale = False
+
+    def evict(self, keys=None):
+        """失效总线回调：keys 为 ["<日>:<jti>", ...]；None 表示可能丢失过消息，重新拉取成功前不信任本地位图"""
+        with self._lock:
+            if keys is None:
+                self._stale = True
+                return
+            for key in keys:
+                day, _, jti = key.partition(":")
+                self._set_bits(int(day), jti)
+                self._recent.append((int(day), jti))
+
+
+front = BloomFront()
+
+
+def revoke(jti, exp):
+    """吊销 jti，记录保留到 token 自身过期为止"""
+    ttl = max(int(exp - time.time()), 1)
+    conn = get_redis()
+    if conn is None:
+        cache.set(_jti_key(jti), 1, ttl)
+        return
+    day = int(exp) // DAY
+    pipe = conn.pipeline(transaction=False)
+    pipe.set(_jti_key(jti), 1, ex=ttl)
+    for pos in _positions(jti):
+        pipe.setbit(_bloom_key(day), pos, 1)
+    pipe.expireat(_bloom_key(day), (day + 1) * DAY + 60)
+    pipe.execute()
+    bus.publish(NAMESPACE, [f"{day}:{jti}"])
+
+
+def is_revoked(jti, exp):
+    conn = get_redis()
+    if conn is None:
+        return cache.get(_jti_key(jti)) is not None
+    if bus.ensure_started() and front.trusted() and not front.might_contain(int(exp) // DAY, jti):
+        return False
+    try:
+        return bool(conn.exists(_jti_key(jti)))
+    except Exception as e:  # noqa
+        logger.error(f"[TOKEN_BLACKLIST] 无法确认 jti {jti} 是否已吊销，按已吊销处理: {e}")
+        return True
+
+
+class BlacklistRefreshToken(RefreshToken):
+    """校验时检查 Redis 黑名单；blacklist() 写入 Redis（轮换刷新与退出登录时调用）"""
+
+    def verify(self, *args, **kwargs):
+        if is_revoked(self.payload[api_settings.JTI_CLAIM], self.payload["exp"]):
+            raise TokenError("Token 已失效")
+        super().verify(*args, **kwargs)
+
+    def blacklist(self):
+        revoke(self.payload[api_settings.JTI_CLAIM], self.payload["exp"])
@@ -4,18 +4,24 @@ from .views import (
     LoginView, RegisterView, RefreshTokenView, WeChatLoginView, CurrentUserView, UserListView, UserUpdateView,
     SystemCreateView, SystemListView, SystemRetrieveView, SystemDeleteView, SystemCancelDeleteView, RoleCreateView,
     RoleListView, RoleRetrieveView, RoleDeleteView, RoleCancelDeleteView, PermissionCreateView, PermissionListView,
-    PermissionRetrieveView, PermissionDeleteView, PermissionCancelDeleteView, UserRetrieveAPIView
+    PermissionRetrieveView, PermissionDeleteView, PermissionCancelDeleteView, UserRetrieveAPIView, AuthorizeView,
+    LogoutView, UserBatchView, SyncView, JWTPublicKeyView
 )
 
 urlpatterns = [
     re_path(r"^register/$", RegisterView.as_view()),
     re_path(r"^login/$", LoginView.as_view()),  # ✅ 颁发 Access / Refresh Token
     re_path(r"^refresh/$", RefreshTokenView.as_view()),  # ✅ 刷新 Access Token
+    re_path(r"^logout/$", LogoutView.as_view()),  # ✅ 吊销 Refresh Token
     re_path(r"^wechat/$", WeChatLoginView.as_view()),  # ✅ 微信登录
+    re_path(r"^jwt/public-key/$", JWTPublicKeyView.as_view(), name="jwt-public-key"),  # ✅ 验签公钥
     re_path(r"^myinfo/$", CurrentUserView.as_view()),  # ✅ 获取用户信息
     re_path(r"^user/list/$", UserListView.as_view()),  # ✅ 用户列表
+    re_path(r"^user/batch/$", UserBatchView.as_view(), name="user-batch"),  # ✅ 批量查询用户
     re_path(r"^user/(?P<pk>[0-9A-Za-z_-]{22})/$", UserRetrieveAPIView.as_view()),  # ✅ 用户详情
     re_path(r"^userinfo/(?P<pk>[0-9A-Za-z_-]{22})/update/$", UserUpdateView.as_view()),  # ✅ 修改用户信息
+    re_path(r"^authorize/$", AuthorizeView.as_view(), name="authorize"),  # ✅ 批量授权
+    re_path(r"^sync/(?P<resource>systems|roles|permissions|users)/$", SyncView.as_view(), name="sync"),  # ✅ 增量同步
 
     # ✅ 系统 API
     re_path(r"^systems/create/$", SystemCreateView.as_view(), name="system-create"),
@@ -0,0 +1,41 @@
+"""
+用户基础资料批量查询（created_by / 负责人等展示场景）
+
+- 进程内缓存按主键与 unified_uuid 双键存放同一份资料，用户事件（[主键, unified_uuid]）经失效总线清理
+- 未命中的标识合并为一次 IN 查询（启用用户分片时每个分片一次）
+"""
+import itertools
+
+from django.db.models import Q
+
+from utensil.cache_bus import LocalCache, bus
+from . import sharding
+
+_profile_cache = LocalCache("user", maxsize=50000)
+
+
+def profiles(ids):
+    """ids 可混合 uuid 与 unified_uuid，返回 {标识: UserRetrieveSerializer 数据}；不存在 / 已删除的不返回"""
+    from .models import User
+    from .serializers import UserRetrieveSerializer
+
+    result, missing = {}, []
+    for ident in dict.fromkeys(ids):
+        cached = _profile_cache.get(ident)
+        if cached is None:
+            missing.append(ident)
+        else:
+            result[ident] = cached
+    if missing:
+        version = bus.generation
+        users = User.objects.filter(Q(pk__in=missing) | Q(unified_uuid__in=missing)).only(
+            "unified_uuid", *UserRetrieveSerializer.Meta.fields
+        )
+        wanted = set(missing)
+        for user in itertools.chain.from_iterable(sharding.each_shard(users)):
+            data = UserRetrieveSerializer(user).data
+            for ident in (user.pk, user.unified_uuid):
+                _profile_cache.set(ident, data, version=version)
+                if ident in wanted:
+                    result[ident] = data
+    return result
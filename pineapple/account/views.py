@@ -1,24 +1,34 @@
 import requests
 from django.conf import settings
-from django.utils import timezone
+from django.db.models import Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenObtainPairView, TokenRefreshView
 
-from utensil import generics
+from utensil import generics, write_behind
+from utensil.archive import RestoreFromArchiveMixin
+from utensil.idempotency import IdempotentCreateMixin
+from utensil.sync import changes_since
+from utensil.throttling import AuthRateThrottle
 from utensil.views import CustomPagination
-from .authentication import CustomTokenObtainPairSerializer
+from .authentication import CustomTokenObtainPairSerializer, public_key
+from .permission_engine import authorize
+from .user_cache import profiles
 from .filters import UserFilter, SystemFilter, RoleFilter, CustomPermissionFilter
 from .models import User, CustomPermission, System, Role
-from .permissions import IsAdminRole
+from .permissions import IsAdminRole, IsServiceCaller, is_service_caller
+from .sharding import ScatterGatherListMixin
+from .throttling import ServiceCallerThrottle
 from .serializers import (
     RegisterSerializer, CustomTokenObtainPairSerializer, UserDetailSerializer, CustomPermissionSerializer,
     SystemSerializer, SystemCreateSerializer, SystemListRetrieveSerializer, PermissionCreateSerializer,
     PermissionListRetrieveSerializer, RoleListRetrieveSerializer, RoleCreateSerializer, UserUpdateSerializer,
-    UserListSerializer, UserRetrieveSerializer
+    UserListSerializer, UserRetrieveSerializer, AuthorizeSerializer, CustomTokenRefreshSerializer, LogoutSerializer,
+    UserBatchSerializer, SyncSystemSerializer, SyncPermissionSerializer, SyncRoleSerializer, SyncUserSerializer
 )
 
 
@@ -26,6 +36,7 @@ from .serializers import (
 
 class RegisterView(generics.CreateAPIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
     serializer_class = RegisterSerializer
 
     def create(self, request, *args, **kwargs):
@@ -43,17 +54,38 @@ class RegisterView(generics.CreateAPIView):
 
 # ✅ 登录（使用 SimpleJWT 自定义序列化器）
 class LoginView(TokenObtainPairView):
+    throttle_classes = [AuthRateThrottle]
     serializer_class = CustomTokenObtainPairSerializer
 
 
-# ✅ 刷新 Token（使用 SimpleJWT 内置）
+# ✅ 刷新 Token（轮换后旧 Token 进入 Redis 黑名单）
 class RefreshTokenView(TokenRefreshView):
-    pass
+    throttle_classes = [AuthRateThrottle]
+    serializer_class = CustomTokenRefreshSerializer
+
+
+# ✅ 退出登录（吊销 Refresh Token）
+class LogoutView(TokenBlacklistView):
+    throttle_classes = [AuthRateThrottle]
+    serializer_class = LogoutSerializer
+
+
+# ✅ JWT 验签公钥（下游服务本地校验 Token，pineapple_client 启动时获取）
+class JWTPublicKeyView(generics.GenericAPIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, *args, **kwargs):  # noqa
+        key = public_key()
+        if key is None:
+            return Response(self.msg(code=404, msg="未启用非对称签名，无法本地验签"), status=404)
+        return Response(self.msg(code=200, msg="成功", data={"algorithm": key[0], "public_key": key[1]}))
 
 
 # ✅ 微信登录（签发 SimpleJWT Token）
 class WeChatLoginView(generics.GenericAPIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
 
     def post(self, request):  # noqa
         code = request.data.get("code")
@@ -76,17 +108,20 @@ class WeChatLoginView(generics.GenericAPIView):
             return Response({"error": "WeChat auth failed"}, status=400)
 
         # ✅ 查找或创建用户
-        user = User.objects.filter(wx_unionid=unionid).first() or User.objects.filter(wx_openid=openid).first()
+        user = User.all_objects.filter(wx_unionid=unionid).first() or User.all_objects.filter(wx_openid=openid).first()
+        if user and user.is_deleted:
+            return Response({"error": "Account deleted"}, status=400)
         if not user:
             user = User.objects.create(username=f"wx_{openid[:6]}", wx_openid=openid, wx_unionid=unionid)
 
         # ✅ 使用 SimpleJWT 自定义 Token 生成
         serializer = CustomTokenObtainPairSerializer()
         token = serializer.get_token(user)
+        write_behind.touch(User, user.pk, "last_login")
         return Response({"access": str(token.access_token), "refresh": str(token)})  # noqa
 
 
-class UserListView(generics.ListAPIView):
+class UserListView(ScatterGatherListMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = UserListSerializer
     pagination_class = CustomPagination
@@ -104,6 +139,24 @@ class UserRetrieveAPIView(generics.RetrieveAPIView):
         return Response(self.msg(code=200, msg="成功", data=serializer.data))
 
 
+# ✅ 批量查询用户基础资料（一次请求代替逐个调用 user/<pk>/）
+class UserBatchView(generics.GenericAPIView):
+    permission_classes = [IsServiceCaller]  # ✅ 只对下游服务开放，普通用户不能批量读取他人资料
+    throttle_classes = [ServiceCallerThrottle]
+    serializer_class = UserBatchSerializer
+
+    def post(self, request, *args, **kwargs):  # noqa
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        users = profiles(ids)
+        data = {
+            "users": users,
+            "missing": [ident for ident in dict.fromkeys(ids) if ident not in users],
+        }
+        return Response(self.msg(code=200, msg="成功", data=data))
+
+
 class UserUpdateView(generics.UpdateAPIView):
     permission_classes = [AllowAny]
     serializer_class = UserUpdateSerializer
@@ -121,15 +174,17 @@ class CurrentUserView(generics.GenericAPIView):
         user = request.user
 
         # ✅ 获取用户所有权限（去重）
+        role_uuids = user.role_uuids()  # ✅ 先取角色主键，启用用户分片时目录查询不跨库
         permissions = CustomPermission.objects.filter(  # noqa
-            roles__users=user,
+            roles__in=role_uuids,
             roles__is_enable=True
         ).distinct()
 
-        # ✅ 获取用户关联系统（可选：如果 role → system 关联）
+        # ✅ 获取用户关联系统（角色 → 系统）
         systems = System.objects.filter(
-            role__users=user
-        ).distinct() if hasattr(Role, "system") else []
+            roles__in=role_uuids,
+            is_deleted=False
+        ).distinct()
 
         data = {
             "user": UserDetailSerializer(user).data,
@@ -140,8 +195,53 @@ class CurrentUserView(generics.GenericAPIView):
         return Response(self.msg(code=200, msg="成功", data=data))
 
 
+# ✅ 批量授权（下游微服务一次请求拿到全部权限判定）
+class AuthorizeView(generics.GenericAPIView):
+    """
+    服务账号 / 超级管理员可查询任意用户；其他用户只能查询本人
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ServiceCallerThrottle]
+    serializer_class = AuthorizeSerializer
+
+    def check_subjects(self, unified_uuids):
+        user = self.request.user
+        if set(unified_uuids) - {user.unified_uuid} and not is_service_caller(user):
+            raise PermissionDenied("只能查询本人的权限")
+
+    def post(self, request, *args, **kwargs):  # noqa
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        system_code = data["system_code"]
+
+        if data.get("checks"):
+            user_codes = {}
+            for unified_uuid, code in data["checks"]:
+                user_codes.setdefault(unified_uuid, []).append(code)
+            self.check_subjects(user_codes)
+            result = authorize(user_codes, system_code)
+            decisions = [
+                {"unified_uuid": unified_uuid, "permission_code": code, "allowed": result[unified_uuid][code]}
+                for unified_uuid, code in data["checks"]
+            ]
+            return Response(self.msg(code=200, msg="成功", data={"system_code": system_code, "decisions": decisions}))
+
+        unified_uuid = data["unified_uuid"]
+        self.check_subjects([unified_uuid])
+        decisions = authorize({unified_uuid: data["permissions"]}, system_code)[unified_uuid]
+        allowed = all(decisions.values()) if data["logic"] == "AND" else any(decisions.values())
+        return Response(self.msg(code=200, msg="成功", data={
+            "unified_uuid": unified_uuid,
+            "system_code": system_code,
+            "logic": data["logic"],
+            "allowed": allowed,
+            "decisions": decisions,
+        }))
+
+
 # ✅ 系统 创建
-class SystemCreateView(generics.CreateAPIView):  # noqa
+class SystemCreateView(IdempotentCreateMixin, generics.CreateAPIView):  # noqa
     permission_classes = [permissions.AllowAny, IsAdminRole]
     serializer_class = SystemCreateSerializer
 
@@ -149,6 +249,8 @@ class SystemCreateView(generics.CreateAPIView):  # noqa
 # ✅ 系统 列表
 class SystemListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    conditional_related = ("created_by",)  # ✅ 创建人 / 所属系统变化时 ETag 同步变化
+    cache_tags = ("account.System", "account.User")  # ✅ 响应缓存：这些模型写入后失效
     serializer_class = SystemListRetrieveSerializer
     queryset = System.objects.filter(is_deleted=False).order_by("-create_at")
     pagination_class = CustomPagination
@@ -159,6 +261,8 @@ class SystemListView(generics.ListAPIView):
 # ✅ 系统 详情 ｜ 修改
 class SystemRetrieveView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    conditional_related = ("created_by",)  # ✅ 创建人 / 所属系统变化时 ETag 同步变化
+    cache_tags = ("account.System", "account.User")  # ✅ 响应缓存：这些模型写入后失效
     serializer_class = SystemListRetrieveSerializer
     queryset = System.objects.filter(is_deleted=False).order_by("-create_at")
 
@@ -169,9 +273,7 @@ class SystemDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
     queryset = System.objects.all()
 
     def perform_destroy(self, instance):
-        instance.is_deleted = True
-        instance.del_time = timezone.now()
-        instance.save()
+        instance.soft_delete()
         return instance
 
     def destroy(self, request, *args, **kwargs):
@@ -191,13 +293,12 @@ class SystemDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
 
 
 # ✅ 系统 取消删除
-class SystemCancelDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
+class SystemCancelDeleteView(RestoreFromArchiveMixin, generics.UpdateAPIView, generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
-    queryset = System.objects.all()
+    queryset = System.all_objects.all()
 
     def perform_destroy(self, instance):
-        instance.is_deleted = False
-        instance.save()
+        instance.restore()
         return instance
 
     def destroy(self, request, *args, **kwargs):
@@ -217,7 +318,7 @@ class SystemCancelDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
 
 
 # ✅ 角色 创建
-class RoleCreateView(generics.CreateAPIView):  # noqa
+class RoleCreateView(IdempotentCreateMixin, generics.CreateAPIView):  # noqa
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
     serializer_class = RoleCreateSerializer
 
@@ -225,8 +326,10 @@ class RoleCreateView(generics.CreateAPIView):  # noqa
 # ✅ 角色 列表
 class RoleListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    conditional_related = ("system", "created_by")  # ✅ 创建人 / 所属系统变化时 ETag 同步变化
+    cache_tags = ("account.Role", "account.System", "account.User")  # ✅ 响应缓存：这些模型写入后失效
     serializer_class = RoleListRetrieveSerializer
-    queryset = Role.objects.filter(is_deleted=False).order_by("-create_at")
+    queryset = Role.objects.filter(is_deleted=False).select_related("system", "created_by").order_by("-create_at")
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RoleFilter  # noqa
@@ -235,8 +338,10 @@ class RoleListView(generics.ListAPIView):
 # ✅ 角色 详情 ｜ 修改
 class RoleRetrieveView(generics.RetrieveUpdateAPIView):  # noqa
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    conditional_related = ("system", "created_by")  # ✅ 创建人 / 所属系统变化时 ETag 同步变化
+    cache_tags = ("account.Role", "account.System", "account.User")  # ✅ 响应缓存：这些模型写入后失效
     serializer_class = RoleListRetrieveSerializer
-    queryset = Role.objects.filter(is_deleted=False).order_by("-create_at")
+    queryset = Role.objects.filter(is_deleted=False).select_related("system", "created_by").order_by("-create_at")
 
 
 # ✅ 角色 删除
@@ -245,9 +350,7 @@ class RoleDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
     queryset = Role.objects.all()
 
     def perform_destroy(self, instance):
-        instance.is_deleted = True
-        instance.del_time = timezone.now()
-        instance.save()
+        instance.soft_delete()
         return instance
 
     def destroy(self, request, *args, **kwargs):
@@ -267,13 +370,12 @@ class RoleDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
 
 
 # ✅ 角色 取消删除
-class RoleCancelDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
+class RoleCancelDeleteView(RestoreFromArchiveMixin, generics.UpdateAPIView, generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
-    queryset = Role.objects.all()
+    queryset = Role.all_objects.all()
 
     def perform_destroy(self, instance):
-        instance.is_deleted = False
-        instance.save()
+        instance.restore()
         return instance
 
     def destroy(self, request, *args, **kwargs):
@@ -293,7 +395,7 @@ class RoleCancelDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
 
 
 # ✅ 权限 创建
-class PermissionCreateView(generics.CreateAPIView):  # noqa
+class PermissionCreateView(IdempotentCreateMixin, generics.CreateAPIView):  # noqa
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
     serializer_class = PermissionCreateSerializer
 
@@ -301,6 +403,8 @@ class PermissionCreateView(generics.CreateAPIView):  # noqa
 # ✅ 权限 列表
 class PermissionListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    conditional_related = ("created_by",)  # ✅ 创建人 / 所属系统变化时 ETag 同步变化
+    cache_tags = ("account.CustomPermission", "account.User")  # ✅ 响应缓存：这些模型写入后失效
     serializer_class = PermissionListRetrieveSerializer
     queryset = CustomPermission.objects.filter(is_deleted=False).order_by("-create_at")
     pagination_class = CustomPagination
@@ -311,6 +415,8 @@ class PermissionListView(generics.ListAPIView):
 # ✅ 权限 详情 ｜ 修改
 class PermissionRetrieveView(generics.RetrieveUpdateAPIView):  # noqa
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    conditional_related = ("created_by",)  # ✅ 创建人 / 所属系统变化时 ETag 同步变化
+    cache_tags = ("account.CustomPermission", "account.User")  # ✅ 响应缓存：这些模型写入后失效
     serializer_class = PermissionListRetrieveSerializer
     queryset = CustomPermission.objects.filter(is_deleted=False).order_by("-create_at")
 
@@ -321,9 +427,7 @@ class PermissionDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
     queryset = CustomPermission.objects.all()
 
     def perform_destroy(self, instance):
-        instance.is_deleted = True
-        instance.del_time = timezone.now()
-        instance.save()
+        instance.soft_delete()
         return instance
 
     def destroy(self, request, *args, **kwargs):
@@ -343,13 +447,12 @@ class PermissionDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
 
 
 # ✅ 权限 取消删除
-class PermissionCancelDeleteView(generics.UpdateAPIView, generics.DestroyAPIView):
+class PermissionCancelDeleteView(RestoreFromArchiveMixin, generics.UpdateAPIView, generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
-    queryset = CustomPermission.objects.all()
+    queryset = CustomPermission.all_objects.all()
 
     def perform_destroy(self, instance):
-        instance.is_deleted = False
-        instance.save()
+        instance.restore()
         return instance
 
     def destroy(self, request, *args, **kwargs):
@@ -366,3 +469,32 @@ class PermissionCancelDeleteView(generics.UpdateAPIView, generics.DestroyAPIView
             },
             status=status.HTTP_200_OK  # 改用 200 OK 包含响应体
         )
+
+
+# ✅ 增量同步：GET sync/<resource>/?cursor=&limit=，消费方保存返回的 cursor 供下次使用
+class SyncView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    resources = {
+        "systems": (lambda: System.all_objects.all(), SyncSystemSerializer),
+        "permissions": (lambda: CustomPermission.all_objects.all(), SyncPermissionSerializer),
+        "roles": (lambda: Role.all_objects.prefetch_related(
+            Prefetch("permissions", queryset=CustomPermission.all_objects.only("uuid"))
+        ), SyncRoleSerializer),
+        "users": (lambda: User.all_objects.prefetch_related(
+            Prefetch("roles", queryset=Role.all_objects.only("uuid"))
+        ), SyncUserSerializer),
+    }
+
+    def get(self, request, resource, *args, **kwargs):  # noqa
+        queryset, serializer_class = self.resources[resource]
+        try:
+            limit = min(max(int(request.query_params.get("limit", 500)), 1), 2000)
+        except ValueError:
+            limit = 500
+        rows, cursor, has_more = changes_since(queryset(), request.query_params.get("cursor"), limit)
+        data = {
+            "results": serializer_class(rows, many=True).data,
+            "cursor": cursor,
+            "has_more": has_more,
+        }
+        return Response(self.msg(code=200, msg="成功", data=data))
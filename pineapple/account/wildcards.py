@@ -0,0 +1,114 @@
+"""
+层级权限码通配符（product.* / *.view）
+
+- 权限码按 "." 分段；"*" 必须独占一段
+- 中间段的 "*" 匹配任意一段；末段的 "*" 匹配剩余的一段或多段（product.* 覆盖 product.sku.edit）
+- 授权集合编译为分段前缀树，匹配时按段推进状态集合，
+  状态转移结果按 (状态, 段) 缓存，相当于惰性构造的 DFA，单次匹配 O(权限码段数)
+- 树中不存在的字面段转移结果相同，缓存时归并为同一个键，缓存大小只取决于授权集合，与待匹配的权限码无关
+"""
+from rest_framework import serializers
+
+WILDCARD = "*"
+SEPARATOR = "."
+
+
+def is_wildcard(code):
+    return WILDCARD in code
+
+
+def validate_code(code):
+    """校验权限码格式，供序列化器调用"""
+    segments = code.split(SEPARATOR)
+    if any(not seg for seg in segments):
+        raise serializers.ValidationError("权限码各段不能为空")
+    if any(WILDCARD in seg and seg != WILDCARD for seg in segments):
+        raise serializers.ValidationError("通配符 * 必须独占一段")
+    return code
+
+
+class _Node:
+    __slots__ = ("children", "star", "terminal", "tail")
+
+    def __init__(self):
+        self.children = {}
+        self.star = None  # 中间段 "*"
+        self.terminal = False  # 精确结束
+        self.tail = False  # 末段 "*"：剩余一段或多段均匹配
+
+
+class WildcardTrie:
+    """通配符授权前缀树（编译后只读）"""
+
+    def __init__(self, patterns=()):
+        self._root = _Node()
+        self._transitions = {}
+        self._segments = set()  # 树中出现过的字面段
+        self.size = 0
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __bool__(self):
+        return self.size > 0
+
+    def add(self, pattern):
+        node = self._root
+        segments = pattern.split(SEPARATOR)
+        for i, seg in enumerate(segments):
+            last = i == len(segments) - 1
+            if seg == WILDCARD and last:
+                node.tail = True
+                break
+            if seg == WILDCARD:
+                node.star = node.star or _Node()
+                node = node.star
+            else:
+                node = node.children.setdefault(seg, _Node())
+                self._segments.add(seg)
+        else:
+            node.terminal = True
+        self.size += 1
+        self._transitions.clear()
+
+    def _step(self, state, seg):
+        if seg not in self._segments:
+            seg = None  # 只能走 "*" 分支
+        key = (state, seg)
+        nxt = self._transitions.get(key)
+        if nxt is None:
+            nodes = []
+            for node in state:
+                child = node.children.get(seg)
+                if child is not None:
+                    nodes.append(child)
+                if node.star is not None:
+                    nodes.append(node.star)
+            nxt = self._transitions[key] = tuple(nodes)
+        return nxt
+
+    def match(self, code):
+        state = (self._root,)
+        for seg in code.split(SEPARATOR):
+            if any(node.tail for node in state):  # 末段 "*"，且至少还剩一段
+                return True
+            state = self._step(state, seg)
+            if not state:
+                return False
+        return any(node.terminal for node in state)
+
+
+class PermissionMatcher:
+    """精确权限码集合 + 通配符前缀树"""
+
+    def __init__(self, codes):
+        codes = list(codes)
+        self.exact = {code for code in codes if not is_wildcard(code)}
+        self.trie = WildcardTrie(code for code in codes if is_wildcard(code))
+
+    def match(self, code):
+        return code in self.exact or bool(self.trie) and self.trie.match(code)
+
+    def check(self, codes, logic="OR"):
+        if logic == "AND":
+            return all(self.match(code) for code in codes)
+        return any(self.match(code) for code in codes)
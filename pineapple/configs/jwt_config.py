@@ -0,0 +1,7 @@
+# JWT Settings
+
+# RS256 密钥对（相对项目根目录）：私钥只保留在账户中心，公钥分发给下游服务
+# 生成：openssl genpkey -algorithm RSA -pkeyopt rsa_keygen_bits:2048 -out configs/jwt_private.pem
+#       openssl pkey -in configs/jwt_private.pem -pubout -out configs/jwt_public.pem
+JWT_PRIVATE_KEY_FILE = "configs/jwt_private.pem"
+JWT_PUBLIC_KEY_FILE = "configs/jwt_public.pem"
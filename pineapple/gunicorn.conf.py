@@ -0,0 +1,18 @@
+"""
+gunicorn 配置（在 manage.py 所在目录启动时自动加载）：gunicorn pineapple.wsgi:application
+worker 加载应用之后、接收第一个请求之前执行预热（utensil.warmup）
+"""
+
+
+def post_fork(server, worker):
+    """preload_app 时主进程可能已建立数据库连接，子进程不能复用"""
+    from django.conf import settings
+
+    if settings.configured:
+        from django.db import connections
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    from utensil import warmup
+    warmup.run_on_boot()
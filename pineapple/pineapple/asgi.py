@@ -13,4 +13,33 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pineapple.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from asgiref.sync import sync_to_async  # noqa: E402
+
+from account.realtime import PATH as REALTIME_PATH, websocket_application  # noqa: E402  需在 Django 初始化之后导入
+from utensil import warmup  # noqa: E402
+
+
+async def lifespan(receive, send):
+    """启动时预热（utensil.warmup），完成后才开始接收请求；数据库连接按请求线程建立，不在此预热"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await sync_to_async(warmup.run_on_boot)(skip=("database",))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """HTTP 交给 Django；/ws/account/ 为权限 / 资料变更推送（account.realtime）；lifespan 用于启动预热"""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "websocket":
+        if scope["path"] == REALTIME_PATH:
+            return await websocket_application(scope, receive, send)
+        await receive()
+        return await send({"type": "websocket.close", "code": 4404})
+    return await django_application(scope, receive, send)
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from datetime import timedelta
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -58,6 +60,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
+    'utensil.request_scope.RequestScopeMiddleware',  # ✅ 请求级记忆化，需在权限中间件之前
+
     'account.CustomPermissionMiddleware.CustomPermissionMiddleware'
 ]
 
@@ -97,6 +101,11 @@ DATABASES = {
         'CONN_MAX_AGE': 300,
     }
 }
+# ✅ 用户水平分片（account.sharding）：填写数据库别名后按 unified_uuid 哈希分布 User 及其关联表，空列表表示不分片
+#    分片库需在 DATABASES 中配置，并设置 OPTIONS = {"init_command": "SET foreign_key_checks = 0"}；
+#    启用后执行 python manage.py migrate --database=<分片> 与 python manage.py sync_shard_catalog
+ACCOUNT_USER_SHARDS = []
+DATABASE_ROUTERS = ["account.sharding.UserShardRouter"]
 # ------------------------------------------------ Redis ---------------------------------------------------------------
 from configs.redis_config import *
 
@@ -112,6 +121,27 @@ CACHES = {
     },
 }
 
+# ✅ 跨 worker 缓存失效总线（utensil.cache_bus）
+CACHE_BUS_CHANNEL = "pineapple:cache-bus"
+CACHE_BUS_CHECK_INTERVAL = 5  # 秒：版本号巡检周期（兜底丢失的 pub/sub 消息）
+# ✅ 角色 → 权限 → 系统 共享内存快照（None 时使用 /dev/shm）
+PERMISSION_SNAPSHOT_PATH = None
+
+# ✅ 登录校验在 account.hashing 线程池中进行
+AUTHENTICATION_BACKENDS = ["account.backends.PooledModelBackend"]
+
+# ✅ 首位为当前哈希器；库存哈希较弱（算法不同 / 迭代次数更低）时登录即透明升级（python manage.py bench_login 评估每核吞吐）
+PASSWORD_HASHERS = [
+    "account.hashing.TunedPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+PASSWORD_HASH_ITERATIONS = None  # PBKDF2-SHA256；None 时使用 Django 默认值（5.2 为 1000000），只能调高
+PASSWORD_HASHING_WORKERS = None  # None 时等于 CPU 核数
+PASSWORD_HASHING_QUEUE = 64  # 排队上限，超出后等待 PASSWORD_HASHING_TIMEOUT 秒仍无空位返回 429
+PASSWORD_HASHING_TIMEOUT = 2
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -158,7 +188,7 @@ AUTH_USER_MODEL = "account.User"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'account.authentication.ScopedJWTAuthentication',  # ✅ 请求内复用用户实例
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -166,21 +196,96 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # ✅ Redis 令牌桶限流（utensil.throttling）
+    "DEFAULT_THROTTLE_CLASSES": ["utensil.throttling.TokenBucketThrottle"],
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "120/min",
+        "user": "1200/min",
+        "user_system": "12000/min",  # 单个系统编码的总量
+        "service": "60000/min",  # 下游服务账号调用 authorize/、user/batch/（account.throttling）
+        "auth_ip": "30/min",  # 登录 / 注册 / 刷新：单个 IP
+        "auth_account": "10/min",  # 登录 / 注册：单个账号在单个 IP 上
+        "auth_system": "3000/min",  # 登录 / 注册 / 刷新：单个系统编码的总量
+    },
+    # ✅ 限流识别客户端 IP：前面可信反向代理的层数（取 X-Forwarded-For 倒数第 N 项）；
+    #    0 只用 REMOTE_ADDR，客户端自带的 X-Forwarded-For 无效；部署在一层 nginx 之后改为 1
+    "NUM_PROXIES": 0,
 }
 
+# ✅ JWT 签名：配置 RS256 密钥对后私钥只留在账户中心，下游服务用公钥本地验签（jwt/public-key/），无法伪造 Token；
+#    密钥文件不存在时回退到 HS256 + SECRET_KEY，仅限本地开发（manage.py check 给出警告）
+from configs.jwt_config import *
+
+
+def _read_key(name):
+    path = BASE_DIR / name
+    return path.read_text() if path.is_file() else ""
+
+
+JWT_PRIVATE_KEY = _read_key(JWT_PRIVATE_KEY_FILE)
+JWT_PUBLIC_KEY = _read_key(JWT_PUBLIC_KEY_FILE)
+
 SIMPLE_JWT = {
     "USER_ID_FIELD": "unified_uuid",  # ✅ 使用 unified_uuid 作为用户标识
     "USER_ID_CLAIM": "unified_uuid",  # ✅ JWT Payload 中的字段名
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=24),  # ✅ 访问 Token 有效期 24 小时
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),  # ✅ 刷新 Token 7 天有效
     "ROTATE_REFRESH_TOKENS": True,
-    "BLACKLIST_AFTER_ROTATION": True,
-    "UPDATE_LAST_LOGIN": True,
-    "ALGORITHM": "HS256",
-    "SIGNING_KEY": SECRET_KEY,
+    "BLACKLIST_AFTER_ROTATION": True,  # ✅ 黑名单存 Redis（account.token_blacklist），无需 token_blacklist 应用
+    "UPDATE_LAST_LOGIN": False,  # ✅ last_login 改由 utensil.write_behind 批量写回
+    "ALGORITHM": "RS256" if JWT_PRIVATE_KEY else "HS256",
+    "SIGNING_KEY": JWT_PRIVATE_KEY or SECRET_KEY,
+    "VERIFYING_KEY": JWT_PUBLIC_KEY,
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# ✅ Refresh Token 黑名单：本地布隆位图（每个过期日一张）兜底同步周期
+TOKEN_BLACKLIST_SYNC_INTERVAL = 60  # 秒
+TOKEN_BLACKLIST_BLOOM_BITS = 1 << 20  # 每日位图大小（128KB），约 10 万次吊销时误判率 < 1%
+TOKEN_BLACKLIST_BLOOM_HASHES = 7
+
+# ✅ 登录响应中的用户资料：lean（基础资料 + 角色名，完整资料走 myinfo/）| full（含全部权限）
+ACCOUNT_LOGIN_PROFILE = "lean"
+
+# ✅ user/batch/ 单次最多查询的用户数
+USER_BATCH_MAX = 2000
+
+# ✅ 服务账号权限码：拥有该权限（或超级管理员）的调用方可通过 authorize/ 查询任意用户
+ACCOUNT_SERVICE_PERMISSION = "account.service"
+
+# ✅ 增量同步（utensil.sync）：只返回早于当前时间该秒数的变化，避免越过未提交的事务
+SYNC_SAFETY_LAG = 5
+
+# ✅ 高频时间戳写回缓冲（utensil.write_behind）
+WRITE_BEHIND_INTERVAL = 5  # 秒
+
+# ✅ 视图响应缓存默认有效期（utensil.response_cache，按模型标签失效）
+RESPONSE_CACHE_TIMEOUT = 300  # 秒
+
+# ✅ 创建接口 Idempotency-Key 响应保留时长（utensil.idempotency）
+IDEMPOTENCY_TTL = 86400  # 秒
+
+# ✅ 软删除归档（python manage.py archive_deleted）
+ARCHIVE_AFTER_DAYS = 30
+
+# ✅ worker 启动预热（utensil.warmup）：gunicorn.conf.py / ASGI lifespan 在接收请求前执行
+WARMUP_ON_BOOT = True
+
+# ✅ 后台任务队列（utensil.task_queue，python manage.py runworker）
+TASK_QUEUE_BACKEND = "redis"  # redis | memory（进程内，仅用于本地调试 / 测试）
+TASK_QUEUES = {
+    "default": {"concurrency": 4},  # 单个 worker 进程的消费者数
+}
+TASK_DEFAULT_RETRIES = 3
+TASK_RETRY_BACKOFF = 5  # 秒：第 n 次重试等待 5 × 2^(n-1) 秒，上限 10 分钟
+
+# ✅ 大表在线迁移（utensil.online_migrations）：分批回填 + 在线建索引
+ONLINE_MIGRATION_REPLICAS = []  # 需要检查复制延迟的数据库别名
+ONLINE_MIGRATION_MAX_LAG = 5  # 秒：从库延迟超过该值时暂停回填
+ONLINE_MIGRATION_CHUNK_SIZE = 1000  # 每批（每个事务）行数
+ONLINE_MIGRATION_PAUSE = 0.05  # 秒：批间休眠
+ONLINE_MIGRATION_LOCK_TIMEOUT = 5  # 秒：MySQL 建索引时的元数据锁等待上限，超时后退避重试
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 # ------------------------------------------------ log -----------------------------------------------------------------
@@ -270,6 +375,7 @@ for app in LOG_APPS:
             'propagate': False,
         }
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 # ------------------------------------------------- Media --------------------------------------------------------------
 PDF_CONFIG = "PineappleResources/media/PDFS"
 VIDEOS_CONFIG = "PineappleResources/media/Videos"
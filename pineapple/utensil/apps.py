@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UtensilConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'utensil'
+
+    def ready(self):
+        from . import response_cache
+        response_cache.connect_signals()
@@ -0,0 +1,145 @@
+"""
+软删除归档：把软删除超过保留期的行分批移入各模型的归档表，保持主表精简
+
+- 每批在独立事务内完成：锁定 → 写归档表 → 从主表删除
+- payload 记录行本身（含正向多对多）以及会在删除时丢失的反向关联
+  （SET_NULL 外键、反向多对多），恢复时一并还原
+- 仍被 CASCADE / PROTECT 外键引用的行暂不归档，避免级联删除
+"""
+import json
+import logging
+
+from django.core import serializers
+from django.db import IntegrityError, models, transaction
+from django.dispatch import Signal
+from django.http import Http404
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from utensil import response_cache
+
+logger = logging.getLogger(__name__)
+
+_registry = {}  # 模型 → 归档模型
+
+# ✅ 恢复完成（关联表通过 bulk_create 还原，不会触发 m2m_changed）
+row_restored = Signal()  # sender=模型, instance=恢复的对象
+
+
+def register(model, archive_model):
+    _registry[model] = archive_model
+
+
+def registered():
+    return dict(_registry)
+
+
+def _reverse_relations(model):
+    """(关联描述, 类型)：类型为 set_null / m2m / blocking"""
+    for rel in model._meta.related_objects:
+        if rel.many_to_many:
+            yield rel, "m2m"
+        elif rel.one_to_many or rel.one_to_one:
+            yield rel, "set_null" if rel.on_delete is models.SET_NULL else "blocking"
+
+
+def _dump(obj):
+    reverse = {}
+    for rel, kind in _reverse_relations(type(obj)):
+        if kind == "blocking":
+            continue
+        if kind == "m2m":
+            through = rel.through
+            source = rel.field.m2m_reverse_field_name()  # 指向被归档行的一侧
+            target = rel.field.m2m_field_name()
+            pks = list(through.objects.filter(**{source: obj.pk}).values_list(f"{target}_id", flat=True))
+        else:
+            pks = list(rel.related_model._base_manager.filter(**{rel.field.name: obj.pk}).values_list("pk", flat=True))
+        if pks:
+            reverse[f"{rel.related_model._meta.label}.{rel.field.name}"] = pks
+    return {"row": json.loads(serializers.serialize("json", [obj]))[0], "reverse": reverse}
+
+
+def _blocked(model, pks):
+    """仍被 CASCADE / PROTECT 外键引用的主键"""
+    blocked = set()
+    for rel, kind in _reverse_relations(model):
+        if kind == "blocking":
+            blocked.update(rel.related_model._base_manager.filter(
+                **{f"{rel.field.name}__in": pks}).values_list(f"{rel.field.name}_id", flat=True))
+    return blocked
+
+
+def archive_model(model, days, chunk_size=500):
+    """归档单个模型，返回归档行数"""
+    archive = _registry[model]
+    cutoff = timezone.now() - timezone.timedelta(days=days)
+    candidates = model.all_objects.filter(is_deleted=True, deleted_at__lt=cutoff).order_by("pk")
+    total, last_pk = 0, ""
+    while True:
+        pks = list(candidates.filter(pk__gt=last_pk).values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            return total
+        last_pk = pks[-1]
+        with transaction.atomic():
+            rows = list(model.all_objects.select_for_update().filter(pk__in=pks, is_deleted=True))
+            blocked = _blocked(model, [row.pk for row in rows])
+            rows = [row for row in rows if row.pk not in blocked]
+            if not rows:
+                continue
+            archive.objects.bulk_create([
+                archive(uuid=row.pk, unified_uuid=row.unified_uuid, payload=_dump(row), deleted_at=row.deleted_at)
+                for row in rows
+            ], ignore_conflicts=True)
+            model.all_objects.filter(pk__in=[row.pk for row in rows]).delete()
+        total += len(rows)
+        logger.info(f"[ARCHIVE] {model._meta.label} 已归档 {total} 行（本批 {len(rows)}）")
+
+
+def restore(model, pk):
+    """从归档表恢复一行（仍为已删除状态），不存在时抛出 Http404"""
+    archive = _registry.get(model)
+    if archive is None:
+        raise Http404
+    try:
+        with transaction.atomic():
+            item = archive.objects.select_for_update().filter(pk=pk).first()
+            if item is None:
+                raise Http404
+            row = next(serializers.deserialize("python", [item.payload["row"]]))
+            row.save()
+            obj = row.object
+            for key, pks in item.payload["reverse"].items():
+                label, field_name = key.rsplit(".", 1)
+                field = next(f for f in obj._meta.related_objects if
+                             f.related_model._meta.label == label and f.field.name == field_name)
+                if field.many_to_many:
+                    through = field.through
+                    source = field.field.m2m_reverse_field_name()
+                    target = field.field.m2m_field_name()
+                    existing = field.related_model._base_manager.filter(pk__in=pks).values_list("pk", flat=True)
+                    through.objects.bulk_create(
+                        [through(**{f"{source}_id": obj.pk, f"{target}_id": related_pk}) for related_pk in existing],
+                        ignore_conflicts=True
+                    )
+                else:
+                    field.related_model._base_manager.filter(
+                        pk__in=pks, **{f"{field_name}__isnull": True}).update(**{field_name: obj})
+                response_cache.invalidate([field.related_model._meta.label_lower])  # bulk_create / update 不发送信号
+            item.delete()
+            row_restored.send(sender=model, instance=obj)
+    except IntegrityError:
+        raise ValidationError("恢复失败：唯一字段已被其他数据占用")
+    logger.info(f"[ARCHIVE] {model._meta.label} {pk} 已从归档表恢复")
+    return obj
+
+
+class RestoreFromArchiveMixin:
+    """取消删除视图：主表中找不到时尝试从归档表恢复"""
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            restore(self.get_queryset().model, self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+            return super().get_object()
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = getattr(settings, "CACHE_BUS_CHANNEL", "pineapple:cache-bus")
+VERSION_KEY = f"{CHANNEL}:version"
+CHECK_INTERVAL = getattr(settings, "CACHE_BUS_CHECK_INTERVAL", 5)
+
+
+def get_redis():
+    """获取 django-redis 原生连接（非 Redis 缓存后端时返回 None）"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except Exception:  # noqa
+        return None
+
+
+class LocalCache:
+    """
+    进程内缓存：
+    - 按命名空间（system / role / permission / user）注册到失效总线
+    - 总线不可用时直接视为未命中，保证不返回过期的授权数据
+    """
+
+    def __init__(self, namespace, maxsize=10000, whole=False):
+        """namespace 可以是多个命名空间；whole=True 时任何失效事件都清空整个缓存"""
+        self.namespaces = (namespace,) if isinstance(namespace, str) else tuple(namespace)
+        self.maxsize = maxsize
+        self.whole = whole
+        self._data = {}
+        self._lock = threading.Lock()
+        bus.register(self)
+
+    def get(self, key, default=None):
+        if not bus.ensure_started():
+            return default
+        return self._data.get(key, default)
+
+    def set(self, key, value, version=None):
+        """version 为计算前的总线版本，期间发生过失效则放弃写入"""
+        if not bus.ensure_started():
+            return
+        with self._lock:
+            if version is not None and version != bus.generation:
+                return
+            if len(self._data) >= self.maxsize:
+                self._data.clear()
+            self._data[key] = value
+
+    def get_or_set(self, key, factory):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            version = bus.generation
+            value = factory()
+            self.set(key, value, version=version)
+        return value
+
+    def evict(self, keys=None):
+        """keys 为 None 时清空整个命名空间"""
+        with self._lock:
+            if keys is None or self.whole:
+                self._data.clear()
+                return
+            for key in keys:
+                self._data.pop(key, None)
+
+
+_MISSING = object()
+
+
+class CacheBus:
+    """
+    跨 worker 缓存失效总线（Redis pub/sub）：
+    - 发布：INCR 全局版本号后 PUBLISH {"n": 命名空间, "k": 主键列表, "v": 版本号}
+    - 订阅：每个进程一个后台线程，收到事件后清理本地对应条目
+    - 兜底：定期比对全局版本号，发现丢失的消息则清空全部本地缓存
+    """
+
+    def __init__(self):
+        self._caches = defaultdict(list)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._healthy = False
+        self._applied = 0  # 已连续应用的最大版本号
+        self._pending = set()  # 乱序到达、尚未连续的版本号
+        self._remote = 0  # 上一次巡检看到的全局版本号
+        self.generation = 0  # 每次本地失效 +1，供 LocalCache.set 判断并发写入
+
+    def register(self, cache):
+        for namespace in cache.namespaces:
+            self._caches[namespace].append(cache)
+
+    # ---------------------------------------------------------------- 发布
+    def publish(self, namespace, keys=None):
+        """发布失效事件（同时立即清理本进程）"""
+        keys = [str(k) for k in keys] if keys is not None else None
+        self._evict(namespace, keys)
+        conn = get_redis()
+        if conn is None:
+            return
+        try:
+            version = conn.incr(VERSION_KEY)
+            conn.publish(CHANNEL, json.dumps({"n": namespace, "k": keys, "v": version}, separators=(",", ":")))
+        except Exception as e:  # noqa
+            logger.error(f"[CACHE_BUS] 发布失效事件失败 {namespace}: {e}")
+
+    def publish_on_commit(self, namespace, keys=None):
+        """事务提交后再发布，避免其他 worker 读到未提交的数据（不在事务中时立即发布）"""
+        keys = list(keys) if keys is not None else None
+        transaction.on_commit(lambda: self.publish(namespace, keys))
+
+    # ---------------------------------------------------------------- 订阅
+    def ensure_started(self):
+        """按进程懒启动订阅线程（兼容 gunicorn preload 后 fork），返回总线是否可用"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._healthy = False
+                    self._clear_all()
+                    threading.Thread(target=self._run, name="cache-bus", daemon=True).start()
+        return self._healthy
+
+    def in_sync(self):
+        """已收到的版本号连续：没有乱序到达、尚未补齐（或已丢失）的失效消息"""
+        return not self._pending
+
+    def _run(self):
+        pid = self._pid
+        backoff = 1
+        while pid == os.getpid():
+            conn = get_redis()
+            if conn is None:
+                logger.warning("[CACHE_BUS] 未配置 Redis，进程内缓存已停用")
+                return
+            try:
+                pubsub = conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                self._applied = self._remote = int(conn.get(VERSION_KEY) or 0)
+                self._pending.clear()
+                self._healthy = True
+                backoff = 1
+                next_check = time.monotonic() + CHECK_INTERVAL
+                while pid == os.getpid():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self._on_message(message["data"])
+                    if time.monotonic() >= next_check:
+                        self._check_version(int(conn.get(VERSION_KEY) or 0))
+                        next_check = time.monotonic() + CHECK_INTERVAL
+            except Exception as e:  # noqa
+                logger.error(f"[CACHE_BUS] 订阅中断，{backoff}s 后重连: {e}")
+            # 断线期间无法感知失效，清空并停用本地缓存
+            self._healthy = False
+            self._clear_all()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _on_message(self, data):
+        try:
+            event = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        self._evict(event.get("n"), event.get("k"))
+        version = int(event.get("v") or 0)
+        if version > self._applied:
+            self._pending.add(version)
+            while self._applied + 1 in self._pending:
+                self._applied += 1
+                self._pending.discard(self._applied)
+
+    def _check_version(self, remote):
+        """上一轮巡检时的版本号仍未连续应用到位，说明有消息丢失"""
+        if self._applied < self._remote:
+            logger.warning(f"[CACHE_BUS] 检测到丢失的失效消息（本地 {self._applied} < 全局 {self._remote}），清空本地缓存")
+            self._clear_all()
+            self._applied = max(self._remote, self._applied)
+            self._pending = {v for v in self._pending if v > self._applied}
+        self._remote = remote
+
+    # ---------------------------------------------------------------- 清理
+    def _evict(self, namespace, keys):
+        self.generation += 1
+        for cache in self._caches.get(namespace, ()):
+            cache.evict(keys)
+
+    def _clear_all(self):
+        self.generation += 1
+        for caches in list(self._caches.values()):
+            for cache in caches:
+                cache.evict()
+
+
+bus = CacheBus()
@@ -1,4 +1,14 @@
-from rest_framework import generics
+import hashlib
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from utensil.response_cache import ResponseCacheMixin
 
 
 class MyBaseAPIView:
@@ -12,16 +22,149 @@ class MyBaseAPIView:
         return result
 
 
-class RetrieveAPIView(generics.RetrieveAPIView, MyBaseAPIView): pass
+class ConditionalGetMixin:
+    """
+    GET 条件请求（ETag），在序列化之前判断，命中时直接返回 304
+    - 详情：按主键只查 (update_at, pk) 一列
+    - 列表：对过滤后的查询集做一次 max(update_at) + count 聚合，ETag 同时包含查询参数（分页 / 过滤）；
+      行被软删除后退出查询集，max 可能不变，由 count 体现
+    - 不发送 Last-Modified：HTTP 日期只精确到秒，同一秒内的写入会被 If-Modified-Since 误判为未修改；
+      ETag 使用微秒精度的时间戳
+    - 输出包含关联对象时，在 conditional_related 中列出关联路径，其 update_at 一并计入
+    - 不适用的视图可设置 conditional_field = None 关闭
+    """
+    conditional_field = "update_at"
+    conditional_related = ()
+
+    def get_conditional_etag(self):
+        """返回 ETag；不适用时返回 None"""
+        queryset = self.get_queryset()
+        try:
+            queryset.model._meta.get_field(self.conditional_field or "")
+        except FieldDoesNotExist:
+            return None
+        queryset = self.filter_queryset(queryset).order_by()
+        related = [f"{path}__{self.conditional_field}" for path in self.conditional_related]
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            row = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}).values_list(
+                "pk", self.conditional_field, *related).first()
+            if row is None:
+                return None  # 交给视图返回 404
+            key, stamps = row[0], row[1:]
+        else:
+            agg = queryset.aggregate(*[Max(field) for field in [self.conditional_field, *related]], count=Count("pk"))
+            count = agg.pop("count")
+            key, stamps = f"{count}|{self.request.GET.urlencode()}", list(agg.values())
+        raw = f"{self.request.path}|{key}|{'|'.join(stamp.isoformat() for stamp in stamps if stamp is not None)}"
+        return "W/" + quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_conditional_etag() if self.conditional_field else None
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+        not_modified = get_conditional_response(request._request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response["ETag"] = etag
+            response["Cache-Control"] = "private, no-cache"  # 客户端每次都需重新验证
+        return response
+
+
+class SparseFieldsMixin:
+    """
+    ?fields=a,b / ?exclude=c：裁剪序列化输出，并用 .only() 裁剪 SELECT 列（仅 GET）
+    - 字段名按序列化器声明的字段校验，无法借此读取未声明的列
+    - 保留字段的 source 无法对应到模型列（方法字段、属性等）时不裁剪 SELECT，只裁剪输出
+    """
+    fields_param = "fields"
+    exclude_param = "exclude"
+
+    def get_sparse_fields(self):
+        """返回保留的字段名列表；未指定时返回 None"""
+        if self.request is None or self.request.method not in ("GET", "HEAD"):
+            return None
+        if hasattr(self, "_sparse_fields"):
+            return self._sparse_fields
+        fields = self.request.query_params.get(self.fields_param)
+        exclude = self.request.query_params.get(self.exclude_param)
+        self._sparse_fields = None
+        if fields or exclude:
+            declared = list(self.get_serializer_class()().fields)
+            wanted = [f for f in (fields or "").split(",") if f] or declared
+            excluded = {f for f in (exclude or "").split(",") if f}
+            unknown = sorted((set(wanted) | excluded) - set(declared))
+            if unknown:
+                raise ValidationError({self.fields_param: f"未知字段: {', '.join(unknown)}"})
+            self._sparse_fields = [f for f in declared if f in wanted and f not in excluded]
+        return self._sparse_fields
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        keep = self.get_sparse_fields()
+        if keep is not None:
+            target = getattr(serializer, "child", serializer)
+            for name in list(target.fields):
+                if name not in keep:
+                    target.fields.pop(name)
+        return serializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        keep = self.get_sparse_fields()
+        if keep is None:
+            return queryset
+        columns = _selected_columns(queryset, self.get_serializer_class()().fields, keep)
+        return queryset.only(*columns) if columns else queryset
+
+
+def _selected_columns(queryset, fields, keep):
+    """保留字段对应的模型列（含 select_related 的外键与主键）；无法完全对应时返回 None"""
+    model = queryset.model
+    select_related = queryset.query.select_related
+    if select_related is True:
+        return None
+    columns = {model._meta.pk.name, *(select_related or {})}
+    for name in keep:
+        source = fields[name].source
+        if source == "*":
+            return None
+        try:
+            field = model._meta.get_field(source.split(".")[0])
+        except FieldDoesNotExist:
+            return None
+        if field.many_to_many:  # 多对多由单独查询获取，不占用主表列
+            continue
+        if not field.concrete:
+            return None
+        columns.add(field.name)
+    return sorted(columns)
+
+
+class ReadMixin(ResponseCacheMixin, ConditionalGetMixin, SparseFieldsMixin):
+    """GET 优化：响应缓存（含 ETag，命中时不查库）→ 条件请求 → 字段裁剪（按此顺序短路）"""
+
+
+class RetrieveAPIView(ReadMixin, generics.RetrieveAPIView, MyBaseAPIView): pass
 
 
 class GenericAPIView(generics.GenericAPIView, MyBaseAPIView): pass
 
 
-class CreateAPIView(generics.CreateAPIView, MyBaseAPIView): pass
+class CreateAPIView(generics.CreateAPIView, MyBaseAPIView):
+    def create(self, request, *args, **kwargs):
+        """序列化器返回已存在的对象时（created = False，见 utensil.serializers.InsertOrGetCreateMixin）响应 200"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        code = status.HTTP_200_OK if getattr(serializer, "created", None) is False else status.HTTP_201_CREATED
+        return Response(serializer.data, status=code, headers=headers)
 
 
-class ListAPIView(generics.ListAPIView, MyBaseAPIView): pass
+class ListAPIView(ReadMixin, generics.ListAPIView, MyBaseAPIView): pass
 
 
 class DestroyAPIView(generics.DestroyAPIView, MyBaseAPIView): pass
@@ -30,13 +173,13 @@ class DestroyAPIView(generics.DestroyAPIView, MyBaseAPIView): pass
 class UpdateAPIView(generics.UpdateAPIView, MyBaseAPIView): pass
 
 
-class ListCreateAPIView(generics.ListCreateAPIView, MyBaseAPIView): pass
+class ListCreateAPIView(ReadMixin, generics.ListCreateAPIView, MyBaseAPIView): pass
 
 
-class RetrieveUpdateAPIView(generics.RetrieveUpdateAPIView, MyBaseAPIView): pass
+class RetrieveUpdateAPIView(ReadMixin, generics.RetrieveUpdateAPIView, MyBaseAPIView): pass
 
 
-class RetrieveDestroyAPIView(generics.RetrieveDestroyAPIView, MyBaseAPIView): pass
+class RetrieveDestroyAPIView(ReadMixin, generics.RetrieveDestroyAPIView, MyBaseAPIView): pass
 
 
-class RetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView, MyBaseAPIView): pass
+class RetrieveUpdateDestroyAPIView(ReadMixin, generics.RetrieveUpdateDestroyAPIView, MyBaseAPIView): pass
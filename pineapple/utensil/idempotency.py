@@ -0,0 +1,50 @@
+"""
+Idempotency-Key：客户端重试同一个创建请求时直接返回首次的响应
+
+- 缓存键 = 路径 + 用户（匿名为 IP）+ Idempotency-Key，保留 IDEMPOTENCY_TTL 秒
+- 同一个 Key 携带不同请求体时返回 422；首个请求尚在处理中时返回 409
+- 5xx 响应不缓存，允许客户端重试
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = "Idempotency-Key"
+TTL = getattr(settings, "IDEMPOTENCY_TTL", 86400)
+LOCK_TIMEOUT = 30
+
+
+class IdempotentCreateMixin:
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+
+        ident = request.user.pk if request.user and request.user.is_authenticated else request.META.get("REMOTE_ADDR")
+        cache_key = "idempotency:" + hashlib.sha256(f"{request.path}|{ident}|{key}".encode()).hexdigest()
+        fingerprint = hashlib.sha256(json.dumps(request.data, sort_keys=True, default=str).encode()).hexdigest()
+
+        stored = cache.get(cache_key)
+        if stored is None:
+            if not cache.add(f"{cache_key}:lock", 1, LOCK_TIMEOUT):
+                return Response(self.msg(code=409, msg="相同 Idempotency-Key 的请求正在处理中"),
+                                status=status.HTTP_409_CONFLICT)
+            try:
+                response = super().create(request, *args, **kwargs)
+                if response.status_code < 500:
+                    cache.set(cache_key, {"fp": fingerprint, "status": response.status_code, "data": response.data}, TTL)
+            finally:
+                cache.delete(f"{cache_key}:lock")
+            return response
+
+        if stored["fp"] != fingerprint:
+            return Response(self.msg(code=422, msg="Idempotency-Key 已用于不同的请求"),
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        response = Response(stored["data"], status=stored["status"])
+        response["Idempotent-Replayed"] = "true"
+        return response
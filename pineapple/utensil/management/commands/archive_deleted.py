@@ -0,0 +1,30 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utensil import archive
+
+
+class Command(BaseCommand):
+    help = "把软删除超过保留期的行分批移入归档表"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=getattr(settings, "ARCHIVE_AFTER_DAYS", 30),
+                            help="软删除超过多少天后归档")
+        parser.add_argument("--chunk-size", type=int, default=500, help="每个事务处理的行数")
+        parser.add_argument("--model", action="append", default=[], help="只归档指定模型，如 account.Role（可多次指定）")
+
+    def handle(self, *args, **options):
+        models = list(archive.registered())
+        if options["model"]:
+            try:
+                models = [apps.get_model(label) for label in options["model"]]
+            except LookupError as e:
+                raise CommandError(str(e))
+            unknown = [m._meta.label for m in models if m not in archive.registered()]
+            if unknown:
+                raise CommandError(f"未注册归档表: {', '.join(unknown)}")
+
+        for model in models:
+            count = archive.archive_model(model, days=options["days"], chunk_size=options["chunk_size"])
+            self.stdout.write(f"{model._meta.label}: 归档 {count} 行")
@@ -0,0 +1,42 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import autodiscover_modules
+
+from utensil import task_queue
+
+
+class Command(BaseCommand):
+    help = "启动后台任务 worker（utensil.task_queue），SIGTERM / Ctrl+C 时等待执行中的任务完成后退出"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queue", action="append", default=[],
+                            help="消费的队列，可写作 名称:并发数（可多次指定，默认 TASK_QUEUES 中的全部队列）")
+        parser.add_argument("--pool", choices=["thread", "process"], default="thread",
+                            help="thread：消费者线程直接执行；process：任务在子进程中执行（CPU 密集型任务）")
+        parser.add_argument("--burst", action="store_true", help="执行完队列中已有的消息后退出")
+
+    def handle(self, *args, **options):
+        autodiscover_modules("tasks")
+        queues = {}
+        for item in options["queue"]:
+            name, _, concurrency = item.partition(":")
+            if name not in task_queue.QUEUES:
+                raise CommandError(f"未在 TASK_QUEUES 中配置的队列: {name}")
+            queues[name] = int(concurrency) if concurrency else task_queue.QUEUES[name].get("concurrency", 1)
+        worker = task_queue.Worker(queues or None, pool=options["pool"])
+
+        if options["burst"]:
+            count = worker.drain()
+            self.stdout.write(f"已执行 {count} 条消息")
+            return
+
+        stopped = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: stopped.set())
+        self.stdout.write(f"worker {worker.worker_id} 已启动，任务: {', '.join(sorted(task_queue.registered()))}")
+        worker.start()
+        stopped.wait()
+        self.stdout.write("正在等待执行中的任务完成……")
+        worker.stop()
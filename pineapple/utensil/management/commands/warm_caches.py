@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from utensil import warmup
+
+
+class Command(BaseCommand):
+    help = "执行启动预热（权限快照、路由、序列化器、数据库 / Redis 连接），输出各项耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", action="append", default=[],
+                            help=f"只执行指定项（可多次指定）：{', '.join(warmup.registered())}")
+
+    def handle(self, *args, **options):
+        unknown = [name for name in options["only"] if name not in warmup.registered()]
+        if unknown:
+            raise CommandError(f"未知的预热项: {', '.join(unknown)}")
+        failed = []
+        for name, seconds in warmup.run(options["only"] or None).items():
+            if seconds is None:
+                failed.append(name)
+                self.stdout.write(f"{name}: 失败")
+            else:
+                self.stdout.write(f"{name}: {seconds * 1000:.0f}ms")
+        if failed:
+            raise CommandError(f"预热失败: {', '.join(failed)}")
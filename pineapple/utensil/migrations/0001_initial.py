@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=200, primary_key=True, serialize=False, verbose_name='回填名称')),
+                ('last_pk', models.CharField(blank=True, default='', max_length=255, verbose_name='已处理到的主键')),
+                ('rows_done', models.BigIntegerField(default=0, verbose_name='已处理行数')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='开始时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+            ],
+            options={
+                'verbose_name': '回填检查点',
+                'verbose_name_plural': '回填检查点',
+            },
+        ),
+    ]
@@ -42,3 +42,32 @@ class Base(models.Model):
         self.is_deleted = False
         self.deleted_at = None
         self.save(update_fields=["is_deleted", "deleted_at", "updated_at"])
+
+
+# ✅ 归档表基类：每个被归档模型一张表，payload 保存序列化后的行与反向关联
+class ArchiveBase(models.Model):
+    uuid = models.CharField("原主键", primary_key=True, max_length=25)
+    unified_uuid = models.CharField("统一UUID标识", max_length=25, db_index=True)
+    payload = models.JSONField("归档数据")
+    deleted_at = models.DateTimeField("删除时间", null=True, blank=True)
+    archived_at = models.DateTimeField("归档时间", default=timezone.now, db_index=True)
+
+    class Meta:
+        abstract = True
+
+
+# ✅ 分批回填检查点（utensil.online_migrations）：中断后从 last_pk 继续
+class BackfillCheckpoint(models.Model):
+    name = models.CharField("回填名称", primary_key=True, max_length=200)
+    last_pk = models.CharField("已处理到的主键", max_length=255, blank=True, default="")
+    rows_done = models.BigIntegerField("已处理行数", default=0)
+    started_at = models.DateTimeField("开始时间", default=timezone.now)
+    updated_at = models.DateTimeField("更新时间", auto_now=True)
+    finished_at = models.DateTimeField("完成时间", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "回填检查点"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.name
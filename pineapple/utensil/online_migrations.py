@@ -0,0 +1,292 @@
+"""
+大表在线迁移工具（以 MySQL 为主，其他数据库退化为等价的普通语句）
+
+- Backfill / RunBackfill：按主键 keyset 分批回填，每批一个独立的短事务；
+  批间检查从库复制延迟并限速，检查点（BackfillCheckpoint）与本批数据在同一事务内提交，
+  中断后重新执行从断点继续，已完成的回填不再重复执行；定期输出进度与预计剩余时间
+- AddIndexOnline / RemoveIndexOnline：MySQL 使用 ALGORITHM=INPLACE, LOCK=NONE 建 / 删索引（期间不阻塞读写），
+  并缩短元数据锁等待时间、超时重试，避免 DDL 排队时阻塞后续查询；PostgreSQL 使用 CONCURRENTLY
+- 使用这些操作的迁移需声明 atomic = False，否则每批回填无法独立提交；
+  RunBackfill 所在迁移还需依赖 ("utensil", "0001_initial")（检查点表）
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connections, transaction
+from django.db.migrations import AddIndex, RemoveIndex
+from django.db.migrations.operations.base import Operation
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+REPLICAS = getattr(settings, "ONLINE_MIGRATION_REPLICAS", [])  # 需要检查复制延迟的数据库别名
+MAX_LAG = getattr(settings, "ONLINE_MIGRATION_MAX_LAG", 5)  # 秒
+CHUNK_SIZE = getattr(settings, "ONLINE_MIGRATION_CHUNK_SIZE", 1000)
+PAUSE = getattr(settings, "ONLINE_MIGRATION_PAUSE", 0.05)  # 批间休眠（秒）
+LOCK_TIMEOUT = getattr(settings, "ONLINE_MIGRATION_LOCK_TIMEOUT", 5)  # MySQL 元数据锁等待（秒）
+LOCK_RETRIES = 10
+PROGRESS_INTERVAL = 10  # 秒
+
+MYSQL_LOCK_WAIT_TIMEOUT = 1205
+
+
+# ------------------------------------------------------------------------------------------------------------ 从库延迟
+def _replica_lag(alias):
+    """单个从库的复制延迟（秒）；复制中断或无法获取时返回 None"""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())")
+            row = cursor.fetchone()
+            return float(row[0]) if row and row[0] is not None else None
+        if connection.vendor != "mysql":
+            return 0
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except DatabaseError:  # MySQL 8.0.22 以前
+            cursor.execute("SHOW SLAVE STATUS")
+        row = cursor.fetchone()
+        if row is None:  # 不是从库
+            return 0
+        status = dict(zip([col[0] for col in cursor.description], row))
+        lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        return float(lag) if lag is not None else None
+
+
+def replica_lag(aliases=None):
+    """各从库复制延迟的最大值（秒）；任一从库无法获取时返回 None"""
+    worst = 0
+    for alias in REPLICAS if aliases is None else aliases:
+        try:
+            lag = _replica_lag(alias)
+        except DatabaseError as e:
+            logger.warning(f"[ONLINE_MIGRATION] 读取从库 {alias} 延迟失败: {e}")
+            return None
+        if lag is None:
+            return None
+        worst = max(worst, lag)
+    return worst
+
+
+def wait_for_replicas(max_lag=None, aliases=None):
+    """从库延迟超过 max_lag 秒时等待其追上（复制中断时一直等待，不冒险继续写入）"""
+    max_lag = MAX_LAG if max_lag is None else max_lag
+    backoff = 1
+    while True:
+        lag = replica_lag(aliases)
+        if lag is not None and lag <= max_lag:
+            return
+        logger.warning(f"[ONLINE_MIGRATION] 从库延迟 {'未知' if lag is None else f'{lag:.0f}s'}，{backoff}s 后重试")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 30)
+
+
+# ------------------------------------------------------------------------------------------------------------ 回填
+def estimate_rows(model, using="default"):
+    """表行数估计值（MySQL / PostgreSQL 读统计信息，避免全表 COUNT）"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                           "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table])
+        elif connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        else:
+            return model._base_manager.using(using).count()
+        row = cursor.fetchone()
+    return max(int(row[0] or 0), 0) if row else 0
+
+
+class Backfill:
+    """
+    按主键分批执行 queryset.filter(pk__in=本批).update(**values)
+    values 也可以是函数 fn(本批 queryset) → 处理行数，用于无法用一条 UPDATE 表达的回填
+    """
+
+    def __init__(self, queryset, values, name, chunk_size=None, max_lag=None, pause=None):
+        self.queryset = queryset
+        self.values = values
+        self.name = name
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self.max_lag = max_lag
+        self.pause = PAUSE if pause is None else pause
+        self.using = queryset.db
+
+    def apply(self, chunk):
+        if callable(self.values):
+            return self.values(chunk)
+        return chunk.update(**self.values)
+
+    def run(self):
+        """返回累计处理行数"""
+        from utensil.models import BackfillCheckpoint
+
+        checkpoints = BackfillCheckpoint.objects.using(self.using)
+        checkpoint, _ = checkpoints.get_or_create(name=self.name)
+        if checkpoint.finished_at is not None:
+            logger.info(f"[BACKFILL] {self.name} 已于 {checkpoint.finished_at} 完成，跳过")
+            return checkpoint.rows_done
+
+        model = self.queryset.model
+        pk_field = model._meta.pk
+        total = estimate_rows(model, self.using)
+        started, reported, rows_at_start = time.monotonic(), time.monotonic(), checkpoint.rows_done
+        if checkpoint.last_pk:
+            logger.info(f"[BACKFILL] {self.name} 从检查点 {checkpoint.last_pk} 继续（已处理 {checkpoint.rows_done} 行）")
+
+        while True:
+            wait_for_replicas(self.max_lag)
+            pending = self.queryset.order_by("pk")
+            if checkpoint.last_pk:
+                pending = pending.filter(pk__gt=pk_field.to_python(checkpoint.last_pk))
+            pks = list(pending.values_list("pk", flat=True)[:self.chunk_size])
+            if not pks:
+                break
+            with transaction.atomic(using=self.using):
+                self.apply(self.queryset.filter(pk__in=pks))  # 重新带上过滤条件，保证重复执行幂等
+                checkpoint.last_pk = str(pks[-1])
+                checkpoint.rows_done += len(pks)
+                checkpoint.save(using=self.using, update_fields=["last_pk", "rows_done", "updated_at"])
+
+            if time.monotonic() - reported >= PROGRESS_INTERVAL:
+                reported = time.monotonic()
+                rate = (checkpoint.rows_done - rows_at_start) / max(reported - started, 1e-6)
+                remaining = max(total - checkpoint.rows_done, 0)
+                logger.info(f"[BACKFILL] {self.name}: {checkpoint.rows_done}/~{total} 行，"
+                            f"{rate:.0f} 行/s，预计剩余 {remaining / rate if rate else 0:.0f}s")
+            if self.pause:
+                time.sleep(self.pause)
+
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(using=self.using, update_fields=["finished_at", "updated_at"])
+        logger.info(f"[BACKFILL] {self.name} 完成，共 {checkpoint.rows_done} 行，"
+                    f"耗时 {time.monotonic() - started:.0f}s")
+        return checkpoint.rows_done
+
+
+class RunBackfill(Operation):
+    """
+    迁移操作：RunBackfill("user", values={"field": 值或表达式}, filter={"field__isnull": True}, name="...")
+    name 全局唯一（检查点主键），建议包含迁移名；回滚时不做任何操作
+    """
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, model_name, values, filter=None, name=None, chunk_size=None):  # noqa
+        self.model_name = model_name
+        self.values = values
+        self.filter = filter or {}
+        self.name = name
+        self.chunk_size = chunk_size
+
+    def deconstruct(self):
+        kwargs = {"model_name": self.model_name, "values": self.values}
+        for key in ("filter", "name", "chunk_size"):
+            if getattr(self, key):
+                kwargs[key] = getattr(self, key)
+        return self.__class__.__qualname__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.atomic_migration:
+            raise ValueError("RunBackfill 所在迁移需声明 atomic = False")
+        name = self.name or f"{app_label}.{self.model_name}:{','.join(sorted(self.values))}"
+        queryset = model._base_manager.using(schema_editor.connection.alias).filter(**self.filter)
+        Backfill(queryset, self.values, name, chunk_size=self.chunk_size).run()
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+    def describe(self):
+        return f"Backfill {', '.join(self.values)} on {self.model_name} in chunks"
+
+
+# ------------------------------------------------------------------------------------------------------------ 在线索引
+def _execute_online(schema_editor, sql):
+    """MySQL：缩短元数据锁等待，拿不到锁时退避重试，避免 DDL 排队阻塞线上查询"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT @@SESSION.lock_wait_timeout")
+        previous = cursor.fetchone()[0]
+        cursor.execute("SET SESSION lock_wait_timeout = %s", [LOCK_TIMEOUT])
+        try:
+            for attempt in range(1, LOCK_RETRIES + 1):
+                try:
+                    cursor.execute(f"{sql} ALGORITHM=INPLACE LOCK=NONE")
+                    return
+                except OperationalError as e:
+                    if e.args[0] != MYSQL_LOCK_WAIT_TIMEOUT or attempt == LOCK_RETRIES:
+                        raise
+                    logger.warning(f"[ONLINE_MIGRATION] 等待元数据锁超时，第 {attempt} 次重试: {sql}")
+                    time.sleep(min(2 ** attempt, 30))
+        finally:
+            cursor.execute("SET SESSION lock_wait_timeout = %s", [previous])
+
+
+def _online_vendor(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql" and schema_editor.atomic_migration:
+        raise ValueError("CONCURRENTLY 不能在事务中执行，所在迁移需声明 atomic = False")
+    return vendor
+
+
+def create_index_online(schema_editor, model, index):
+    vendor = _online_vendor(schema_editor)
+    if vendor == "mysql":
+        _execute_online(schema_editor, str(index.create_sql(model, schema_editor)))
+    elif vendor == "postgresql":
+        schema_editor.add_index(model, index, concurrently=True)
+    else:
+        schema_editor.add_index(model, index)
+
+
+def drop_index_online(schema_editor, model, index):
+    vendor = _online_vendor(schema_editor)
+    if vendor == "mysql":
+        _execute_online(schema_editor, str(index.remove_sql(model, schema_editor)))
+    elif vendor == "postgresql":
+        schema_editor.remove_index(model, index, concurrently=True)
+    else:
+        schema_editor.remove_index(model, index)
+
+
+class AddIndexOnline(AddIndex):
+    """与 AddIndex 相同的模型状态，数据库上在线建索引"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            create_index_online(schema_editor, model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            drop_index_online(schema_editor, model, self.index)
+
+    def describe(self):
+        return f"{super().describe()} (online)"
+
+
+class RemoveIndexOnline(RemoveIndex):
+    """与 RemoveIndex 相同的模型状态，数据库上在线删索引"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = from_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+            drop_index_online(schema_editor, model, index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = to_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+            create_index_online(schema_editor, model, index)
+
+    def describe(self):
+        return f"{super().describe()} (online)"
@@ -0,0 +1,39 @@
+"""
+请求级身份映射（identity map）与记忆化
+
+- RequestScopeMiddleware 为每个请求创建一个字典，保存在 contextvar 中（同步 / 异步视图均适用）
+- memoize(key, factory)：同一请求内相同 key 只计算一次；请求之外（管理命令、后台线程）不缓存
+- 同一请求内发生写入时由信号调用 clear()，之后的读取重新加载，保证读到本请求自己的修改
+"""
+import contextvars
+
+_scope = contextvars.ContextVar("request_scope", default=None)
+
+
+def memoize(key, factory):
+    store = _scope.get()
+    if store is None:
+        return factory()
+    if key not in store:
+        store[key] = factory()
+    return store[key]
+
+
+def clear():
+    store = _scope.get()
+    if store is not None:
+        store.clear()
+
+
+class RequestScopeMiddleware:
+    """需放在所有会读取用户权限的中间件之前"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _scope.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _scope.reset(token)
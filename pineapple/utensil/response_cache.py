@@ -0,0 +1,166 @@
+"""
+按模型标签失效的视图响应缓存
+
+- 视图声明 cache_tags = ("account.Role", ...) 即启用（另可设置 cache_timeout），未声明的视图不受影响
+- 可用作标签的模型在 AppConfig.ready() 中 register() 登记：失效不依赖视图模块是否被导入
+  （runworker、管理命令、shell 中的写入同样生效）；视图使用未登记的标签时报错
+- 缓存键 = 路径 + 排序后的查询参数 + 响应格式 + 调用方授权范围 + 各标签当前版本号；
+  值为渲染后的字节与 ETag（utensil.generics.ConditionalGetMixin），命中时直接按其判断 304，不再查询数据库
+- 标签对应模型任一写入（save / delete / 多对多变化）在事务提交后 INCR 标签版本号，旧条目随之失效、按 TTL 过期
+- 标签版本号在进程内缓存，经失效总线（utensil.cache_bus）同步清理；未配置 Redis 时不缓存
+- QuerySet.update() / bulk_create() / 原生 SQL 不发送信号：这类写入若改变缓存视图中的字段，写入后需调用 invalidate()
+  （登录时的密码重哈希、write_behind 写回的 last_login 不出现在缓存视图中，无需失效）
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from utensil.cache_bus import LocalCache, bus, get_redis
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "response-cache"
+TIMEOUT = getattr(settings, "RESPONSE_CACHE_TIMEOUT", 300)
+
+_tagged = set()  # 已登记的模型标签（小写）
+_versions = LocalCache(NAMESPACE, maxsize=1000)
+
+
+def register(*models):
+    """登记可作为 cache_tags 的模型（在 AppConfig.ready() 中调用）"""
+    _tagged.update(model._meta.label_lower for model in models)
+
+
+def _tag_key(tag):
+    return f"rc:tag:{tag}"
+
+
+def tag_versions(tags):
+    """标签 → 版本号（进程内未命中的合并为一次 MGET）"""
+    result, missing = {}, []
+    for tag in tags:
+        version = _versions.get(tag)
+        if version is None:
+            missing.append(tag)
+        else:
+            result[tag] = version
+    if missing:
+        generation = bus.generation
+        for tag, raw in zip(missing, get_redis().mget([_tag_key(tag) for tag in missing])):
+            result[tag] = int(raw or 0)
+            _versions.set(tag, result[tag], version=generation)
+    return result
+
+
+def invalidate(tags):
+    """提交后递增标签版本号并通知其他 worker；未登记的标签忽略"""
+    tags = sorted(set(tags) & _tagged)
+    if not tags:
+        return
+
+    def bump():
+        conn = get_redis()
+        if conn is None:
+            return
+        try:
+            pipe = conn.pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(_tag_key(tag))
+            pipe.execute()
+        except Exception as e:  # noqa
+            logger.error(f"[RESPONSE_CACHE] 递增标签版本失败 {tags}: {e}")
+        bus.publish(NAMESPACE, tags)
+
+    transaction.on_commit(bump)
+
+
+def model_written(sender, **kwargs):
+    invalidate([sender._meta.label_lower])
+
+
+def relation_written(sender, instance, action, model, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate([type(instance)._meta.label_lower, model._meta.label_lower])
+
+
+def connect_signals():
+    post_save.connect(model_written, dispatch_uid="response_cache_save")
+    post_delete.connect(model_written, dispatch_uid="response_cache_delete")
+    m2m_changed.connect(relation_written, dispatch_uid="response_cache_m2m")
+
+
+class ResponseCacheMixin:
+    """GET 响应缓存，声明 cache_tags 后生效"""
+    cache_tags = ()
+    cache_timeout = None
+
+    def get_cache_scope(self, request):
+        """授权范围：超级用户 / 匿名 / 角色集合相同的用户共享缓存"""
+        user = request.user
+        if not user or not user.is_authenticated:
+            return "anon"
+        if user.is_superuser:
+            return "su"
+        role_uuids = user.role_uuids() if hasattr(user, "role_uuids") else (user.pk,)
+        return "roles:" + ",".join(sorted(role_uuids))
+
+    def get_response_cache_key(self, request):
+        tags = [tag.lower() for tag in self.cache_tags]
+        versions = tag_versions(tags)
+        query = sorted((k, v) for k in request.query_params for v in request.query_params.getlist(k))
+        raw = json.dumps([
+            request.path, query, request.accepted_media_type, self.get_cache_scope(request),
+            [versions[tag] for tag in tags],
+        ], separators=(",", ":"))
+        return "rc2:" + hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        self._response_cache_key = None
+        conn = get_redis() if self.cache_tags else None
+        if conn is not None:
+            for tag in self.cache_tags:
+                if tag.lower() not in _tagged:  # 未登记的模型写入时不会失效，缓存会一直陈旧
+                    raise ImproperlyConfigured(f"缓存标签 {tag} 未登记，请在 AppConfig.ready() 中调用 response_cache.register()")
+            try:
+                key = self.get_response_cache_key(request)
+                cached = conn.get(key)
+            except Exception as e:  # noqa
+                logger.error(f"[RESPONSE_CACHE] 读取失败，直接查询: {e}")
+            else:
+                if cached is not None:
+                    return self.cached_response(request, cached)
+                self._response_cache_key = key
+        return super().get(request, *args, **kwargs)
+
+    def cached_response(self, request, cached):  # noqa
+        content_type, etag, content = cached.split(b"\n", 2)
+        etag = etag.decode()
+        if etag:
+            not_modified = get_conditional_response(request._request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+        response = HttpResponse(content, content_type=content_type.decode())
+        if etag:
+            response["ETag"] = etag
+            response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, "_response_cache_key", None)
+        if key and response.status_code == 200 and hasattr(response, "render"):
+            response.render()
+            try:
+                header = f"{response['Content-Type']}\n{response.get('ETag', '')}\n".encode()
+                get_redis().set(key, header + response.content,
+                                ex=self.cache_timeout or TIMEOUT)
+            except Exception as e:  # noqa
+                logger.error(f"[RESPONSE_CACHE] 写入失败: {e}")
+        return response
@@ -0,0 +1,108 @@
+from django.db import connections, router
+from django.db.models.sql import InsertQuery
+from django.db.models.signals import post_save
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+
+class AllRowsUniqueMixin(serializers.ModelSerializer):
+    """
+    唯一性校验包含已软删除的行：
+    - 默认管理器 objects 只返回未删除行，DRF 生成的 UniqueValidator 使用 _default_manager，
+      已删除行占用的值会通过校验、写库时 IntegrityError（500）
+    - 模型有 all_objects 时改用它校验
+    """
+
+    def build_standard_field(self, field_name, model_field):
+        field_class, field_kwargs = super().build_standard_field(field_name, model_field)
+        manager = getattr(model_field.model, "all_objects", None)
+        if manager is not None and field_kwargs.get("validators"):
+            field_kwargs["validators"] = [
+                UniqueValidator(queryset=manager.all(), message=validator.message, lookup=validator.lookup)
+                if isinstance(validator, UniqueValidator) else validator
+                for validator in field_kwargs["validators"]
+            ]
+        return field_class, field_kwargs
+
+
+class ChangedFieldsUpdateMixin(AllRowsUniqueMixin):
+    """
+    只更新真正变化的字段：
+    - 无变化时不写库（也不刷新 auto_now 的 update_at）
+    - 有变化时 save(update_fields=...)，只写变化列 + update_at
+    - 多对多字段通过 .set() 写入关联表
+    """
+
+    def update(self, instance, validated_data):
+        m2m = {field.name for field in instance._meta.many_to_many}
+        changed = []
+        for attr, value in validated_data.items():
+            if attr in m2m:
+                getattr(instance, attr).set(value)
+            elif getattr(instance, attr) != value:
+                setattr(instance, attr, value)
+                changed.append(attr)
+        if changed:
+            instance.save(update_fields=changed + ["update_at"])
+        return instance
+
+
+class InsertOrGetCreateMixin(AllRowsUniqueMixin):
+    """
+    创建：按唯一字段 unique_fields 单条语句插入（ON DUPLICATE KEY UPDATE 主键不变 / ON CONFLICT DO NOTHING），冲突时不修改已有行
+    - 已有行与请求一致：直接返回（created = False，视图响应 200），并发的相同请求结果一致
+    - 已有行其余字段不同，或已被软删除：ValidationError（400），不覆盖、不恢复；恢复走 cancel-del/ 接口
+    - insert_only 中的字段只在新建时写入，不参与比较
+    """
+    unique_fields = ()
+    insert_only = ("created_by", "create_at")
+    created = None
+
+    def get_extra_kwargs(self):
+        extra_kwargs = super().get_extra_kwargs()
+        for field in self.unique_fields:
+            extra_kwargs.setdefault(field, {})["validators"] = []  # 唯一性交给数据库冲突处理
+        return extra_kwargs
+
+    def create(self, validated_data):
+        instance, self.created = insert_or_get(self.Meta.model, validated_data, self.unique_fields)
+        if self.created:
+            return instance
+        key = self.unique_fields[-1]
+        if getattr(instance, "is_deleted", False):
+            raise serializers.ValidationError({key: f"{validated_data[key]} 已删除，如需使用请先恢复"})
+        if any(getattr(instance, field) != value for field, value in validated_data.items()
+               if field not in self.unique_fields and field not in self.insert_only):
+            raise serializers.ValidationError({key: f"{validated_data[key]} 已存在"})
+        return instance
+
+
+def insert_or_get(model, values, unique_fields):
+    """
+    单条 INSERT，唯一键冲突时不修改已有行，返回 (对象, 是否新建)
+    - MySQL：ON DUPLICATE KEY UPDATE 主键 = 主键（空操作）；不用 INSERT IGNORE，截断 / 非空 / 外键错误照常抛出
+    - PostgreSQL / SQLite：ON CONFLICT DO NOTHING（只忽略唯一冲突）
+    - 数据库不返回已有行的主键，按唯一字段重新读取；冲突发生在其他唯一列上时读不到，返回 400
+    - 不经过 save()，新建时补发 post_save，保证缓存失效等接收方照常工作
+    """
+    db = router.db_for_write(model)
+    obj = model(**values)
+    connection = connections[db]
+    query = InsertQuery(model)
+    query.insert_values([field for field in model._meta.concrete_fields if not field.generated], [obj])
+    [(sql, params)] = query.get_compiler(connection=connection).as_sql()
+    if connection.vendor == "mysql":
+        pk = connection.ops.quote_name(model._meta.pk.column)
+        sql = f"{sql} ON DUPLICATE KEY UPDATE {pk} = {pk}"
+    else:
+        sql = f"{sql} ON CONFLICT DO NOTHING"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+    try:
+        saved = model._base_manager.using(db).get(**{field: values.get(field) for field in unique_fields})
+    except model.DoesNotExist:
+        raise serializers.ValidationError("与已有数据的其他唯一字段冲突")
+    created = saved.pk == obj.pk
+    if created:
+        post_save.send(sender=model, instance=saved, created=True, update_fields=None, raw=False, using=db)
+    return saved, created
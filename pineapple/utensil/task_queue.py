@@ -0,0 +1,401 @@
+"""
+轻量后台任务队列（Redis 列表）
+
+- 定义：@task(queue="default", max_retries=3) 装饰函数；调用 fn.delay(...) / fn.delay_on_commit(...) 入队，
+  fn(...) 仍可同步调用；各应用的任务写在 <app>/tasks.py，worker 启动时自动导入
+- 投递语义至少一次：worker 用 BLMOVE 把消息原子移入自己的 processing 列表，执行成功后才删除；
+  worker 以心跳键标记存活，其他 worker 发现心跳过期后把其 processing 中的消息放回队列
+  （任务需幂等）
+- 失败重试：按 TASK_RETRY_BACKOFF × 2^(次数-1) 秒（上限 10 分钟）放入延迟有序集合，到期后由 worker 移回队列；
+  超过 max_retries 进入 <队列>:dead（保留最近 1000 条）
+- 并发：TASK_QUEUES 中每个队列的 concurrency 为单个 worker 进程的消费者数；
+  python manage.py runworker --pool thread|process，process 时任务在子进程中执行
+- TASK_QUEUE_BACKEND = "memory" 时使用进程内实现（无需 Redis，供本地调试 / 测试，Worker.drain() 同步执行完队列）
+"""
+import heapq
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from utensil.cache_bus import get_redis
+
+logger = logging.getLogger(__name__)
+
+BACKEND = getattr(settings, "TASK_QUEUE_BACKEND", "redis")
+QUEUES = getattr(settings, "TASK_QUEUES", {"default": {"concurrency": 4}})
+DEFAULT_RETRIES = getattr(settings, "TASK_DEFAULT_RETRIES", 3)
+RETRY_BACKOFF = getattr(settings, "TASK_RETRY_BACKOFF", 5)  # 秒
+MAX_BACKOFF = 600
+HEARTBEAT_TTL = 30  # 秒：超过该时间没有心跳的 worker 视为已退出
+DEAD_LIMIT = 1000
+
+PREFIX = "tq"
+
+PROMOTE_LUA = """
+local items = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, tonumber(ARGV[2]))
+for _, item in ipairs(items) do
+    redis.call("ZREM", KEYS[1], item)
+    redis.call("LPUSH", KEYS[2], item)
+end
+return #items
+"""
+
+_registry = {}  # 任务名 → Task
+
+
+class Task:
+    def __init__(self, fn, queue, max_retries):
+        self.fn = fn
+        self.queue = queue
+        self.max_retries = max_retries
+        self.name = f"{fn.__module__}.{fn.__qualname__}"
+        self.__doc__ = fn.__doc__
+        self.__wrapped__ = fn
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """入队，返回任务 id；参数需可 JSON 序列化"""
+        return enqueue(self, args, kwargs)
+
+    def delay_on_commit(self, *args, **kwargs):
+        """事务提交后再入队，避免 worker 读到未提交的数据"""
+        transaction.on_commit(lambda: enqueue(self, args, kwargs))
+
+    def __repr__(self):
+        return f"<Task {self.name}>"
+
+
+def task(fn=None, *, queue="default", max_retries=None):
+    def decorator(func):
+        if queue not in QUEUES:
+            raise ValueError(f"未在 TASK_QUEUES 中配置的队列: {queue}")
+        obj = Task(func, queue, DEFAULT_RETRIES if max_retries is None else max_retries)
+        _registry[obj.name] = obj
+        return obj
+
+    return decorator(fn) if fn is not None else decorator
+
+
+def registered():
+    return dict(_registry)
+
+
+def enqueue(task_obj, args=(), kwargs=None):
+    message = {
+        "id": uuid.uuid4().hex,
+        "task": task_obj.name,
+        "args": list(args),
+        "kwargs": kwargs or {},
+        "attempt": 0,
+        "enqueued_at": time.time(),
+    }
+    get_backend().push(task_obj.queue, json.dumps(message, separators=(",", ":")))
+    return message["id"]
+
+
+def backoff(attempt):
+    return min(RETRY_BACKOFF * 2 ** (attempt - 1), MAX_BACKOFF)
+
+
+# ------------------------------------------------------------------------------------------------------------ 存储
+def _queue_key(queue):
+    return f"{PREFIX}:q:{queue}"
+
+
+class RedisBackend:
+    def __init__(self, conn):
+        self.conn = conn
+        self._promote = conn.register_script(PROMOTE_LUA)
+
+    def _processing(self, queue, worker_id):
+        return f"{_queue_key(queue)}:processing:{worker_id}"
+
+    def push(self, queue, raw):
+        self.conn.lpush(_queue_key(queue), raw)
+
+    def pop(self, queue, worker_id, timeout):
+        raw = self.conn.blmove(_queue_key(queue), self._processing(queue, worker_id), timeout, "RIGHT", "LEFT")
+        return raw.decode() if isinstance(raw, bytes) else raw
+
+    def ack(self, queue, worker_id, raw):
+        self.conn.lrem(self._processing(queue, worker_id), 1, raw)
+
+    def schedule(self, queue, raw, eta):
+        self.conn.zadd(f"{_queue_key(queue)}:delayed", {raw: eta})
+
+    def promote(self, queue, limit=100):
+        """到期的延迟消息移回队列"""
+        return self._promote(keys=[f"{_queue_key(queue)}:delayed", _queue_key(queue)], args=[time.time(), limit])
+
+    def bury(self, queue, raw):
+        pipe = self.conn.pipeline()
+        pipe.lpush(f"{_queue_key(queue)}:dead", raw)
+        pipe.ltrim(f"{_queue_key(queue)}:dead", 0, DEAD_LIMIT - 1)
+        pipe.execute()
+
+    def heartbeat(self, worker_id):
+        pipe = self.conn.pipeline()
+        pipe.sadd(f"{PREFIX}:workers", worker_id)
+        pipe.set(f"{PREFIX}:worker:{worker_id}", int(time.time()), ex=HEARTBEAT_TTL)
+        pipe.execute()
+
+    def retire(self, worker_id):
+        self.conn.srem(f"{PREFIX}:workers", worker_id)
+        self.conn.delete(f"{PREFIX}:worker:{worker_id}")
+
+    def recover(self, queues=None):
+        """
+        心跳过期的 worker：processing 中的消息放回队列，返回放回条数
+        - 按 TASK_QUEUES 中的全部队列收回：退出的 worker 可能消费本 worker 不消费的队列
+        """
+        queues = list(QUEUES) if queues is None else queues
+        recovered = 0
+        for raw_id in self.conn.smembers(f"{PREFIX}:workers"):
+            worker_id = raw_id.decode() if isinstance(raw_id, bytes) else raw_id
+            if self.conn.exists(f"{PREFIX}:worker:{worker_id}"):
+                continue
+            for queue in queues:
+                while self.conn.lmove(self._processing(queue, worker_id), _queue_key(queue), "RIGHT", "RIGHT"):
+                    recovered += 1  # 放到队首（RIGHT 端先被取出），尽快重新执行
+            self.conn.srem(f"{PREFIX}:workers", worker_id)
+        return recovered
+
+    def size(self, queue):
+        return self.conn.llen(_queue_key(queue))
+
+
+class MemoryBackend:
+    """进程内实现，接口与 RedisBackend 相同"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._processing = {}
+        self._delayed = {}
+        self.dead = {}
+
+    def push(self, queue, raw):
+        with self._cond:
+            self._queues.setdefault(queue, deque()).appendleft(raw)
+            self._cond.notify()
+
+    def pop(self, queue, worker_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._queues.get(queue):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            raw = self._queues[queue].pop()
+            self._processing.setdefault((queue, worker_id), []).append(raw)
+            return raw
+
+    def ack(self, queue, worker_id, raw):
+        with self._cond:
+            self._processing[(queue, worker_id)].remove(raw)
+
+    def schedule(self, queue, raw, eta):
+        with self._cond:
+            heapq.heappush(self._delayed.setdefault(queue, []), (eta, raw))
+
+    def promote(self, queue, limit=100):
+        moved = 0
+        with self._cond:
+            delayed = self._delayed.get(queue, [])
+            while delayed and delayed[0][0] <= time.time() and moved < limit:
+                self._queues.setdefault(queue, deque()).appendleft(heapq.heappop(delayed)[1])
+                moved += 1
+            if moved:
+                self._cond.notify_all()
+        return moved
+
+    def bury(self, queue, raw):
+        with self._cond:
+            self.dead.setdefault(queue, deque(maxlen=DEAD_LIMIT)).appendleft(raw)
+
+    def heartbeat(self, worker_id):
+        pass
+
+    def retire(self, worker_id):
+        pass
+
+    def recover(self, queues=None):
+        return 0
+
+    def size(self, queue):
+        with self._cond:
+            return len(self._queues.get(queue, ()))
+
+
+_backend = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend, _backend_pid
+    if _backend is not None and _backend_pid == os.getpid():
+        return _backend
+    with _backend_lock:
+        if _backend is None or _backend_pid != os.getpid():
+            if BACKEND == "memory":
+                _backend = MemoryBackend()
+            else:
+                conn = get_redis()
+                if conn is None:
+                    raise RuntimeError("任务队列需要 Redis 缓存后端（或设置 TASK_QUEUE_BACKEND = \"memory\"）")
+                _backend = RedisBackend(conn)
+            _backend_pid = os.getpid()
+    return _backend
+
+
+# ------------------------------------------------------------------------------------------------------------ 执行
+def execute(name, args, kwargs):
+    """执行单个任务（线程或子进程中调用）"""
+    close_old_connections()
+    try:
+        return _registry[name].fn(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+class Worker:
+    """
+    queues: {队列名: 并发数}；pool 为 "thread" 时消费者线程直接执行任务，
+    为 "process" 时消费者线程把任务交给进程池（大小 = 并发数之和）并等待结果
+    """
+
+    def __init__(self, queues=None, pool="thread", backend=None, poll_timeout=1):
+        self.queues = queues or {name: conf.get("concurrency", 1) for name, conf in QUEUES.items()}
+        self.pool = pool
+        self.backend = backend or get_backend()
+        self.poll_timeout = poll_timeout
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._executor = None
+
+    # ✅ 单条消息
+    def handle(self, queue, raw):
+        try:
+            message = json.loads(raw)
+            task_obj = _registry[message["task"]]
+        except (ValueError, KeyError) as e:
+            logger.error(f"[TASK] 无法识别的消息，移入死信队列: {e}")
+            self.backend.bury(queue, raw)
+            self.backend.ack(queue, self.worker_id, raw)
+            return
+        started = time.monotonic()
+        try:
+            if self._executor is not None:
+                self._executor.submit(execute, task_obj.name, message["args"], message["kwargs"]).result()
+            else:
+                execute(task_obj.name, message["args"], message["kwargs"])
+        except Exception as e:  # noqa
+            attempt = message["attempt"] + 1
+            if attempt > task_obj.max_retries:
+                logger.error(f"[TASK] {task_obj.name} {message['id']} 重试 {message['attempt']} 次后仍失败，移入死信队列: {e}")
+                self.backend.bury(queue, json.dumps({**message, "error": repr(e)}, separators=(",", ":")))
+            else:
+                delay = backoff(attempt)
+                logger.warning(f"[TASK] {task_obj.name} {message['id']} 第 {attempt} 次失败，{delay}s 后重试: {e}")
+                self.backend.schedule(queue, json.dumps({**message, "attempt": attempt}, separators=(",", ":")),
+                                      time.time() + delay)
+        else:
+            logger.info(f"[TASK] {task_obj.name} {message['id']} 完成，耗时 {time.monotonic() - started:.3f}s")
+        self.backend.ack(queue, self.worker_id, raw)
+
+    def drain(self):
+        """
+        同步执行完各队列中的全部消息（含已到期的重试），返回执行条数
+        - 与常驻运行一样登记 worker 并在后台线程中维持心跳，否则执行中的消息会被其他 worker 当作遗留消息收回
+        """
+        done = threading.Event()
+        beat = threading.Thread(target=self._beat, args=(done,), name="task-heartbeat", daemon=True)
+        self.backend.heartbeat(self.worker_id)
+        beat.start()
+        count = 0
+        try:
+            while True:
+                handled = False
+                for queue in self.queues:
+                    self.backend.promote(queue)
+                    raw = self.backend.pop(queue, self.worker_id, 0.01)
+                    if raw is not None:
+                        self.handle(queue, raw)
+                        handled, count = True, count + 1
+                if not handled:
+                    return count
+        finally:
+            done.set()
+            beat.join()
+            self.backend.retire(self.worker_id)
+
+    def _beat(self, done):
+        while not done.wait(HEARTBEAT_TTL / 3):
+            try:
+                self.backend.heartbeat(self.worker_id)
+            except Exception as e:  # noqa
+                logger.error(f"[TASK] 心跳失败: {e}")
+
+    # ✅ 常驻运行
+    def _consume(self, queue):
+        while not self._stop.is_set():
+            try:
+                raw = self.backend.pop(queue, self.worker_id, self.poll_timeout)
+            except Exception as e:  # noqa
+                logger.error(f"[TASK] 读取队列 {queue} 失败: {e}")
+                self._stop.wait(1)
+                continue
+            if raw is not None:
+                self.handle(queue, raw)
+
+    def _maintain(self):
+        while not self._stop.is_set():
+            try:
+                self.backend.heartbeat(self.worker_id)
+                for queue in self.queues:
+                    self.backend.promote(queue)
+                recovered = self.backend.recover()
+                if recovered:
+                    logger.warning(f"[TASK] 从已退出的 worker 收回 {recovered} 条消息")
+            except Exception as e:  # noqa
+                logger.error(f"[TASK] 维护失败: {e}")
+            self._stop.wait(1)
+
+    def start(self):
+        if self.pool == "process":
+            from concurrent.futures import ProcessPoolExecutor
+            from django.db import connections
+
+            connections.close_all()  # 子进程 fork 时不继承数据库连接
+            self._executor = ProcessPoolExecutor(max_workers=sum(self.queues.values()))
+        self.backend.heartbeat(self.worker_id)
+        threads = [threading.Thread(target=self._maintain, name="task-maintain", daemon=True)]
+        for queue, concurrency in self.queues.items():
+            threads += [threading.Thread(target=self._consume, args=(queue,), name=f"task-{queue}-{i}", daemon=True)
+                        for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        self._threads = threads
+        logger.info(f"[TASK] worker {self.worker_id} 已启动: {self.queues}（{self.pool}）")
+
+    def stop(self, timeout=None):
+        """停止取新消息，等待执行中的任务完成"""
+        self._stop.set()
+        for thread in getattr(self, "_threads", []):
+            thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self.backend.retire(self.worker_id)
+        logger.info(f"[TASK] worker {self.worker_id} 已停止")
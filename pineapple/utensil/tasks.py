@@ -0,0 +1,13 @@
+"""utensil 自带的后台任务（python manage.py runworker 执行）"""
+from django.conf import settings
+
+from utensil import archive
+from utensil.task_queue import task
+
+
+@task(queue="default")
+def archive_deleted(days=None, chunk_size=500):
+    """软删除归档（与 python manage.py archive_deleted 相同），返回 {模型: 归档行数}"""
+    days = getattr(settings, "ARCHIVE_AFTER_DAYS", 30) if days is None else days
+    return {model._meta.label: archive.archive_model(model, days=days, chunk_size=chunk_size)
+            for model in archive.registered()}
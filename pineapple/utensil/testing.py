@@ -0,0 +1,42 @@
+"""
+测试辅助
+
+- RedisTestMixin：django-redis 原生连接改为进程内 fakeredis（整个测试进程共用一个服务器），
+  Django 缓存改为 LocMemCache；失效总线订阅线程连接同一个 fakeredis
+- 每个用例前清空 fakeredis、Django 缓存与全部进程内缓存（测试事务不会提交，失效事件不会发出）
+- 依赖 fakeredis（Lua 脚本需要 lupa），见 requirements.txt
+"""
+from unittest import mock
+
+import fakeredis
+from django.core.cache import caches
+from django.test import override_settings
+
+from utensil.cache_bus import bus
+
+SERVER = fakeredis.FakeServer()
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def fake_redis_connection(alias="default", write=True):
+    return fakeredis.FakeStrictRedis(server=SERVER)
+
+
+class RedisTestMixin:
+    @classmethod
+    def setUpClass(cls):
+        patcher = mock.patch("django_redis.get_redis_connection", fake_redis_connection)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+        settings_override = override_settings(CACHES=LOCMEM_CACHES)
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fake_redis_connection()
+        self.redis.flushall()
+        caches["default"].clear()
+        bus._clear_all()
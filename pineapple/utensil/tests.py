@@ -1,3 +1,284 @@
-from django.test import TestCase
+import asyncio
+import json
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from utensil import request_scope, task_queue, throttling, warmup
+from utensil.cache_bus import CHANNEL, VERSION_KEY, CacheBus, LocalCache, bus
+from utensil.testing import RedisTestMixin
+
+
+# ------------------------------------------------------------------------------------------------------------ 失效总线
+class CacheBusTests(RedisTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bus = CacheBus()
+        self.cache = LocalCache("bus-test")
+        self.bus.register(self.cache)
+        self.cache._data.update({"1": "a", "2": "b"})
+
+    def test_message_evicts_listed_keys(self):
+        self.bus._on_message(json.dumps({"n": "bus-test", "k": ["1"], "v": 1}))
+        self.assertEqual(self.cache._data, {"2": "b"})
+        self.assertEqual(self.bus._applied, 1)
+
+    def test_message_without_keys_evicts_namespace(self):
+        self.bus._on_message(json.dumps({"n": "bus-test", "k": None, "v": 1}))
+        self.assertEqual(self.cache._data, {})
+
+    def test_out_of_order_versions_are_applied_once_contiguous(self):
+        self.bus._on_message(json.dumps({"n": "other", "k": None, "v": 2}))
+        self.assertEqual(self.bus._applied, 0)
+        self.bus._on_message(json.dumps({"n": "other", "k": None, "v": 1}))
+        self.assertEqual(self.bus._applied, 2)
+        self.assertEqual(self.bus._pending, set())
+
+    def test_in_sync_reports_version_gaps(self):
+        self.bus._on_message(json.dumps({"n": "other", "k": None, "v": 2}))
+        self.assertFalse(self.bus.in_sync())
+        self.bus._on_message(json.dumps({"n": "other", "k": None, "v": 1}))
+        self.assertTrue(self.bus.in_sync())
+
+    def test_version_gap_clears_all_local_caches(self):
+        self.bus._on_message(json.dumps({"n": "other", "k": None, "v": 1}))
+        self.bus._on_message(json.dumps({"n": "other", "k": None, "v": 3}))  # 2 丢失
+        self.bus._check_version(3)  # 记下全局版本，给在途消息一个巡检周期
+        self.assertEqual(self.cache._data, {"1": "a", "2": "b"})
+        self.bus._check_version(3)
+        self.assertEqual(self.cache._data, {})
+        self.assertEqual(self.bus._applied, 3)
+        self.assertEqual(self.bus._pending, set())
+
+    def test_no_reset_when_versions_contiguous(self):
+        for version in (1, 2):
+            self.bus._on_message(json.dumps({"n": "other", "k": None, "v": version}))
+        self.bus._check_version(2)
+        self.bus._check_version(2)
+        self.assertEqual(self.cache._data, {"1": "a", "2": "b"})
+
+    def test_publish_increments_version_and_broadcasts(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(CHANNEL)
+        self.bus.publish("bus-test", [1])
+        self.assertEqual(self.cache._data, {"2": "b"})  # 本进程立即清理
+        self.assertEqual(int(self.redis.get(VERSION_KEY)), 1)
+        message = pubsub.get_message(timeout=1) or pubsub.get_message(timeout=1)  # 首条为订阅确认
+        self.assertEqual(json.loads(message["data"]), {"n": "bus-test", "k": ["1"], "v": 1})
+
+
+class LocalCacheTests(RedisTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(bus, "ensure_started", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = LocalCache("local-test", maxsize=2)
+
+    def test_set_discarded_when_invalidated_during_compute(self):
+        version = bus.generation
+        bus._evict("local-test", ["k"])
+        self.cache.set("k", "stale", version=version)
+        self.assertIsNone(self.cache.get("k"))
+
+    def test_unavailable_bus_is_a_miss(self):
+        self.cache.set("k", "v")
+        with mock.patch.object(bus, "ensure_started", return_value=False):
+            self.assertIsNone(self.cache.get("k"))
+        self.assertEqual(self.cache.get("k"), "v")
+
+    def test_maxsize_resets_cache(self):
+        for key in ("a", "b", "c"):
+            self.cache.set(key, key)
+        self.assertEqual(list(self.cache._data), ["c"])
+
+
+# ------------------------------------------------------------------------------------------------------------ 限流
+class ThrottleTests(RedisTestMixin, SimpleTestCase):
+    rates = {"auth_ip": "30/min", "auth_account": "2/min", "auth_system": "100/min"}
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(throttling, "limiter", throttling.TokenBucketLimiter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(throttling.api_settings.DEFAULT_THROTTLE_RATES, self.rates)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, ip="10.0.0.1", **data):
+        request = APIRequestFactory().post("/", data, format="json", REMOTE_ADDR=ip)
+        return Request(request, parsers=[JSONParser()])
+
+    def test_bucket_rejects_all_dimensions_atomically(self):
+        limiter = throttling.TokenBucketLimiter()
+        self.assertEqual(limiter.hit([("a", "2/min"), ("b", "100/min")]), 0)
+        self.assertEqual(limiter.hit([("a", "2/min"), ("b", "100/min")]), 0)
+        self.assertGreater(limiter.hit([("a", "2/min"), ("b", "100/min")]), 0)
+        self.assertLess(float(self.redis.hget("b", "t")), 98.5)  # 被拒绝的请求不扣减其他维度
+
+    def test_forwarded_for_header_is_not_trusted_without_proxies(self):
+        request = self.request(ip="10.0.0.1")
+        request.META["HTTP_X_FORWARDED_FOR"] = "1.2.3.4"
+        self.assertEqual(throttling.AuthRateThrottle().get_ident(request), "10.0.0.1")
+
+    def test_auth_buckets_include_account_per_ip_and_system(self):
+        buckets = throttling.AuthRateThrottle().get_buckets(
+            self.request(email="Alice@Example.com ", system_code="crm"), None)
+        self.assertEqual(buckets, [("auth_ip", "10.0.0.1"), ("auth_account", "alice@example.com:10.0.0.1"),
+                                   ("auth_system", "crm")])
+
+    def test_attacker_cannot_lock_victim_out(self):
+        for _ in range(2):
+            self.assertTrue(throttling.AuthRateThrottle().allow_request(self.request(email="a@x.com"), None))
+        self.assertFalse(throttling.AuthRateThrottle().allow_request(self.request(email="a@x.com"), None))
+        victim = self.request(ip="10.0.0.2", email="a@x.com")
+        self.assertTrue(throttling.AuthRateThrottle().allow_request(victim, None))
+
+    @override_settings(REST_FRAMEWORK={"NUM_PROXIES": 1})
+    def test_trusted_proxy_address_is_used(self):
+        request = self.request(ip="10.0.0.1")
+        request.META["HTTP_X_FORWARDED_FOR"] = "1.2.3.4, 5.6.7.8"
+        self.assertEqual(throttling.AuthRateThrottle().get_ident(request), "5.6.7.8")
+
+
+# ------------------------------------------------------------------------------------------------------------ 任务队列
+calls = []
+
+
+@task_queue.task(max_retries=1)
+def record(value):
+    calls.append(value)
+
+
+@task_queue.task(max_retries=1)
+def fail():
+    raise RuntimeError("boom")
+
+
+class TaskQueueTests(RedisTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+        self.backend = task_queue.RedisBackend(self.redis)
+        patcher = mock.patch.object(task_queue, "get_backend", return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_drain_executes_and_acks(self):
+        record.delay(1)
+        self.assertEqual(task_queue.Worker({"default": 1}).drain(), 1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(self.redis.keys("tq:q:default:processing:*"), [])
+
+    def test_failure_is_retried_then_buried(self):
+        fail.delay()
+        with mock.patch.object(task_queue, "RETRY_BACKOFF", 0):
+            self.assertEqual(task_queue.Worker({"default": 1}).drain(), 2)
+        dead = [json.loads(raw) for raw in self.redis.lrange("tq:q:default:dead", 0, -1)]
+        self.assertEqual([(m["attempt"], m["error"]) for m in dead], [(1, "RuntimeError('boom')")])
+
+    def test_drain_registers_worker_while_running(self):
+        worker = task_queue.Worker({"default": 1})
+        seen = []
+        with mock.patch.object(task_queue, "execute", lambda *a: seen.append(
+                (self.redis.sismember("tq:workers", worker.worker_id), self.redis.exists(f"tq:worker:{worker.worker_id}")))):
+            record.delay(1)
+            worker.drain()
+        self.assertEqual(seen, [(1, 1)])  # 执行期间其他 worker 不会收回该消息
+        self.assertFalse(self.redis.sismember("tq:workers", worker.worker_id))
+
+    def test_recover_covers_queues_this_worker_does_not_consume(self):
+        self.redis.sadd("tq:workers", "dead", "alive")
+        self.redis.set("tq:worker:alive", 1)
+        self.redis.lpush("tq:q:mail:processing:dead", "m1")
+        self.redis.lpush("tq:q:mail:processing:alive", "m2")
+        with mock.patch.object(task_queue, "QUEUES", {"default": {}, "mail": {}}):
+            self.assertEqual(self.backend.recover(), 1)
+        self.assertEqual(self.redis.lrange("tq:q:mail", 0, -1), [b"m1"])
+        self.assertEqual(self.redis.smembers("tq:workers"), {b"alive"})
+        self.assertEqual(self.redis.llen("tq:q:mail:processing:alive"), 1)
+
+
+# ------------------------------------------------------------------------------------------------------------ 启动预热
+class WarmupTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        registry = {name: (lambda name=name: self.calls.append(name)) for name in ("database", "redis", "urls")}
+        patcher = mock.patch.object(warmup, "_registry", registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failed_item_does_not_stop_the_rest(self):
+        warmup._registry["redis"] = mock.Mock(side_effect=ConnectionError("down"))
+        timings = warmup.run()
+        self.assertEqual(self.calls, ["database", "urls"])
+        self.assertIsNone(timings["redis"])
+
+    def test_boot_hook_respects_setting_and_skip(self):
+        with mock.patch.object(warmup, "ON_BOOT", False):
+            warmup.run_on_boot()
+        self.assertEqual(self.calls, [])
+        warmup.run_on_boot(skip=warmup.registered())
+        self.assertEqual(self.calls, [])
+        warmup.run_on_boot(skip=("database",))
+        self.assertEqual(self.calls, ["redis", "urls"])
+
+    def test_models_populate_meta_caches(self):
+        from django.apps import apps
+
+        opts = apps.get_model("utensil", "BackfillCheckpoint")._meta
+        opts.__dict__.pop("fields_map", None)
+        with self.assertLogs(warmup.logger, "INFO"):
+            warmup.warm_models()
+        self.assertIn("fields_map", opts.__dict__)
+        self.assertTrue(opts._get_fields_cache)
+
+    def test_asgi_lifespan_skips_database(self):
+        from pineapple import asgi
+
+        sent = []
+
+        async def run():
+            inbox = asyncio.Queue()
+            inbox.put_nowait({"type": "lifespan.startup"})
+            inbox.put_nowait({"type": "lifespan.shutdown"})
+
+            async def send(message):
+                sent.append(message["type"])
+
+            await asgi.application({"type": "lifespan"}, inbox.get, send)
+
+        async_to_sync(run)()
+        self.assertEqual(self.calls, ["redis", "urls"])
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+
+# ------------------------------------------------------------------------------------------------------------ 请求级记忆化
+class RequestScopeTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = mock.Mock(side_effect=lambda: object())
+
+    def in_request(self, fn):
+        return request_scope.RequestScopeMiddleware(lambda request: fn())(None)
+
+    def test_outside_a_request_nothing_is_cached(self):
+        request_scope.memoize("k", self.factory)
+        request_scope.memoize("k", self.factory)
+        self.assertEqual(self.factory.call_count, 2)
+
+    def test_memoized_once_per_request_until_cleared(self):
+        def view():
+            first = request_scope.memoize("k", self.factory)
+            self.assertIs(request_scope.memoize("k", self.factory), first)
+            request_scope.clear()
+            self.assertIsNot(request_scope.memoize("k", self.factory), first)
+
+        self.in_request(view)
+        self.in_request(lambda: request_scope.memoize("k", self.factory))  # 下一个请求不复用
+        self.assertEqual(self.factory.call_count, 3)
+        self.assertIsNone(request_scope._scope.get())
@@ -0,0 +1,119 @@
+"""
+worker 启动预热：在接收第一个请求之前构建各类惰性结构，避免发布后首批请求承担冷启动开销
+
+- 预热项通过 register(name, fn) 登记（应用在 AppConfig.ready() 中登记自己的项），run() 依次执行，
+  单项失败只记录日志，不影响启动
+- 内置：database（建立各数据库连接，配合 CONN_MAX_AGE 复用）、redis（连接池 + 失效总线订阅）、
+  urls（解析器填充并编译全部路由正则）、models（模型 _meta 字段缓存与反向关系树）
+- 触发方式：
+    gunicorn：gunicorn.conf.py 的 post_worker_init（worker 加载应用后、接收请求前）；
+      在 manage.py 所在目录启动时自动加载该文件，其他目录启动时用 -c 指定
+    uvicorn / daphne：ASGI lifespan startup（pineapple.asgi），跳过 database：
+      Django 的 ASGI 处理器为每个请求的同步视图单独分配线程，数据库连接按线程建立，预热线程的连接不会被请求复用
+    手动：python manage.py warm_caches（共享的 Redis / 共享内存快照对其他进程同样生效）
+- WARMUP_ON_BOOT = False 时 gunicorn / lifespan 钩子跳过预热
+"""
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ON_BOOT = getattr(settings, "WARMUP_ON_BOOT", True)
+BUS_WAIT = 3  # 秒：等待失效总线订阅就绪（进程内缓存依赖总线）
+
+_registry = {}  # 名称 → 函数（按登记顺序执行）
+
+
+def register(name, fn):
+    _registry[name] = fn
+
+
+def registered():
+    return list(_registry)
+
+
+def run(names=None):
+    """执行预热项，返回 {名称: 耗时秒数}；失败的项耗时为 None"""
+    timings = {}
+    for name in list(_registry) if names is None else names:
+        started = time.perf_counter()
+        try:
+            _registry[name]()
+        except Exception as e:  # noqa
+            logger.error(f"[WARMUP] {name} 预热失败: {e}")
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - started
+    total = sum(t for t in timings.values() if t is not None)
+    logger.info(f"[WARMUP] 完成 {total:.3f}s: " + ", ".join(
+        f"{name}={'失败' if t is None else f'{t * 1000:.0f}ms'}" for name, t in timings.items()))
+    return timings
+
+
+def run_on_boot(skip=()):
+    if ON_BOOT:
+        run([name for name in _registry if name not in skip])
+
+
+# ------------------------------------------------------------------------------------------------------------ 内置项
+def warm_database():
+    from django.db import connections
+
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def warm_redis():
+    from utensil.cache_bus import bus, get_redis
+
+    conn = get_redis()
+    if conn is None:
+        return
+    conn.ping()
+    deadline = time.monotonic() + BUS_WAIT
+    while not bus.ensure_started() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def _walk(patterns):
+    from django.urls import URLResolver
+
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield pattern
+            yield from _walk(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+def warm_urls():
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    resolver.reverse_dict  # noqa  填充反向解析表
+    for pattern in _walk(resolver.url_patterns):
+        pattern.pattern.regex  # noqa  按当前语言编译正则
+
+
+def warm_models():
+    """
+    构建各模型 _meta 上的字段缓存（get_fields 及首次调用时的全局反向关系树），进程内常驻；
+    序列化器实例随请求创建、字段不跨请求保留，预热序列化器没有持久效果，因此只预热其依赖的模型元数据
+    """
+    from django.apps import apps
+
+    models = apps.get_models(include_auto_created=True)
+    for model in models:
+        opts = model._meta
+        opts.get_fields()
+        opts.concrete_fields  # noqa
+        opts.fields_map  # noqa  按名称查找字段（含反向关系）
+    logger.info(f"[WARMUP] 已构建 {len(models)} 个模型的字段缓存")
+
+
+register("database", warm_database)
+register("redis", warm_redis)
+register("urls", warm_urls)
+register("models", warm_models)
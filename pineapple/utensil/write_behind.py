@@ -0,0 +1,169 @@
+"""
+高频时间戳字段的写回缓冲（write-behind）
+
+- touch() 只写 Redis 哈希 wb:<模型>:<字段>（主键 → ISO 时间），请求线程不再 UPDATE 热点行
+- 后台线程每隔 WRITE_BEHIND_INTERVAL 秒抢锁刷新：把哈希原子改名后整体读出，
+  按 500 行一批执行 UPDATE ... SET 字段 = CASE pk WHEN ... END
+- 锁的值为本次刷新的随机令牌，释放时 Lua 比较后删除：刷新超过锁有效期时不会误删其他进程已取得的锁
+- 读取方通过 pending() / current() 叠加尚未落库的值
+- 登记时可传入 db_for_pk（主键 → 数据库别名）：分片模型按别名分组，逐库执行 UPDATE
+- 未配置 Redis 时直接同步写库
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from utensil.cache_bus import get_redis
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = getattr(settings, "WRITE_BEHIND_INTERVAL", 5)
+BATCH_SIZE = 500
+LOCK_KEY = "wb:lock"
+
+RELEASE_LUA = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+_fields = set()  # 已登记的 (模型, 字段)
+_routes = {}  # 模型 → db_for_pk
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def _key(model, field):
+    return f"wb:{model._meta.label_lower}:{field}"
+
+
+def register(model, field, db_for_pk=None):
+    """
+    登记需要写回的字段（应用启动时调用，保证任一进程都能刷新遗留缓冲）
+    db_for_pk: 主键 → 数据库别名，返回 None 时交给默认路由
+    """
+    _fields.add((model, field))
+    if db_for_pk is not None:
+        _routes[model] = db_for_pk
+
+
+def _querysets(model, pks):
+    """按所在数据库分组主键：[(查询集, 主键列表)]"""
+    resolve = _routes.get(model)
+    groups = {}
+    for pk in pks:
+        groups.setdefault(resolve(pk) if resolve else None, []).append(pk)
+    manager = model._base_manager
+    return [(manager.using(alias) if alias else manager.all(), group) for alias, group in groups.items()]
+
+
+def _update(model, pk, field, value):
+    for queryset, _ in _querysets(model, [pk]):
+        queryset.filter(pk=pk).update(**{field: value})
+
+
+def touch(model, pk, field, value=None):
+    """记录一次时间戳更新"""
+    value = value or timezone.now()
+    conn = get_redis()
+    if conn is None:
+        _update(model, pk, field, value)
+        return
+    _fields.add((model, field))
+    try:
+        conn.hset(_key(model, field), pk, value.isoformat())
+    except Exception as e:  # noqa
+        logger.error(f"[WRITE_BEHIND] 写入缓冲失败，改为同步写库: {e}")
+        _update(model, pk, field, value)
+        return
+    _ensure_flusher()
+
+
+def pending(model, pk, field):
+    """尚未落库的值（没有则返回 None）"""
+    conn = get_redis()
+    if conn is None:
+        return None
+    key = _key(model, field)
+    try:
+        raw = conn.hget(key, pk) or conn.hget(f"{key}:flushing", pk)
+    except Exception:  # noqa
+        return None
+    return parse_datetime(raw.decode() if isinstance(raw, bytes) else raw) if raw else None
+
+
+def current(instance, field):
+    """实例字段的最新值：缓冲中的值与数据库值取较新者"""
+    value = getattr(instance, field)
+    buffered = pending(type(instance), instance.pk, field)
+    if buffered is not None and (value is None or buffered > value):
+        return buffered
+    return value
+
+
+def flush():
+    """把全部缓冲写入数据库（多进程间通过 Redis 锁互斥），返回写入行数"""
+    conn = get_redis()
+    token = uuid.uuid4().hex
+    if conn is None or not conn.set(LOCK_KEY, token, nx=True, ex=max(INTERVAL * 6, 30)):
+        return 0
+    total = 0
+    try:
+        for model, field in list(_fields):
+            key = _key(model, field)
+            processing = f"{key}:flushing"
+            # 上次刷新中断遗留的 processing 哈希先处理；否则原子改名，新的 touch 写入新哈希
+            if not conn.exists(processing):
+                if not conn.exists(key):
+                    continue
+                conn.rename(key, processing)
+            items = [(pk.decode() if isinstance(pk, bytes) else pk,
+                      parse_datetime(ts.decode() if isinstance(ts, bytes) else ts))
+                     for pk, ts in conn.hgetall(processing).items()]
+            values = dict(items)
+            for queryset, pks in _querysets(model, list(values)):
+                for start in range(0, len(pks), BATCH_SIZE):
+                    chunk = pks[start:start + BATCH_SIZE]
+                    queryset.filter(pk__in=chunk).update(**{field: Case(
+                        *[When(pk=pk, then=Value(values[pk])) for pk in chunk],
+                        default=field, output_field=DateTimeField()
+                    )})
+            conn.delete(processing)
+            total += len(items)
+    finally:
+        conn.register_script(RELEASE_LUA)(keys=[LOCK_KEY], args=[token])
+    if total:
+        logger.info(f"[WRITE_BEHIND] 已批量写入 {total} 行")
+    return total
+
+
+def _ensure_flusher():
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid != os.getpid():
+            _started_pid = os.getpid()
+            threading.Thread(target=_run, name="write-behind", daemon=True).start()
+
+
+def _run():
+    from django.db import close_old_connections
+
+    pid = os.getpid()
+    while pid == os.getpid():
+        time.sleep(INTERVAL)
+        try:
+            flush()
+        except Exception as e:  # noqa
+            logger.error(f"[WRITE_BEHIND] 刷新失败: {e}")
+        finally:
+            close_old_connections()
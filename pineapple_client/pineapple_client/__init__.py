@@ -0,0 +1,4 @@
+from .client import PineappleClient
+from .exceptions import InvalidToken, PineappleError
+
+__all__ = ["PineappleClient", "PineappleError", "InvalidToken"]
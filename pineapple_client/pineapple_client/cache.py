@@ -0,0 +1,100 @@
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PermissionCache:
+    """
+    进程内权限判定缓存：(unified_uuid, system_code, permission_code) → bool
+    - 条目按 TTL 过期
+    - 支持按用户失效（服务端 user 事件）与整体清空（角色 / 权限 / 系统事件）
+    - 写入时携带请求前的 generation，请求期间发生过失效则放弃写入，避免旧结果覆盖失效
+    """
+
+    def __init__(self, ttl=60, maxsize=100000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self.generation = 0  # 每次失效 +1
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            return None
+        return value
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            if version is not None and version != self.generation:
+                return
+            if len(self._data) >= self.maxsize:
+                self._data.clear()
+                self._by_user.clear()
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._by_user.setdefault(key[0], set()).add(key)
+
+    def evict_users(self, unified_uuids):
+        with self._lock:
+            self.generation += 1
+            for uid in unified_uuids:
+                for key in self._by_user.pop(uid, ()):
+                    self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._by_user.clear()
+
+
+class InvalidationSubscriber(threading.Thread):
+    """订阅账户中心的 Redis 失效总线（utensil.cache_bus），断线期间清空缓存"""
+
+    def __init__(self, cache, redis_url, channel):
+        super().__init__(name="pineapple-invalidation", daemon=True)
+        self.cache = cache
+        self.redis_url = redis_url
+        self.channel = channel
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        import redis
+
+        backoff = 1
+        while not self._stopped.is_set():
+            try:
+                conn = redis.Redis.from_url(self.redis_url)
+                pubsub = conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 1
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self._on_message(message["data"])
+                pubsub.close()
+            except Exception as e:  # noqa
+                logger.error(f"[PINEAPPLE] 失效订阅中断，{backoff}s 后重连: {e}")
+            self.cache.clear()
+            self._stopped.wait(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _on_message(self, data):
+        try:
+            event = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if event.get("n") == "user" and event.get("k") is not None:
+            self.cache.evict_users(event["k"])
+        else:
+            self.cache.clear()
@@ -0,0 +1,173 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import jwt
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import InvalidationSubscriber, PermissionCache
+from .exceptions import InvalidToken, PineappleError
+
+
+class _Batcher:
+    """
+    合并同一时间窗口内的权限查询：
+    第一个未命中的调用者等待 window 秒后，把期间积累的全部查询合并为一次请求
+    """
+
+    def __init__(self, send, window, max_batch):
+        self._send = send
+        self._window = window
+        self._max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushing = False
+
+    def submit(self, key):
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = self._pending[key] = Future()
+            leader = not self._flushing
+            self._flushing = True
+        if leader:
+            time.sleep(self._window)
+            self._flush()
+        return future
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending, self._flushing = self._pending, {}, False
+        by_system = {}
+        for key in batch:
+            by_system.setdefault(key[1], []).append(key)
+        for system_code, keys in by_system.items():
+            for start in range(0, len(keys), self._max_batch):
+                chunk = keys[start:start + self._max_batch]
+                try:
+                    result = self._send(system_code, [(uid, code) for uid, _, code in chunk])
+                    for key in chunk:
+                        batch[key].set_result(result[(key[0], key[2])])
+                except Exception as e:  # noqa
+                    for key in chunk:
+                        if not batch[key].done():
+                            batch[key].set_exception(e)
+
+
+class PineappleClient:
+    """
+    Pineapple 账户中心客户端：
+    - verify_token：用账户中心的公钥（RS256 / ES256）本地校验 access token；
+      未传入 verifying_key 时首次校验前从 /api/account/jwt/public-key/ 获取
+    - has_permission / check_permissions：先查进程内缓存，未命中时批量调用 /api/account/authorize/
+    """
+
+    def __init__(self, base_url, verifying_key=None, algorithm="RS256", user_id_claim="unified_uuid",
+                 token_type="access", service_token=None, cache_ttl=60, batch_window=0.005, max_batch=2000,
+                 redis_url=None, bus_channel="pineapple:cache-bus", timeout=3, pool_maxsize=20):
+        if algorithm.upper().startswith("HS"):
+            raise ValueError("不支持对称签名算法：持有 HS 密钥即可签发任意 Token，请使用账户中心的公钥验签")
+        self.base_url = base_url.rstrip("/")
+        self.verifying_key = verifying_key
+        self.algorithm = algorithm
+        self._key_lock = threading.Lock()
+        self.user_id_claim = user_id_claim
+        self.token_type = token_type
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if service_token:
+            self.session.headers["Authorization"] = f"Bearer {service_token}"
+
+        self.cache = PermissionCache(ttl=cache_ttl)
+        self._batcher = _Batcher(self._authorize_pairs, batch_window, max_batch)
+        self._subscriber = None
+        if redis_url:
+            self._subscriber = InvalidationSubscriber(self.cache, redis_url, bus_channel)
+            self._subscriber.start()
+
+    # ------------------------------------------------------------------------------------------------------------ JWT
+    def _get_verifying_key(self):
+        if self.verifying_key is None:
+            with self._key_lock:
+                if self.verifying_key is None:
+                    try:
+                        response = self.session.get(f"{self.base_url}/api/account/jwt/public-key/",
+                                                    timeout=self.timeout)
+                        response.raise_for_status()
+                        data = response.json()["data"]
+                    except (requests.RequestException, ValueError, KeyError) as e:
+                        raise PineappleError(f"获取验签公钥失败: {e}") from e
+                    if data["algorithm"] != self.algorithm:
+                        raise PineappleError(f"账户中心签名算法为 {data['algorithm']}，客户端配置为 {self.algorithm}")
+                    self.verifying_key = data["public_key"]
+        return self.verifying_key
+
+    def verify_token(self, token):
+        """返回 payload；签名、过期时间或 token 类型不合法时抛出 InvalidToken"""
+        key = self._get_verifying_key()
+        try:
+            claims = jwt.decode(token, key, algorithms=[self.algorithm], options={"require": ["exp"]})
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e)) from e
+        if claims.get("token_type", self.token_type) != self.token_type:
+            raise InvalidToken("token 类型错误")
+        if self.user_id_claim not in claims:
+            raise InvalidToken(f"缺少 {self.user_id_claim}")
+        return claims
+
+    def user_id(self, token):
+        return self.verify_token(token)[self.user_id_claim]
+
+    # ------------------------------------------------------------------------------------------------------------ 权限
+    def has_permission(self, unified_uuid, system_code, permission_code):
+        key = (unified_uuid, system_code, permission_code)
+        allowed = self.cache.get(key)
+        if allowed is not None:
+            return allowed
+        return self._batcher.submit(key).result(timeout=self.timeout * 2)
+
+    def check_permissions(self, unified_uuid, system_code, permission_codes, logic="OR"):
+        """多个权限码：缓存未命中的部分一次请求取回；返回 (是否通过, {权限码: bool})"""
+        decisions, missing = {}, []
+        for code in dict.fromkeys(permission_codes):
+            allowed = self.cache.get((unified_uuid, system_code, code))
+            if allowed is None:
+                missing.append(code)
+            else:
+                decisions[code] = allowed
+        if missing:
+            result = self._authorize_pairs(system_code, [(unified_uuid, code) for code in missing])
+            decisions.update({code: result[(unified_uuid, code)] for code in missing})
+        values = [decisions[code] for code in permission_codes]
+        return (all(values) if logic == "AND" else any(values)), decisions
+
+    def _authorize_pairs(self, system_code, pairs):
+        version = self.cache.generation  # 请求期间收到失效事件时不缓存本次结果
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/account/authorize/",
+                json={"system_code": system_code, "checks": [list(pair) for pair in pairs]},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise PineappleError(f"调用账户中心失败: {e}") from e
+        result = {}
+        for item in body["data"]["decisions"]:
+            key = (item["unified_uuid"], item["permission_code"])
+            result[key] = item["allowed"]
+            self.cache.set((item["unified_uuid"], system_code, item["permission_code"]), item["allowed"],
+                           version=version)
+        return result
+
+    def close(self):
+        if self._subscriber is not None:
+            self._subscriber.stop()
+        self.session.close()
@@ -0,0 +1,6 @@
+class PineappleError(Exception):
+    """调用账户中心失败"""
+
+
+class InvalidToken(PineappleError):
+    """JWT 校验失败"""
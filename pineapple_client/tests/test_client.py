@@ -0,0 +1,131 @@
+import time
+import unittest
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from pineapple_client import InvalidToken, PineappleClient, PineappleError
+from pineapple_client.cache import PermissionCache
+
+
+def _key_pair():
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public = private.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    return private, public
+
+
+PRIVATE_KEY, PUBLIC_KEY = _key_pair()
+
+
+def _token(key=PRIVATE_KEY, algorithm="RS256", **claims):
+    payload = {"unified_uuid": "u1", "token_type": "access", "exp": int(time.time()) + 60, **claims}
+    return jwt.encode(payload, key, algorithm=algorithm)
+
+
+def _response(data):
+    response = mock.Mock()
+    response.json.return_value = {"code": 200, "msg": "成功", "data": data}
+    response.raise_for_status.return_value = None
+    return response
+
+
+class VerifyTokenTests(unittest.TestCase):
+    def setUp(self):
+        self.client = PineappleClient("http://account.test", verifying_key=PUBLIC_KEY)
+        self.addCleanup(self.client.close)
+
+    def test_valid_token(self):
+        self.assertEqual(self.client.user_id(_token()), "u1")
+
+    def test_rejects_symmetric_algorithms(self):
+        with self.assertRaises(ValueError):
+            PineappleClient("http://account.test", verifying_key=PUBLIC_KEY, algorithm="HS256")
+
+    def test_rejects_hmac_signed_token(self):
+        forged = jwt.encode({"unified_uuid": "admin", "exp": int(time.time()) + 60}, "x" * 32, algorithm="HS256")
+        with self.assertRaises(InvalidToken):
+            self.client.verify_token(forged)
+
+    def test_rejects_other_key_expired_and_wrong_type(self):
+        other, _ = _key_pair()
+        for token in (_token(key=other), _token(exp=int(time.time()) - 1), _token(token_type="refresh")):
+            with self.assertRaises(InvalidToken):
+                self.client.verify_token(token)
+
+    def test_fetches_public_key_once(self):
+        client = PineappleClient("http://account.test")
+        self.addCleanup(client.close)
+        with mock.patch.object(client.session, "get",
+                               return_value=_response({"algorithm": "RS256", "public_key": PUBLIC_KEY})) as get:
+            self.assertEqual(client.user_id(_token()), "u1")
+            self.assertEqual(client.user_id(_token()), "u1")
+        get.assert_called_once()
+        self.assertTrue(get.call_args.args[0].endswith("/api/account/jwt/public-key/"))
+
+    def test_algorithm_mismatch(self):
+        client = PineappleClient("http://account.test")
+        self.addCleanup(client.close)
+        with mock.patch.object(client.session, "get",
+                               return_value=_response({"algorithm": "ES256", "public_key": PUBLIC_KEY})):
+            with self.assertRaises(PineappleError):
+                client.verify_token(_token())
+
+
+class PermissionCacheTests(unittest.TestCase):
+    def test_set_discarded_after_eviction_during_request(self):
+        cache = PermissionCache()
+        version = cache.generation
+        cache.evict_users(["u1"])  # 请求在途时收到失效事件
+        cache.set(("u1", "shop", "product.view"), True, version=version)
+        self.assertIsNone(cache.get(("u1", "shop", "product.view")))
+
+    def test_ttl_and_evict_users(self):
+        cache = PermissionCache(ttl=0.01)
+        cache.set(("u1", "shop", "a"), True)
+        cache.set(("u2", "shop", "a"), False)
+        cache.evict_users(["u1"])
+        self.assertIsNone(cache.get(("u1", "shop", "a")))
+        self.assertIs(cache.get(("u2", "shop", "a")), False)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(("u2", "shop", "a")))
+
+
+class AuthorizeTests(unittest.TestCase):
+    def setUp(self):
+        self.client = PineappleClient("http://account.test", verifying_key=PUBLIC_KEY, batch_window=0.01)
+        self.addCleanup(self.client.close)
+
+    def decisions(self, *items):
+        return _response({"decisions": [
+            {"unified_uuid": uid, "permission_code": code, "allowed": allowed} for uid, code, allowed in items]})
+
+    def test_results_are_cached(self):
+        with mock.patch.object(self.client.session, "post",
+                               return_value=self.decisions(("u1", "a", True), ("u1", "b", False))) as post:
+            self.assertEqual(self.client.check_permissions("u1", "shop", ["a", "b"], "AND"),
+                             (False, {"a": True, "b": False}))
+            self.assertTrue(self.client.has_permission("u1", "shop", "a"))
+        post.assert_called_once()
+
+    def test_eviction_during_request_is_not_overwritten(self):
+        def post(*args, **kwargs):
+            self.client.cache.evict_users(["u1"])
+            return self.decisions(("u1", "a", True))
+
+        with mock.patch.object(self.client.session, "post", side_effect=post):
+            self.assertTrue(self.client.has_permission("u1", "shop", "a"))
+        self.assertIsNone(self.client.cache.get(("u1", "shop", "a")))
+
+    def test_http_error(self):
+        import requests
+
+        with mock.patch.object(self.client.session, "post", side_effect=requests.ConnectionError("down")):
+            with self.assertRaises(PineappleError):
+                self.client.check_permissions("u1", "shop", ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()